@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Time writing BED files: ``str`` per record vs ``IntervalSet.save``.
+
+   Usage: bench_bedwrite.py [records]   (default 1000000)
+
+   Writes the same random, named, six-column intervals as a list of
+   ``Bed`` objects (one ``write`` per line, and ``save`` of a ``BedFile``)
+   and from a ``ColumnarIntervalSet``, plain and BGZF-compressed.
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+import shutil
+
+from bode.io.bed import BedFile
+from bode.io.columnar import ColumnarIntervalSet
+from bode.seq.bed import Bed
+
+################################################################################
+
+def perLine(fn,beds):
+  fd = open(fn,"w")
+  for b in beds:
+    fd.write(str(b) + "\n")
+  fd.close()
+
+def timeit(label,fn,n):
+  start = time.time()
+  fn()
+  elapsed = time.time() - start
+  sys.stdout.write("%-28s %8.2f s %12.0f records/s\n" % (label,elapsed,n/elapsed))
+
+################################################################################
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+rng = random.Random(1)
+beds = [Bed("chr%d" % (rng.randint(1,22),),i * 100,i * 100 + rng.randint(1,5000),name="peak%d" % (i,),
+            score=rng.randint(0,1000),strand=rng.choice("+-")) for i in range(0,n)]
+objects = BedFile()
+for b in beds:
+  objects.append(b)
+columns = ColumnarIntervalSet.fromIntervals(beds)
+tmpdir = tempfile.mkdtemp()
+try:
+  out = os.path.join(tmpdir,"out.bed")
+  sys.stdout.write("%d records\n" % (n,))
+  timeit("str per line",lambda:perLine(out,beds),n)
+  timeit("BedFile.save",lambda:objects.save(out),n)
+  timeit("columnar save",lambda:columns.save(out),n)
+  timeit("BedFile.save (bgzf)",lambda:objects.save(out + ".gz"),n)
+  timeit("columnar save (bgzf)",lambda:columns.save(out + ".gz"),n)
+finally:
+  shutil.rmtree(tmpdir)
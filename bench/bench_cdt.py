@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Time loading and drawing a CDT heatmap: nested lists vs ``bode.io.cdt``.
+
+   Usage: bench_cdt.py [rows] [columns]   (default 50000, 400)
+
+   "python lists" parses the file into lists of floats and works out each
+   cell's colour in a loop, as the old ``gd``-based ``cdt2map`` did (without
+   drawing, since ``gd`` is rarely installed).
+"""
+
+import os
+import sys
+import math
+import time
+import shutil
+import tempfile
+
+import numpy
+
+from bode.io.cdt import CdtMatrix
+
+################################################################################
+
+def loadLists(fn):
+  fd = open(fn)
+  fd.readline()
+  rows = []
+  for line in fd:
+    rows.append(map(float,line.split()[3:]))
+  fd.close()
+  return rows
+
+def colourLists(rows):
+  colours = []
+  for row in rows:
+    out = []
+    for v in row:
+      score = int(v if v <= 255 else 255)
+      if score > 0:
+        score = int(math.log(score,2) * 31)
+      out.append(score)
+    colours.append(out)
+  return colours
+
+def timeit(label,fn):
+  start = time.time()
+  result = fn()
+  elapsed = time.time() - start
+  sys.stdout.write("%-24s %8.2f s\n" % (label,elapsed))
+  return elapsed,result
+
+################################################################################
+
+nrows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+ncols = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+tmpdir = tempfile.mkdtemp()
+fn = os.path.join(tmpdir,"a.cdt")
+values = numpy.round(numpy.random.RandomState(42).exponential(20,(nrows,ncols)),2)
+CdtMatrix(values).save(fn)
+sys.stdout.write("%d x %d matrix\n" % (nrows,ncols))
+old = timeit("python lists",lambda:colourLists(loadLists(fn)))[0]
+load,matrix = timeit("load",lambda:CdtMatrix().load(fn))
+draw = timeit("colours + png",lambda:matrix.writePng(os.path.join(tmpdir,"a.png")))[0]
+shutil.rmtree(tmpdir)
+sys.stdout.write("speedup: %.1fx (without drawing the old way)\n" % (old/(load+draw),))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""Time k-mer counting: a Python loop vs ``bode.seq.kmer``.
+
+   Usage: bench_kmer.py [megabases] [k] [processes]   (default 10, 6, 4)
+
+   The sequences are 500 bp "peaks"; "python loop" slices each k-mer out
+   of ``Sequence.seq`` and counts it in a dict, as ad hoc scripts do.
+"""
+
+import sys
+import time
+import random
+import collections
+
+from bode.seq import Sequence
+from bode.seq.kmer import countKmers
+
+################################################################################
+
+def loopCount(seqs,k):
+  counts = collections.defaultdict(int)
+  for seq in seqs:
+    s = seq.seq
+    for i in range(0,len(s)-k+1):
+      kmer = s[i:i+k]
+      if "N" not in kmer:
+        counts[kmer] += 1
+  return counts
+
+def makeSeqs(n):
+  rng = random.Random(42)
+  chunk = "".join(rng.choice("ACGTACGTACGTACGTN") for i in range(0,1 << 16))
+  text = (chunk * (n // len(chunk) + 1))[:n]
+  return [Sequence(text[i:i+500]) for i in range(0,n,500)]
+
+def timeit(label,fn,n):
+  start = time.time()
+  fn()
+  elapsed = time.time() - start
+  sys.stdout.write("%-24s %8.2f s %10.1f MB/s\n" % (label,elapsed,n/elapsed/1e6))
+  return elapsed
+
+################################################################################
+
+n = int(float(sys.argv[1]) * 1000000) if len(sys.argv) > 1 else 10000000
+k = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+processes = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+seqs = makeSeqs(n)
+sys.stdout.write("counting %d-mers in %d bp\n" % (k,n))
+sample = seqs[:len(seqs)//10]
+old = timeit("python loop (10%)",lambda:loopCount(sample,k),n//10) * 10
+new = timeit("1 process",lambda:countKmers(seqs,k,processes=1),n)
+timeit("canonical",lambda:countKmers(seqs,k,canonical=True,processes=1),n)
+par = timeit("%d processes" % (processes,),lambda:countKmers(seqs,k,processes=processes),n)
+sys.stdout.write("speedup: %.1fx (1 process), %.1fx (%d processes)\n" % (old/new,old/par,processes))
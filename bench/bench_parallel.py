@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""Scaling of parallel BED loading with the number of processes.
+
+   Usage: bench_parallel.py [nlines] [maxprocs]   (default 5,000,000, #CPUs)
+
+   Writes a random BED file to a temporary directory, then loads it with
+   ``parallelLoad`` using 1, 2, 4, ... processes.
+"""
+
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import multiprocessing
+
+from bode.io.parallel import parallelLoad
+
+################################################################################
+
+def writeBed(fn,n):
+  rng = random.Random(1)
+  fd = open(fn,"w")
+  for i in range(0,n):
+    left = rng.randint(0,200000000)
+    fd.write("chr%d\t%d\t%d\tread%d\t%d\t%s\n" % (rng.randint(1,22),left,left+50,i,rng.randint(0,1000),rng.choice("+-")))
+  fd.close()
+
+################################################################################
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+maxProcs = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+tmpdir = tempfile.mkdtemp()
+try:
+  fn = os.path.join(tmpdir,"bench.bed")
+  writeBed(fn,n)
+  mb = os.path.getsize(fn) / 1048576.0
+  sys.stdout.write("%d lines, %.1f MB\n" % (n,mb))
+  procs = 1
+  base = None
+  while procs <= maxProcs:
+    start = time.time()
+    parallelLoad(fn,processes=procs)
+    elapsed = time.time() - start
+    base = base or elapsed
+    sys.stdout.write("%3d processes %8.2f s %8.1f MB/s  speedup %.1fx\n" % (procs,elapsed,mb/elapsed,base/elapsed))
+    procs *= 2
+finally:
+  shutil.rmtree(tmpdir)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""Time building a coverage track: a per-base Python loop vs ``bode.io.pileup``.
+
+   Usage: bench_pileup.py [million reads]   (default 10)
+
+   The reads are 50 bp, spread over a 200 Mb chromosome; "python loop"
+   increments a per-base array for each read, as ad hoc scripts do.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy
+
+from bode.io.columnar import ColumnarIntervalSet
+from bode.io.pileup import Pileup, CoverageTrack
+from bode.seq import Interval
+
+################################################################################
+
+def loopPileup(ivs,size):
+  cover = numpy.zeros(size,dtype=numpy.int32)
+  for iv in ivs:
+    cover[iv.left:iv.right] += 1
+  return cover
+
+def timeit(label,fn,n):
+  start = time.time()
+  result = fn()
+  elapsed = time.time() - start
+  sys.stdout.write("%-24s %8.2f s %12.0f reads/s\n" % (label,elapsed,n/elapsed))
+  return elapsed,result
+
+################################################################################
+
+n = int(float(sys.argv[1]) * 1000000) if len(sys.argv) > 1 else 10000000
+size = 200000000
+lefts = numpy.sort(numpy.random.RandomState(42).randint(0,size-50,n)).astype(numpy.int64)
+ivs = [Interval("chr1",int(l),int(l)+50) for l in lefts[:n//10]]
+columns = ColumnarIntervalSet()
+sys.stdout.write("%d reads\n" % (n,))
+old = timeit("python loop (10%)",lambda:loopPileup(ivs,size),n//10)[0] * 10
+timeit("intervals (10%)",lambda:Pileup().add(ivs),n//10)
+columns._setColumns(["chr1"],numpy.zeros(n,dtype=numpy.int32),lefts,lefts+50,
+                    numpy.zeros(n,dtype=numpy.int8),numpy.zeros(n,dtype=numpy.int64),None)
+new,pile = timeit("columnar",lambda:Pileup({"chr1":size}).add(columns),n)
+tmpdir = tempfile.mkdtemp()
+fn = os.path.join(tmpdir,"reads.bcov")
+timeit("save",lambda:pile.save(fn),n)
+sys.stdout.write("file size: %.1f MB\n" % (os.path.getsize(fn)/1e6,))
+track = CoverageTrack(fn)
+timeit("summary (1000 bins)",lambda:track.summary("chr1",0,size,1000),n)
+track.close()
+os.remove(fn)
+os.rmdir(tmpdir)
+sys.stdout.write("speedup: %.1fx\n" % (old/new,))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""Time writing xgrep output: a write per cell vs ``report.ReportWriter``.
+
+   Usage: bench_report.py [rows]   (default 1000000)
+
+   Run with ``bode/util`` on the path.  Each row has a text, two number,
+   a date and an empty cell; the output goes to a temporary file.
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import xlrd
+from xlrd.sheet import Cell
+
+import report
+
+################################################################################
+
+def perCell(fd,rows,datemode):
+  for index,row in enumerate(rows):
+    fd.write("%d" % (index,))
+    for c in row:
+      if c.ctype == xlrd.XL_CELL_EMPTY:
+        fd.write("\t")
+      if c.ctype == xlrd.XL_CELL_TEXT:
+        fd.write("\t%s" % (c.value,))
+      elif c.ctype == xlrd.XL_CELL_NUMBER:
+        fd.write("\t%f" % (c.value,))
+      elif c.ctype == xlrd.XL_CELL_DATE:
+        t = xlrd.xldate_as_tuple(c.value,datemode)
+        fd.write("\t%d-%d-%d@%d:%d" % (t[0],t[1],t[2],t[3],t[4]))
+    fd.write("\n")
+
+def buffered(fd,rows,datemode,format):
+  out = report.ReportWriter(fd,format)
+  for index,row in enumerate(rows):
+    texts = report.rowTexts(row,datemode)
+    texts.insert(0,"%d" % (index,))
+    out.writeRow(texts)
+  out.close()
+
+def timeit(label,fn,n):
+  start = time.time()
+  fn()
+  elapsed = time.time() - start
+  sys.stdout.write("%-24s %8.2f s %12.0f rows/s\n" % (label,elapsed,n/elapsed))
+  return elapsed
+
+################################################################################
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+rows = [[Cell(xlrd.XL_CELL_TEXT,u"sample%d" % (i % 1000,)),Cell(xlrd.XL_CELL_NUMBER,i * 0.5),
+         Cell(xlrd.XL_CELL_NUMBER,float(i)),Cell(xlrd.XL_CELL_DATE,43000.0 + i % 365),
+         Cell(xlrd.XL_CELL_EMPTY,"")] for i in range(0,n)]
+fn = tempfile.mktemp()
+sys.stdout.write("%d rows\n" % (n,))
+for label,fn2 in (("write per cell",lambda fd:perCell(fd,rows,0)),
+                  ("ReportWriter tsv",lambda fd:buffered(fd,rows,0,"tsv")),
+                  ("ReportWriter json",lambda fd:buffered(fd,rows,0,"json"))):
+  fd = open(fn,"w")
+  timeit(label,lambda:fn2(fd),n)
+  fd.close()
+os.remove(fn)
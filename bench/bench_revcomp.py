@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""Time reverse complement and translation: Python loops vs tables.
+
+   Usage: bench_revcomp.py [nseqs]   (default 100,000 sequences of 300 bp)
+
+   The "python loop" paths complement base by base through a dict and
+   translate codon by codon through a dict, as ad hoc scripts do; the
+   others use ``Sequence.reverseComplement``/``translate`` one sequence at
+   a time, and ``reverseComplementAll``/``translateAll`` on the whole list.
+"""
+
+import sys
+import time
+import random
+
+from bode.seq import Sequence, geneticCode, reverseComplementAll, translateAll
+
+################################################################################
+
+complement = {"A":"T","C":"G","G":"C","T":"A","N":"N"}
+codons = dict((a+b+c,geneticCode[16*i+4*j+k]) for i,a in enumerate("TCAG")
+              for j,b in enumerate("TCAG") for k,c in enumerate("TCAG"))
+
+def loopRevcomp(seqs):
+  return ["".join(complement[c] for c in reversed(s.seq)) for s in seqs]
+
+def loopTranslate(seqs):
+  return ["".join(codons.get(s.seq[i:i+3],"X") for i in range(0,len(s.seq)-2,3)) for s in seqs]
+
+def timeit(label,fn,nbases):
+  start = time.time()
+  fn()
+  elapsed = time.time() - start
+  sys.stdout.write("%-26s %8.3f s %10.1f MB/s\n" % (label,elapsed,nbases/elapsed/1e6))
+  return elapsed
+
+################################################################################
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+rng = random.Random(42)
+chunk = "".join(rng.choice("ACGTACGTACGTN") for i in range(0,1 << 16))
+seqs = [Sequence(chunk[i:i+300]) for i in (rng.randint(0,len(chunk)-300) for j in range(0,n))]
+nbases = 300 * n
+timeit("revcomp python loop",lambda:loopRevcomp(seqs),nbases)
+timeit("reverseComplement()",lambda:[s.reverseComplement() for s in seqs],nbases)
+timeit("reverseComplementAll",lambda:reverseComplementAll(seqs),nbases)
+timeit("translate python loop",lambda:loopTranslate(seqs),nbases)
+timeit("translate()",lambda:[s.translate() for s in seqs],nbases)
+timeit("translateAll",lambda:translateAll(seqs),nbases)
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""Time sequence-type detection, character loop vs ``translate``.
+
+   Usage: bench_seqtype.py [megabases]   (default 20)
+
+   The "char loop" path reproduces the original ``Sequence._guessType``,
+   which tested each character for membership of the DNA, RNA and protein
+   alphabets in turn; "translate" constructs ``Sequence`` objects with the
+   table-driven classifier.
+"""
+
+import sys
+import time
+import random
+
+from bode.seq import Sequence, SeqType
+
+################################################################################
+
+def allInSet(s1,s2):
+  for i in range(0,len(s1)):
+    if s1[i] not in s2:
+      return False
+  return True
+
+def loopGuess(seq):
+  if allInSet(seq,Sequence.legalDNA):
+    return SeqType.DNA
+  elif allInSet(seq,Sequence.legalRNA):
+    return SeqType.RNA
+  elif allInSet(seq,Sequence.legalPROTEIN):
+    return SeqType.PROTEIN
+  return SeqType.UNKNOWN
+
+def makeSeq(alphabet,n):
+  rng = random.Random(42)
+  chunk = "".join(rng.choice(alphabet) for i in range(0,1 << 16))
+  return (chunk * (n // len(chunk) + 1))[:n]
+
+def timeit(label,fn,n):
+  start = time.time()
+  fn()
+  elapsed = time.time() - start
+  sys.stdout.write("%-24s %8.3f s %10.1f MB/s\n" % (label,elapsed,n/elapsed/1e6))
+  return elapsed
+
+################################################################################
+
+n = int(float(sys.argv[1]) * 1000000) if len(sys.argv) > 1 else 20000000
+for label,alphabet in (("DNA","ACGTN"),("RNA","ACGUN"),("protein",Sequence.legalPROTEIN)):
+  seq = makeSeq(alphabet,n)
+  old = timeit("%s char loop" % (label,),lambda:loopGuess(seq),n)
+  new = timeit("%s translate" % (label,),lambda:Sequence(seq).seqType,n)
+  sys.stdout.write("speedup: %.1fx\n" % (old/new,))
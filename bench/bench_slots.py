@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""Memory footprint and construction rate of Interval, Bed and HomerPeak.
+
+   Usage: bench_slots.py [nrecords]   (default 10,000,000)
+
+   Each class is measured in a separate process, so that the peak resident
+   set size reflects only the records built for that class.  For comparison,
+   the same fields are also stored in a plain per-instance dictionary, which
+   is how these classes were laid out before they used ``__slots__``.
+"""
+
+import sys
+import time
+import resource
+import multiprocessing
+
+from bode.seq import Interval
+from bode.seq.bed import Bed
+from bode.seq.homerPeak import HomerPeak
+
+################################################################################
+
+class DictLayout(object):
+  """Holds the same fields as a record, in a per-instance ``__dict__``."""
+  pass
+
+def makeInterval(i):
+  return Interval("chr1",i,i+100,strand="+",name="int%d" % (i,))
+
+def makeBed(i):
+  return Bed("chr1",i,i+100,name="bed%d" % (i,),score=500,strand="+")
+
+def makeHomerPeak(i):
+  return HomerPeak("chr1",i,i+200,"peak%d" % (i,),"+",55.0,0.8,55.0,60.0,
+                   5.0,11.2,1.5e-10,4.3,2.0e-8,1.0)
+
+def asDict(obj):
+  d = DictLayout()
+  d.__dict__.update(obj.__getstate__())
+  return d
+
+def objectBytes(obj):
+  size = sys.getsizeof(obj)
+  if hasattr(obj,"__dict__"):
+    size += sys.getsizeof(obj.__dict__)
+  return size
+
+def measure(make,n,dictLayout,results):
+  rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  records = [None] * n
+  start = time.time()
+  if dictLayout:
+    for i in range(0,n):
+      records[i] = asDict(make(i))
+  else:
+    for i in range(0,n):
+      records[i] = make(i)
+  elapsed = time.time() - start
+  rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  results.put((objectBytes(records[-1]),(rss1-rss0)*1024.0/n,n/elapsed))
+
+def run(name,make,n,dictLayout):
+  results = multiprocessing.Queue()
+  p = multiprocessing.Process(target=measure,args=(make,n,dictLayout,results))
+  p.start()
+  objBytes,rssBytes,rate = results.get()
+  p.join()
+  if dictLayout:
+    # the dict layout is built by copying records, so its rate is meaningless
+    sys.stdout.write("%-10s %-6s %12d %14.1f %16s\n" % (name,"dict",objBytes,rssBytes,"-"))
+  else:
+    sys.stdout.write("%-10s %-6s %12d %14.1f %16.0f\n" % (name,"slots",objBytes,rssBytes,rate))
+
+################################################################################
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+sys.stdout.write("%d records per class\n" % (n,))
+sys.stdout.write("%-10s %-6s %12s %14s %16s\n" % ("class","layout","object bytes","RSS bytes/rec","records/s"))
+for name,make in (("Interval",makeInterval),("Bed",makeBed),("HomerPeak",makeHomerPeak)):
+  run(name,make,n,True)
+  run(name,make,n,False)
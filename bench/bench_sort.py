@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Time sorting intervals with regex-based comparison vs cached sort keys.
+
+   Usage: bench_sort.py [nintervals]   (default 1,000,000)
+
+   The "regex cmp" path reproduces the original ``Interval.__cmp__``, which
+   matched both chromosome names against a regular expression on every
+   comparison; "sortKey" sorts with ``key=Interval.sortKey``, and "columnar"
+   sorts a ``ColumnarIntervalSet`` with ``numpy.lexsort``.
+"""
+
+import re
+import sys
+import time
+import random
+import functools
+
+from bode.seq import Interval
+from bode.io.columnar import ColumnarIntervalSet
+
+################################################################################
+
+chromPat = re.compile("^chr(\d+)(_\w+)?$")
+
+def regexChromComp(c1,c2):
+  mo1 = chromPat.match(c1)
+  mo2 = chromPat.match(c2)
+  if mo1 and mo2:
+    i1 = int(mo1.group(1))
+    i2 = int(mo2.group(1))
+    if i1 == i2:
+      t1 = mo1.group(2) or ""
+      t2 = mo2.group(2) or ""
+      return (t1 > t2) - (t1 < t2)
+    return (i1 > i2) - (i1 < i2)
+  elif mo1:
+    return -1
+  elif mo2:
+    return 1
+  return (c1 > c2) - (c1 < c2)
+
+def regexCmp(a,b):
+  cc = regexChromComp(a.chrom,b.chrom)
+  if cc != 0:
+    return cc
+  ka = (a.left,a.right,a.strand)
+  kb = (b.left,b.right,b.strand)
+  return (ka > kb) - (ka < kb)
+
+def makeIntervals(n):
+  rng = random.Random(42)
+  chroms = ["chr%d" % (i,) for i in range(1,23)] + ["chrX","chrY","chrM","chr1_random"]
+  ivs = []
+  for i in range(0,n):
+    left = rng.randint(0,200000000)
+    ivs.append(Interval(rng.choice(chroms),left,left+rng.randint(1,1000)))
+  return ivs
+
+def timeit(label,fn,n):
+  start = time.time()
+  fn()
+  elapsed = time.time() - start
+  sys.stdout.write("%-12s %8.2f s %12.0f intervals/s\n" % (label,elapsed,n/elapsed))
+  return elapsed
+
+################################################################################
+
+n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+ivs = makeIntervals(n)
+cs = ColumnarIntervalSet.fromIntervals(ivs)
+sys.stdout.write("sorting %d intervals\n" % (n,))
+old = timeit("regex cmp",lambda:sorted(ivs,key=functools.cmp_to_key(regexCmp)),n)
+new = timeit("sortKey",lambda:sorted(ivs,key=Interval.sortKey),n)
+col = timeit("columnar",cs.sort,n)
+sys.stdout.write("speedup: sortKey %.1fx, columnar %.1fx\n" % (old/new,old/col))
@@ -2,6 +2,7 @@
    to files.
 """
 import errno
+import gzip
 
 ################################################################################
 
@@ -9,60 +10,382 @@ class NoFileHandleError(IOError):
   """Error raised if trying to read from a file when no file handle exists."""
   def __init__(self):
     text = "No file descriptor to read from."
-    super(NoFileHandleError,self).__init__(self,errno.ENOENT,text)
+    super(NoFileHandleError,self).__init__(errno.ENOENT,text)
 
 class FileFormatError(IOError):
   """Exception indicating unexpected format in file."""
   def __init__(self,fn,line=None,msg=None):
     lmsg = ": line %d" % line if line != None else ""
-    rmsg =  ": '%s'" if msg != None else ""
-    text = "Syntax error: %s%s%s" % (fn,line,msg)
-    super(NoFileHandleError,self).__init__(self,errno.EUCLEAN,text)
+    rmsg =  ": '%s'" % (msg,) if msg != None else ""
+    text = "Syntax error: %s%s%s" % (fn,lmsg,rmsg)
+    super(FileFormatError,self).__init__(errno.EUCLEAN,text)
+    self.fn = fn
+    self.line = line
+    self.msg = msg
+
+  def __reduce__(self):
+    return (FileFormatError,(self.fn,self.line,self.msg))
+
+################################################################################
+
+def openInput(fn):
+  """Open a file for reading, decompressing it if necessary.
+
+     BGZF files are opened with ``bode.io.bgzf.BgzfReader`` (which supports
+     random access via a tabix index), other gzip files with ``gzip``, and
+     anything else as plain text.
+  """
+  from bode.io import bgzf
+  if bgzf.isBgzf(fn):
+    return bgzf.BgzfReader(fn)
+  elif bgzf.isGzip(fn):
+    return gzip.open(fn,"rb")
+  return open(fn,"r")
+
+compressedSuffixes = (".gz",".bgz")
+"""File name endings for which ``openOutput`` compresses by default."""
+
+def openOutput(fn,compress=None,level=6):
+  """Open a file for writing, compressing it if required.
+
+     Compressed files are written in BGZF format (which ``gzip`` can read,
+     and ``bode.io.tabix`` can index), compressed in a background thread
+     (see ``bode.io.threaded``).
+
+     :param compress: ``True`` to compress, ``False`` not to, or ``None``
+                      (default) to compress if ``fn`` ends in ``.gz`` or
+                      ``.bgz``.
+     :param level: The zlib compression level.
+  """
+  if compress == None:
+    compress = fn.endswith(compressedSuffixes)
+  if not compress:
+    return open(fn,"w")
+  from bode.io import bgzf
+  from bode.io.threaded import ThreadedWriter
+  return ThreadedWriter(bgzf.BgzfWriter(fn,level=level))
 
 ################################################################################
 
 class IntervalSet(object):
+  """Base class for sets of intervals, usually backed by a file.
+
+     Records are read from the file on demand, as the set is iterated.  If
+     the set was created with ``keep=True`` (the default), every record read
+     is also retained, so the set can be iterated repeatedly and indexed
+     like a list.  With ``keep=False`` records are handed out and then
+     forgotten, so arbitrarily large files can be processed in constant
+     memory::
+
+       for bed in BedFile(keep=False).load("reads.bed"):
+         ...
+
+     Subclasses implement ``read()`` to parse a single record from ``_fd``.
+  """
 
   def __init__(self,keep=True):
-    """Initialize a new IntervalSet."""
+    """Initialize a new IntervalSet.
+
+       :param keep: Retain records as they are read, allowing random access.
+       :type keep: bool
+    """
     self._fn = None
     self._header = list()
     self._fd = None
+    self._keep = keep
     self._intervals = list()
     self._current = 0
     self._count = 0
-    self._lineNum = -1
+    self._lineNum = 0
+    self._index = None
+    self._tabix = None
 
   def __iter__(self):
-    """Returns iterator over elements of the set."""
-    self._current = 0
-    return self
+    """Returns a generator over the elements of the set.
+
+       Elements already retained are yielded first; the rest are read lazily
+       from the underlying file, if any.
+    """
+    i = 0
+    while True:
+      if i < len(self._intervals):
+        rv = self._intervals[i]
+        i += 1
+      else:
+        rv = self._readNext()
+        if rv == None:
+          return
+        if self._keep:
+          i += 1
+      yield rv
+
+  def __len__(self):
+    """The number of elements retained by the set.
+
+       If the set is still being read from a file, this counts only the
+       records read so far.
+    """
+    return len(self._intervals)
+
+  def __getitem__(self,index):
+    """Random access to retained elements, reading ahead as necessary."""
+    if not self._keep:
+      raise IndexError("Random access requires keep=True.")
+    if isinstance(index,slice) or index < 0:
+      self._readAll()
+    else:
+      while index >= len(self._intervals) and self._fd != None:
+        self._readNext()
+    return self._intervals[index]
+
+  def _readNext(self):
+    """Read the next record from the file, retaining it if required.
+
+       Returns ``None`` (and closes the file) at end of file.
+    """
+    if self._fd == None:
+      return None
+    rv = self.read()
+    if rv == None:
+      self.close()
+    else:
+      self._count += 1
+      if self._keep:
+        self._intervals.append(rv)
+    return rv
+
+  def _readAll(self):
+    while self._readNext() != None:
+      pass
 
   def read(self):
-    """Read one object from _fd and append it to _intervals."""
+    """Read one object from _fd and return it (or ``None`` at end of file)."""
     raise NotImplementedError
 
   def next(self):
-    """Return next element of the interval set."""
-    count = 3
+    """Return next element of the interval set.
+
+       This is a cursor over the set, independent of any iterators returned
+       by ``iter()``.  Raises ``StopIteration`` when the set is exhausted.
+    """
     if self._current < len(self._intervals):
       rv = self._intervals[self._current]
+    else:
+      rv = self._readNext()
+      if rv == None:
+        raise StopIteration
+    if self._keep:
       self._current += 1
-    elif self._current == self._count:
-      if self._fd != None and not self._fd.eof():
-        pass
-      return 
-    
+    return rv
+  __next__ = next
+
+  def rewind(self):
+    """Reset the ``next()`` cursor to the start of the retained elements."""
+    self._current = 0
+
   def load(self,fn,lazy=True,fd=None):
-    """Loads intervals from the given file (or file descriptor)."""
+    """Loads intervals from the given file (or file descriptor).
+
+       Compressed (gzip or BGZF) files are decompressed transparently.
+
+       :param fn: The name of the file.
+       :type fn: str
+       :param lazy: If ``True``, records are read as the set is iterated;
+                    otherwise the whole file is read immediately.
+       :type lazy: bool
+       :param fd: An open file to read from instead of opening ``fn``.
+       :rtype: IntervalSet (``self``)
+    """
+    self._fn = fn
+    self._fd = fd if fd != None else openInput(fn)
+    self._tabix = None
+    self._lineNum = 0
+    self._count = 0
+    self._current = 0
+    self._intervals = list()
+    self._header = list()
+    self._index = None
+    self.readHeader()
+    if not lazy:
+      self._keep = True
+      self._readAll()
+    return self
+
+  def readHeader(self):
+    """Read any header lines from the start of ``_fd`` (default: none)."""
+    pass
+
+  def parseLine(self,line):
+    """Construct an element of the set from one line of a file."""
     raise NotImplementedError
 
+  def fetch(self,chrom,left,right):
+    """Returns a generator of the records of the file overlapping a region.
+
+       The file must be BGZF-compressed and have a tabix index (``.tbi``,
+       see ``bode.io.tabix``), so that only the blocks holding the region
+       need to be read and decompressed.  The set itself is not modified.
+
+       :param chrom: The chromosome name.
+       :param left: The left end of the region (counting from 0).
+       :param right: One past the right end of the region.
+    """
+    for line in self._fetchLines(chrom,left,right):
+      yield self.parseLine(line)
+
+  def _fetchLines(self,chrom,left,right):
+    """Generate the lines of the file overlapping a region (see ``fetch``),
+       loading the tabix index on first use."""
+    from bode.io import bgzf, tabix
+    if self._tabix == None:
+      if self._fn == None or not bgzf.isBgzf(self._fn):
+        raise ValueError("fetch requires a BGZF-compressed file")
+      self._tabix = tabix.TabixIndex().load(self._fn + ".tbi")
+    reader = bgzf.BgzfReader(self._fn)
+    try:
+      for line in self._tabix.fetch(reader,chrom,left,right):
+        yield line
+    finally:
+      reader.close()
+
+  def close(self):
+    """Close the underlying file, if any."""
+    if self._fd != None:
+      self._fd.close()
+      self._fd = None
+
   def append(self,interval):
     """Append an interval to the set."""
-    raise NotImplementedError
+    self._intervals.append(interval)
+    self._index = None
 
-  def save(self,fn):
-    raise NotImplementedError
+  def sort(self):
+    """Sort the elements of the set into genomic order.
+
+       The rest of the file is read first, so the set must retain its
+       records (``keep=True``).
+    """
+    if not self._keep:
+      raise ValueError("Sorting requires keep=True.")
+    self._readAll()
+    self._intervals.sort(key=lambda iv:iv.sortKey())
+    self._current = 0
+    self._index = None
+
+  def externalSort(self,maxMemory=None,tmpdir=None):
+    """Returns a generator of the elements of the set in sorted order.
+
+       Unlike ``sort``, this works for sets too large to fit in memory:
+       sorted runs are spilled to temporary files and merged back (see
+       ``bode.io.extsort``).  The set itself is not modified.
+
+       :param maxMemory: Approximate memory budget, in bytes.
+       :param tmpdir: Directory for temporary files.
+    """
+    from bode.io import extsort
+    if maxMemory == None:
+      maxMemory = extsort.defaultMemory
+    return extsort.externalSort(self,maxMemory=maxMemory,tmpdir=tmpdir)
+
+  def index(self):
+    """Returns an overlap index of the set, building it if necessary.
+
+       Building the index reads the rest of the file; with ``keep=False``
+       the records are then held only by the index.
+
+       :rtype: bode.io.overlap.IntervalIndex
+    """
+    if self._index == None:
+      from bode.io.overlap import IntervalIndex
+      self._index = IntervalIndex(iter(self))
+    return self._index
+
+  def overlapping(self,chrom,left,right=None):
+    """Returns a list of the elements overlapping a region or position.
+
+       :param chrom: The chromosome name.
+       :param left: The left end of the region (counting from 0).
+       :param right: One past the right end of the region (default
+                     ``left+1``, i.e. a point query).
+       :rtype: list
+    """
+    return self.index().overlapping(chrom,left,right)
+
+  def intersect(self,other,sameStrand=False):
+    """The overlapping parts of elements of this set and ``other``.
+
+       This and the other set operations below (``merge``, ``subtract``,
+       ``closest`` and ``coverage``) are single sweeps over sorted inputs;
+       see ``bode.io.sweep`` for details.  They return generators, so they
+       can be applied to sets read with ``keep=False``.
+    """
+    from bode.io import sweep
+    return sweep.intersect(self,other,sameStrand)
+
+  def merge(self,distance=0,sameStrand=False):
+    """Merge overlapping or nearby elements of the (sorted) set."""
+    from bode.io import sweep
+    return sweep.merge(self,distance,sameStrand)
+
+  def subtract(self,other,sameStrand=False):
+    """The parts of elements of this set not covered by ``other``."""
+    from bode.io import sweep
+    return sweep.subtract(self,other,sameStrand)
+
+  def closest(self,other,sameStrand=False):
+    """The closest element of ``other`` to each element of this set."""
+    from bode.io import sweep
+    return sweep.closest(self,other,sameStrand)
+
+  def coverage(self,other,sameStrand=False):
+    """The coverage of each element of this set by ``other``."""
+    from bode.io import sweep
+    return sweep.coverage(self,other,sameStrand)
+
+  def save(self,fn,compress=None,batchSize=100000):
+    """Write the header lines and the elements of the set in BED format.
+
+       Elements are formatted in batches, and each batch written as one
+       string.  Elements with the default name (``chrom:left-right``), a
+       score of 0 and no strand, as read from a three-column file, are
+       written with three columns (see ``bode.seq.bed.bedText``).  Elements still unread from the set's own file are read as
+       they are written (and retained only if ``keep`` is set).
+
+       :param fn: The name of the file.
+       :param compress: Write BGZF (see ``openOutput``; by default, if
+                        ``fn`` ends in ``.gz`` or ``.bgz``).
+       :param batchSize: The number of elements formatted at a time.
+    """
+    fd = openOutput(fn,compress)
+    try:
+      if self._header:
+        fd.write("\n".join(self._header) + "\n")
+      for text in self._bedChunks(batchSize):
+        fd.write(text)
+    finally:
+      fd.close()
+
+  def _bedChunks(self,batchSize):
+    """Generate the BED text of the elements, a batch at a time."""
+    from bode.seq.bed import bedText
+    batch = list()
+    for iv in self:
+      batch.append(iv)
+      if len(batch) >= batchSize:
+        yield bedText(batch)
+        batch = list()
+    if batch:
+      yield bedText(batch)
 
   def addHeader(self,line):
     self._header.append(line)
+
+  def _getHeader(self):
+    return self._header
+  header = property(_getHeader)
+  """The header lines of the file (get)."""
+
+  def _getKeep(self):
+    return self._keep
+  keep = property(_getKeep)
+  """Whether records are retained as they are read (get)."""
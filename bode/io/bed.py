@@ -1,37 +1,72 @@
+from bode.io import IntervalSet, NoFileHandleError, FileFormatError
+from bode.seq.bed import Bed
+
+################################################################################
 
 class BedFile(IntervalSet):
-  """Represent a bed file."""
+  """Represent a bed file.
 
-  def __init__(self):
-    super(BedFile,self).__init__()
-  
-  def read(self):
+     Header lines (``track``, ``browser`` and ``#`` comments) at the start of
+     the file are collected in ``header``; each remaining non-blank line is
+     parsed into a ``Bed`` object.
+  """
+
+  headerPrefixes = ("track","browser","#")
+
+  def __init__(self,keep=True):
+    super(BedFile,self).__init__(keep=keep)
+    self._nextLine = None
+
+  def readHeader(self):
+    """Read the header lines, keeping the first data line for ``read()``."""
     if self._fd == None:
       raise NoFileHandleError()
     line = self._fd.readline()
+    self._lineNum += 1
+    while line and line.startswith(self.headerPrefixes):
+      self.addHeader(line.rstrip("\r\n"))
+      line = self._fd.readline()
+      self._lineNum += 1
+    self._nextLine = line
+
+  def read(self):
+    """Parse the next record from the file.
+
+       :rtype: Bed (or ``None`` at end of file)
+    """
+    if self._fd == None:
+      raise NoFileHandleError()
+    if self._nextLine != None:
+      line = self._nextLine
+      self._nextLine = None
+    else:
+      line = self._fd.readline()
+      self._lineNum += 1
     flds = line.split()
+    while not flds:
+      if not line:
+        return None
+      line = self._fd.readline()
+      self._lineNum += 1
+      flds = line.split()
+    return self.parseFields(flds)
+
+  def parseLine(self,line):
+    """Construct a ``Bed`` object from one line of a BED file."""
+    return self.parseFields(line.split())
+
+  def parseFields(self,flds):
+    """Construct a ``Bed`` object from the (split) fields of one line."""
     if len(flds) < 3:
       raise FileFormatError(self._fn,self._lineNum,"Need >= 3 fields in line.")
-    bed = Bed(flds[0],int(flds[1]),int(flds[2])
-    if len(flds) >= 4:
-      bed.name = flds[3]
-      if len(flds) >= 5:
-        bed.score = int(flds[4])
-        if len(flds) >= 6:
-          bed.strand = flds[5]
+    try:
+      bed = Bed(flds[0],int(flds[1]),int(flds[2]))
+      if len(flds) >= 4:
+        bed.name = flds[3]
+        if len(flds) >= 5:
+          bed.score = int(flds[4])
+          if len(flds) >= 6:
+            bed.strand = flds[5]
+    except ValueError:
+      raise FileFormatError(self._fn,self._lineNum,"Non-integer coordinate or score.")
     return bed
-
-  def load(self,fn,lazy=True,fd=None):
-    self._fn = fn
-    if fd != None:
-      self._fd = fd
-    else:
-      self._fd = open(fn,"r")
-    self._nextLine = self._fd.readline().strip()
-    self._header = []
-    if self._current.split()[0] = "track"
-      self._header.append(self._current)
-      self._current = self._fd.readline().strip()
-
-  def nexti(self):
-    pass
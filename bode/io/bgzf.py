@@ -0,0 +1,233 @@
+"""Reading and writing BGZF (blocked gzip) files.
+
+   BGZF, the compression format used by ``bgzip``, ``tabix`` and BAM files,
+   is a series of gzip members ("blocks"), each holding at most 64 KB of
+   data.  Any gzip reader can decompress it, but since every block can be
+   decompressed independently, a position in the uncompressed data can be
+   addressed by a *virtual offset*: the file offset of the block's start
+   shifted left 16 bits, plus the offset within the decompressed block.
+   ``BgzfReader`` can seek to any virtual offset without decompressing the
+   rest of the file.
+"""
+import zlib
+import struct
+
+################################################################################
+
+magic = "\x1f\x8b"
+"""The first bytes of every gzip file."""
+
+maxBlockData = 0xff00
+"""Largest amount of (uncompressed) data written to a single block."""
+
+_blockHeader = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00"
+_eofBlock = "\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+
+class BgzfError(IOError):
+  """Exception indicating a corrupt or non-BGZF file."""
+  pass
+
+def isGzip(fn):
+  """True if the named file is gzip-compressed (including BGZF)."""
+  fd = open(fn,"rb")
+  try:
+    return fd.read(2) == magic
+  finally:
+    fd.close()
+
+def isBgzf(fn):
+  """True if the named file is BGZF-compressed."""
+  fd = open(fn,"rb")
+  try:
+    head = fd.read(18)
+  finally:
+    fd.close()
+  return len(head) == 18 and head[:4] == "\x1f\x8b\x08\x04" and head[12:14] == "BC"
+
+def makeVirtualOffset(blockStart,withinBlock):
+  return (blockStart << 16) | withinBlock
+
+def splitVirtualOffset(voffset):
+  """Split a virtual offset into (block start, offset within block)."""
+  return voffset >> 16,voffset & 0xffff
+
+################################################################################
+
+class BgzfReader(object):
+  """A read-only, seekable file-like object for BGZF files.
+
+     ``tell()`` and ``seek()`` use virtual offsets.  Lines may span blocks.
+  """
+
+  def __init__(self,fn=None,fileobj=None):
+    """Open a BGZF file, by name or from an open (binary) file object."""
+    self._fn = fn
+    self._fd = fileobj if fileobj != None else open(fn,"rb")
+    self._blockStart = 0
+    self._blockSize = 0
+    self._data = ""
+    self._pos = 0
+    self._loadBlock(0)
+
+  def _loadBlock(self,start):
+    """Read and decompress the block starting at file offset ``start``."""
+    self._fd.seek(start)
+    head = self._fd.read(12)
+    self._blockStart = start
+    self._pos = 0
+    if not head:
+      self._blockSize = 0
+      self._data = ""
+      return
+    if len(head) < 12 or head[:2] != magic:
+      raise BgzfError("Not a BGZF block at offset %d of %s" % (start,self._fn))
+    xlen = struct.unpack("<H",head[10:12])[0]
+    extra = self._fd.read(xlen)
+    bsize = None
+    i = 0
+    while i + 4 <= len(extra):
+      slen = struct.unpack("<H",extra[i+2:i+4])[0]
+      if extra[i:i+2] == "BC" and slen == 2:
+        bsize = struct.unpack("<H",extra[i+4:i+6])[0]
+      i += 4 + slen
+    if bsize == None:
+      raise BgzfError("Missing BGZF block size at offset %d of %s" % (start,self._fn))
+    cdata = self._fd.read(bsize - xlen - 19)
+    trailer = self._fd.read(8)
+    self._blockSize = bsize + 1
+    self._data = zlib.decompress(cdata,-15)
+    if len(trailer) < 8 or struct.unpack("<I",trailer[4:])[0] != len(self._data) & 0xffffffff:
+      raise BgzfError("Truncated BGZF block at offset %d of %s" % (start,self._fn))
+
+  def _nextBlock(self):
+    """Move to the next non-empty block; returns ``False`` at end of file."""
+    while self._pos >= len(self._data):
+      if self._blockSize == 0:
+        return False
+      self._loadBlock(self._blockStart + self._blockSize)
+    return True
+
+  def tell(self):
+    """The virtual offset of the current position."""
+    if self._pos >= len(self._data) and self._blockSize > 0:
+      return makeVirtualOffset(self._blockStart + self._blockSize,0)
+    return makeVirtualOffset(self._blockStart,self._pos)
+
+  def seek(self,voffset):
+    """Move to the given virtual offset."""
+    start,within = splitVirtualOffset(voffset)
+    if start != self._blockStart or self._blockSize == 0:
+      self._loadBlock(start)
+    if within > len(self._data):
+      raise BgzfError("Virtual offset %d past end of block" % (voffset,))
+    self._pos = within
+
+  def read(self,size=-1):
+    """Read up to ``size`` bytes (all remaining data if ``size`` < 0)."""
+    chunks = list()
+    while size != 0 and self._nextBlock():
+      avail = len(self._data) - self._pos
+      n = avail if size < 0 or size > avail else size
+      chunks.append(self._data[self._pos:self._pos+n])
+      self._pos += n
+      if size > 0:
+        size -= n
+    return "".join(chunks)
+
+  def readline(self):
+    """Read one line, including its newline (``""`` at end of file)."""
+    chunks = list()
+    while self._nextBlock():
+      end = self._data.find("\n",self._pos)
+      if end >= 0:
+        chunks.append(self._data[self._pos:end+1])
+        self._pos = end + 1
+        break
+      chunks.append(self._data[self._pos:])
+      self._pos = len(self._data)
+    return "".join(chunks)
+
+  def __iter__(self):
+    while True:
+      line = self.readline()
+      if not line:
+        return
+      yield line
+
+  def close(self):
+    if self._fd != None:
+      self._fd.close()
+      self._fd = None
+
+################################################################################
+
+class BgzfWriter(object):
+  """A write-only file-like object producing BGZF files."""
+
+  def __init__(self,fn=None,fileobj=None,level=6):
+    """Create a BGZF file, by name or on an open (binary) file object.
+
+       :param level: The zlib compression level.
+    """
+    self._fd = fileobj if fileobj != None else open(fn,"wb")
+    self._level = level
+    self._buffer = list()
+    self._buffered = 0
+    self._blockStart = 0
+
+  def write(self,data):
+    """Write a string, compressing complete blocks as they fill."""
+    self._buffer.append(data)
+    self._buffered += len(data)
+    if self._buffered >= maxBlockData:
+      data = "".join(self._buffer)
+      n = len(data) - len(data) % maxBlockData
+      for i in range(0,n,maxBlockData):
+        self._writeBlock(data[i:i+maxBlockData])
+      self._buffer = [data[n:]]
+      self._buffered = len(data) - n
+
+  def _writeBlock(self,data):
+    comp = zlib.compressobj(self._level,zlib.DEFLATED,-15)
+    cdata = comp.compress(data) + comp.flush()
+    bsize = len(cdata) + 25
+    if bsize > 0xffff:
+      raise BgzfError("Compressed block too large")
+    block = "".join((_blockHeader,struct.pack("<H",bsize),cdata,
+                     struct.pack("<II",zlib.crc32(data) & 0xffffffff,len(data))))
+    self._fd.write(block)
+    self._blockStart += len(block)
+
+  def flush(self):
+    """Compress any buffered data into a (possibly short) block."""
+    if self._buffered:
+      self._writeBlock("".join(self._buffer))
+      self._buffer = list()
+      self._buffered = 0
+    self._fd.flush()
+
+  def tell(self):
+    """The virtual offset at which the next data will be written."""
+    return makeVirtualOffset(self._blockStart,self._buffered)
+
+  def close(self):
+    """Flush, write the BGZF end-of-file marker, and close the file."""
+    if self._fd != None:
+      self.flush()
+      self._fd.write(_eofBlock)
+      self._fd.close()
+      self._fd = None
+
+def bgzip(src,dst,level=6):
+  """Compress file ``src`` to BGZF file ``dst``, as ``bgzip`` does."""
+  fin = open(src,"rb")
+  out = BgzfWriter(dst,level=level)
+  try:
+    while True:
+      data = fin.read(1 << 20)
+      if not data:
+        break
+      out.write(data)
+  finally:
+    fin.close()
+    out.close()
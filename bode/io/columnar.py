@@ -0,0 +1,491 @@
+"""Column-oriented interval sets, stored in NumPy arrays.
+
+   A ``ColumnarIntervalSet`` keeps one array per field rather than one Python
+   object per interval, which makes it several times more compact than a list
+   of ``Bed`` objects, and lets whole-set operations (loading, filtering) run
+   as vectorized NumPy operations.  ``Bed`` objects are constructed only when
+   an element is actually requested.
+"""
+import numpy
+
+from bode.io import IntervalSet, FileFormatError, openInput
+from bode.io.overlap import IntervalIndex
+from bode.seq import chromKey
+from bode.seq.bed import Bed
+
+################################################################################
+
+strandChars = (".","+","-")
+"""Strand characters, indexed by strand code."""
+
+strandCodes = dict((s,i) for i,s in enumerate(strandChars))
+"""Strand codes, indexed by strand character."""
+
+def _fieldCounts(text):
+  """The number of fields on each ``\n``-terminated line of ``text``, as an
+     array.
+
+     Any control character is taken as a separator, so a count may exceed
+     that of ``str.split``, but never falls short of it.
+  """
+  chars = numpy.frombuffer(text,dtype=numpy.uint8)
+  space = chars <= 32
+  starts = ~space
+  starts[1:] &= space[:-1]
+  ends = numpy.flatnonzero(chars == 10)
+  if len(chars) and chars[-1] != 10:
+    ends = numpy.append(ends,len(chars))
+  if not len(ends):
+    return numpy.zeros(0,dtype=numpy.int32)
+  return numpy.add.reduceat(starts,numpy.concatenate(([0],ends[:-1]+1)),dtype=numpy.int32)
+
+def _digits(values):
+  """The decimal digits of non-negative integers, as a ``uint8`` matrix with
+     one right-aligned row per value, padded on the left with zeros
+     (NUL bytes)."""
+  width = len(str(int(values.max()))) if len(values) else 1
+  matrix = numpy.zeros((len(values),width),dtype=numpy.uint8)
+  q = values.copy()
+  for c in range(width-1,-1,-1):
+    matrix[:,c] = 48 + q % 10
+    q //= 10
+    if c < width - 1:
+      matrix[values < 10 ** (width - 1 - c),c] = 0
+  return matrix
+
+def _textTable(texts):
+  """Strings as a ``uint8`` matrix, one row per string, NUL-padded."""
+  table = numpy.array(list(texts) or [""],dtype="S")
+  return table.view(numpy.uint8).reshape(len(table),table.itemsize)
+
+class ColumnarIntervalSet(IntervalSet):
+  """An interval set stored as parallel NumPy arrays.
+
+     The columns are:
+
+     * ``chroms`` -- chromosome codes (``int32``), indexing ``chromNames``
+     * ``lefts``, ``rights`` -- interval endpoints (``int64``)
+     * ``strands`` -- strand codes (``int8``), indexing ``strandChars``
+     * ``scores`` -- scores (``int64``)
+     * ``names`` -- interval names, or ``None`` if the intervals are unnamed
+
+     Indexing or iterating the set yields ``Bed`` objects, built on demand;
+     modifying them does not modify the set.
+  """
+
+  def __init__(self):
+    """Create an empty ``ColumnarIntervalSet``."""
+    super(ColumnarIntervalSet,self).__init__(keep=True)
+    self._setColumns([],numpy.zeros(0,dtype=numpy.int32),
+                     numpy.zeros(0,dtype=numpy.int64),
+                     numpy.zeros(0,dtype=numpy.int64),
+                     numpy.zeros(0,dtype=numpy.int8),
+                     numpy.zeros(0,dtype=numpy.int64),None)
+
+  def _setColumns(self,chromNames,chroms,lefts,rights,strands,scores,names):
+    self._chromNames = list(chromNames)
+    self._chroms = chroms
+    self._lefts = lefts
+    self._rights = rights
+    self._strands = strands
+    self._scores = scores
+    self._names = names
+    self._pending = list()
+    self._index = None
+
+  @classmethod
+  def fromIntervals(cls,intervals):
+    """Build a columnar set from an iterable of ``Interval`` objects.
+
+       Scores are taken from the intervals' ``score`` attribute, if any.
+    """
+    cs = cls()
+    for iv in intervals:
+      cs.append(iv)
+    cs._consolidate()
+    return cs
+
+  def _consolidate(self):
+    """Move intervals added with ``append`` into the column arrays."""
+    if not self._pending:
+      return
+    pending = self._pending
+    self._pending = list()
+    chromIndex = dict((c,i) for i,c in enumerate(self._chromNames))
+    chroms = [chromIndex.setdefault(iv.chrom,len(chromIndex)) for iv in pending]
+    chromNames = [None] * len(chromIndex)
+    for c,i in chromIndex.items():
+      chromNames[i] = c
+    self._chromNames = chromNames
+    n = len(self._lefts)
+    names = [iv.name for iv in pending]
+    if self._names is not None:
+      names = list(self._names) + names
+    elif any(name != None for name in names):
+      names = [None] * n + names
+    else:
+      names = None
+    self._chroms = numpy.concatenate((self._chroms,numpy.array(chroms,dtype=numpy.int32)))
+    self._lefts = numpy.concatenate((self._lefts,numpy.array([iv.left for iv in pending],dtype=numpy.int64)))
+    self._rights = numpy.concatenate((self._rights,numpy.array([iv.right for iv in pending],dtype=numpy.int64)))
+    self._strands = numpy.concatenate((self._strands,numpy.array([strandCodes.get(iv.strand,0) for iv in pending],dtype=numpy.int8)))
+    self._scores = numpy.concatenate((self._scores,numpy.array([getattr(iv,"score",0) or 0 for iv in pending],dtype=numpy.int64)))
+    self._names = numpy.array(names,dtype=object) if names is not None else None
+
+  def __len__(self):
+    return len(self._lefts) + len(self._pending)
+
+  def __iter__(self):
+    """Returns a generator of ``Bed`` objects, one per element."""
+    self._consolidate()
+    for i in range(0,len(self._lefts)):
+      yield self._bed(i)
+
+  def __getitem__(self,index):
+    """Returns a ``Bed`` for an integer index, or a new set for a slice."""
+    self._consolidate()
+    if isinstance(index,slice):
+      return self.filter(index)
+    if index < 0:
+      index += len(self._lefts)
+    if index < 0 or index >= len(self._lefts):
+      raise IndexError("ColumnarIntervalSet index out of range")
+    return self._bed(index)
+
+  def _bed(self,i):
+    name = str(self._names[i]) if self._names is not None and self._names[i] != None else None
+    return Bed(self._chromNames[self._chroms[i]],int(self._lefts[i]),
+               int(self._rights[i]),name=name,score=int(self._scores[i]),
+               strand=strandChars[self._strands[i]])
+
+  def next(self):
+    self._consolidate()
+    if self._current >= len(self._lefts):
+      raise StopIteration
+    rv = self._bed(self._current)
+    self._current += 1
+    return rv
+  __next__ = next
+
+  def append(self,interval):
+    """Append an interval to the set.
+
+       Appended intervals are buffered and merged into the column arrays
+       in bulk, the next time the arrays are needed.
+    """
+    self._pending.append(interval)
+    self._index = None
+
+  def filter(self,selector):
+    """Returns a new set containing the selected elements.
+
+       :param selector: A boolean mask, an array of indices, or a slice.
+       :rtype: ColumnarIntervalSet
+    """
+    self._consolidate()
+    cs = type(self)()
+    names = self._names[selector] if self._names is not None else None
+    cs._setColumns(self._chromNames,self._chroms[selector],
+                   self._lefts[selector],self._rights[selector],
+                   self._strands[selector],self._scores[selector],names)
+    cs._header = list(self._header)
+    return cs
+
+  def chromRanks(self):
+    """The genomic sort rank of each chromosome code.
+
+       :rtype: numpy.ndarray
+    """
+    self._consolidate()
+    order = sorted(range(0,len(self._chromNames)),key=lambda c:chromKey(self._chromNames[c]))
+    ranks = numpy.zeros(len(order),dtype=numpy.int32)
+    ranks[order] = numpy.arange(len(order),dtype=numpy.int32)
+    return ranks
+
+  def sortOrder(self):
+    """The permutation that sorts the set into genomic order.
+
+       :rtype: numpy.ndarray
+    """
+    self._consolidate()
+    return numpy.lexsort((self._strands,self._rights,self._lefts,
+                          self.chromRanks()[self._chroms]))
+
+  def sort(self):
+    """Sort the elements of the set into genomic order."""
+    ordered = self.filter(self.sortOrder())
+    self._setColumns(ordered._chromNames,ordered._chroms,ordered._lefts,
+                     ordered._rights,ordered._strands,ordered._scores,
+                     ordered._names)
+    self._current = 0
+
+  def index(self):
+    """Returns an overlap index of the set, building it if necessary.
+
+       The items in the index are positions in the set, rather than
+       ``Bed`` objects, so building it does not construct any.
+
+       :rtype: bode.io.overlap.IntervalIndex
+    """
+    self._consolidate()
+    if self._index == None:
+      idx = IntervalIndex()
+      chromNames = self._chromNames
+      for i,c,l,r in zip(range(0,len(self._lefts)),self._chroms.tolist(),
+                         self._lefts.tolist(),self._rights.tolist()):
+        idx.add(chromNames[c],l,r,i)
+      self._index = idx
+    return self._index
+
+  def overlapping(self,chrom,left,right=None):
+    """Returns a list of ``Bed`` objects overlapping a region or position."""
+    return [self._bed(i) for i in sorted(self.index().overlapping(chrom,left,right))]
+
+  def mask(self,chrom=None,left=None,right=None,strand=None,minScore=None,maxScore=None,minLength=None):
+    """Returns a boolean mask of the elements satisfying all the criteria.
+
+       :param chrom: Keep only intervals on this chromosome.
+       :param left: Keep only intervals ending after this position.
+       :param right: Keep only intervals starting before this position.
+       :param strand: Keep only intervals on this strand ('+','-','.').
+       :param minScore: Keep only intervals with at least this score.
+       :param maxScore: Keep only intervals with at most this score.
+       :param minLength: Keep only intervals at least this long.
+       :rtype: numpy.ndarray
+    """
+    self._consolidate()
+    m = numpy.ones(len(self._lefts),dtype=bool)
+    if chrom != None:
+      if chrom not in self._chromNames:
+        return numpy.zeros(len(self._lefts),dtype=bool)
+      m &= self._chroms == self._chromNames.index(chrom)
+    if left != None:
+      m &= self._rights > left
+    if right != None:
+      m &= self._lefts < right
+    if strand != None:
+      m &= self._strands == strandCodes[strand]
+    if minScore != None:
+      m &= self._scores >= minScore
+    if maxScore != None:
+      m &= self._scores <= maxScore
+    if minLength != None:
+      m &= (self._rights - self._lefts) >= minLength
+    return m
+
+  def select(self,**criteria):
+    """Returns a new set of the elements satisfying the given criteria.
+
+       Accepts the same keyword arguments as ``mask``.
+
+       :rtype: ColumnarIntervalSet
+    """
+    return self.filter(self.mask(**criteria))
+
+  def _bedChunks(self,batchSize):
+    """Generate the BED text of the elements, a batch at a time.
+
+       Each batch is formatted with array operations: the fields are laid
+       out as fixed-width byte matrices, side by side, and the padding
+       removed in one pass.  As by ``bedText``, elements with the default
+       name, a score of 0 and no strand are written with three columns.
+    """
+    self._consolidate()
+    if len(self._lefts) and (self._lefts.min() < 0 or self._rights.min() < 0):
+      for text in super(ColumnarIntervalSet,self)._bedChunks(batchSize):
+        yield text
+      return
+    chromTable = _textTable(self._chromNames)
+    strandTable = _textTable(strandChars)
+    scores,scoreCodes = numpy.unique(self._scores,return_inverse=True)
+    scoreTable = _textTable(["%g" % (s,) for s in scores])
+    for start in range(0,len(self._lefts),batchSize):
+      end = min(start + batchSize,len(self._lefts))
+      n = end - start
+      tab = numpy.empty((n,1),dtype=numpy.uint8)
+      tab.fill(9)
+      newline = numpy.empty((n,1),dtype=numpy.uint8)
+      newline.fill(10)
+      fields = [chromTable[self._chroms[start:end]],tab,
+                _digits(self._lefts[start:end]),tab,
+                _digits(self._rights[start:end])]
+      plain = (self._scores[start:end] == 0) & (self._strands[start:end] == 0)
+      names = self._names[start:end].tolist() if self._names is not None else [None] * n
+      # default names are needed for unnamed elements with other columns,
+      # and to check whether named elements are plain
+      plainList = plain.tolist()
+      for j in [j for j,name in enumerate(names) if (name == None) != plainList[j]]:
+        i = start + j
+        default = "%s:%d-%d" % (self._chromNames[self._chroms[i]],self._lefts[i],self._rights[i])
+        if names[j] == None:
+          names[j] = default
+        elif names[j] != default:
+          plain[j] = False
+      if not plain.all():
+        tail = numpy.hstack([tab,_textTable([name or "" for name in names]),tab,
+                             scoreTable[scoreCodes[start:end]],
+                             tab,strandTable[self._strands[start:end]]])
+        tail[plain] = 0
+        fields.append(tail)
+      fields.append(newline)
+      text = numpy.hstack(fields).ravel()
+      yield text[text != 0].tostring()
+
+  def _getChromNames(self):
+    self._consolidate()
+    return self._chromNames
+  chromNames = property(_getChromNames)
+  """Chromosome names, indexed by chromosome code (get)."""
+
+  def _getChroms(self):
+    self._consolidate()
+    return self._chroms
+  chroms = property(_getChroms)
+  """Chromosome codes of the elements (get)."""
+
+  def _getLefts(self):
+    self._consolidate()
+    return self._lefts
+  lefts = property(_getLefts)
+  """Left endpoints of the elements (get)."""
+
+  def _getRights(self):
+    self._consolidate()
+    return self._rights
+  rights = property(_getRights)
+  """Right endpoints of the elements (get)."""
+
+  def _getStrands(self):
+    self._consolidate()
+    return self._strands
+  strands = property(_getStrands)
+  """Strand codes of the elements (get)."""
+
+  def _getScores(self):
+    self._consolidate()
+    return self._scores
+  scores = property(_getScores)
+  """Scores of the elements (get)."""
+
+  def _getNames(self):
+    self._consolidate()
+    return self._names
+  names = property(_getNames)
+  """Names of the elements, or ``None`` if unnamed (get)."""
+
+################################################################################
+
+class ColumnarBedFile(ColumnarIntervalSet):
+  """A BED file, loaded in bulk into a ``ColumnarIntervalSet``."""
+
+  headerPrefixes = ("track","browser","#")
+
+  def load(self,fn,lazy=True,fd=None):
+    """Load the whole of a BED file.
+
+       The file is split into fields in one pass, and each column is
+       converted with a single NumPy operation.  Columnar sets are always
+       loaded completely, so ``lazy`` is ignored.
+
+       :param fn: The name of the file.
+       :param fd: An open file to read from instead of opening ``fn``.
+       :rtype: ColumnarBedFile (``self``)
+    """
+    self._fn = fn
+    self._header = list()
+    self._tabix = None
+    if fd == None:
+      fd = openInput(fn)
+    try:
+      text = fd.read()
+    finally:
+      fd.close()
+    self.parse(text)
+    return self
+
+  def parse(self,text,header=True):
+    """Parse the text of a BED file into the column arrays.
+
+       :param text: The text to parse.
+       :param header: Whether ``text`` may start with header lines.
+    """
+    start = 0
+    while header and start < len(text) and text.startswith(self.headerPrefixes,start):
+      end = text.find("\n",start)
+      end = len(text) if end < 0 else end + 1
+      self.addHeader(text[start:end].rstrip("\r\n"))
+      start = end
+    self._headerLines = len(self._header)
+    body = text[start:]
+    tokens = body.split()
+    lines = body.splitlines()
+    ncol = len(lines[0].split()) if lines else 3
+    if ncol < 3:
+      raise FileFormatError(self._fn,self._headerLines+1,"Need >= 3 fields in line.")
+    if len(tokens) == ncol * len(lines) and self._uniform(body,ncol,len(lines)):
+      columns = [tokens[i::ncol] for i in range(0,min(ncol,6))]
+    else:
+      columns = self._ragged(lines)
+    self._fromColumns(columns)
+
+  def fetch(self,chrom,left,right):
+    """Returns the records of the file overlapping a region.
+
+       As ``IntervalSet.fetch``, but the records are returned as a new
+       ``ColumnarBedFile``.
+    """
+    cb = ColumnarBedFile()
+    cb._fn = self._fn
+    cb.parse("".join(self._fetchLines(chrom,left,right)),header=False)
+    return cb
+
+  def _uniform(self,body,ncol,nlines):
+    """Whether every line of ``body`` has ``ncol`` fields.
+
+       Called only when ``body`` has ``ncol * nlines`` fields in all, so the
+       (never too low) counts of ``_fieldCounts`` are exact if they all
+       equal ``ncol``.
+    """
+    counts = _fieldCounts(body)
+    return len(counts) == nlines and bool((counts == ncol).all())
+
+  def _ragged(self,lines):
+    """Split lines with differing numbers of fields, padding with defaults."""
+    columns = [[],[],[],[],[],[]]
+    defaults = (None,None,None,None,"0",".")
+    for i,line in enumerate(lines):
+      flds = line.split()
+      if not flds:
+        continue
+      if len(flds) < 3:
+        raise FileFormatError(self._fn,self._headerLines+i+1,"Need >= 3 fields in line.")
+      for j in range(0,6):
+        columns[j].append(flds[j] if j < len(flds) else defaults[j])
+    if all(name == None for name in columns[3]):
+      return columns[:3]
+    return columns
+
+  def _fromColumns(self,columns):
+    n = len(columns[0])
+    try:
+      lefts = numpy.array(columns[1]).astype(numpy.int64)
+      rights = numpy.array(columns[2]).astype(numpy.int64)
+      if len(columns) > 4:
+        scores = numpy.array(columns[4]).astype(numpy.int64)
+      else:
+        scores = numpy.zeros(n,dtype=numpy.int64)
+    except ValueError:
+      raise FileFormatError(self._fn,None,"Non-integer coordinate or score.")
+    if n:
+      chromNames,chroms = numpy.unique(numpy.array(columns[0]),return_inverse=True)
+      chromNames = [str(c) for c in chromNames]
+    else:
+      chromNames,chroms = [],numpy.zeros(0)
+    strands = numpy.zeros(n,dtype=numpy.int8)
+    if len(columns) > 5:
+      sc = numpy.array(columns[5])
+      strands[sc == "+"] = strandCodes["+"]
+      strands[sc == "-"] = strandCodes["-"]
+    names = numpy.array(columns[3],dtype=object) if len(columns) > 3 else None
+    self._setColumns(chromNames,chroms.astype(numpy.int32),lefts,rights,
+                     strands,scores,names)
@@ -0,0 +1,117 @@
+"""Sorting interval streams too large to fit in memory.
+
+   ``externalSort`` reads a stream of intervals in chunks that fit within a
+   memory budget, sorts each chunk into genomic order (as ``Interval``
+   comparison) and spills it to a temporary file, then merges the sorted runs
+   back together as a stream::
+
+     bf = BedFile(keep=False).load("huge.bed")
+     for bed in externalSort(bf,maxMemory=2*1024**3):
+       ...
+"""
+import os
+import heapq
+import shutil
+import tempfile
+try:
+  import cPickle as pickle
+except ImportError:
+  import pickle
+
+################################################################################
+
+defaultMemory = 1024**3
+"""Default memory budget for sorting (bytes)."""
+
+bytesPerRecord = 400
+"""Estimated memory used by one interval (plus its sort key) while sorting."""
+
+blockSize = 10000
+"""Number of records pickled together when writing a run to disk."""
+
+def externalSort(intervals,maxMemory=defaultMemory,tmpdir=None,maxRuns=128,recordSize=bytesPerRecord):
+  """Sort a stream of intervals, spilling to disk as necessary.
+
+     :param intervals: An iterable of ``Interval`` objects (for instance, a
+                       ``BedFile`` loaded with ``keep=False``).
+     :param maxMemory: Approximate memory budget, in bytes.
+     :type maxMemory: int
+     :param tmpdir: Directory for temporary files (default: the system
+                    temporary directory).
+     :param maxRuns: The most runs merged at once; if more runs are spilled,
+                     they are merged in several passes.
+     :param recordSize: Estimated memory per interval, in bytes.
+     :returns: A generator of the intervals in sorted order.  Temporary
+               files are deleted when it is exhausted (or closed).
+  """
+  chunk = max(1,maxMemory // recordSize)
+  workdir = None
+  runs = list()
+  try:
+    records = list()
+    for iv in intervals:
+      records.append(iv)
+      if len(records) >= chunk:
+        if workdir == None:
+          workdir = tempfile.mkdtemp(prefix="extsort",dir=tmpdir)
+        records.sort(key=lambda x:x.sortKey())
+        runs.append(_writeRun(workdir,len(runs),records))
+        records = list()
+    records.sort(key=lambda x:x.sortKey())
+    if not runs:
+      for iv in records:
+        yield iv
+      return
+    runs.append(_writeRun(workdir,len(runs),records))
+    records = None
+    while len(runs) > maxRuns:
+      merged = list()
+      for i in range(0,len(runs),maxRuns):
+        group = runs[i:i+maxRuns]
+        merged.append(_writeRun(workdir,"m%d_%d" % (len(runs),i),_mergeRuns(group)))
+      runs = merged
+    for iv in _mergeRuns(runs):
+      yield iv
+  finally:
+    if workdir != None:
+      shutil.rmtree(workdir,ignore_errors=True)
+
+def _writeRun(workdir,tag,records):
+  """Write sorted records to a run file, returning its name."""
+  fn = os.path.join(workdir,"run%s" % (tag,))
+  fd = open(fn,"wb")
+  block = list()
+  for iv in records:
+    block.append(iv)
+    if len(block) >= blockSize:
+      pickle.dump(block,fd,pickle.HIGHEST_PROTOCOL)
+      block = list()
+  if block:
+    pickle.dump(block,fd,pickle.HIGHEST_PROTOCOL)
+  fd.close()
+  return fn
+
+def _readRun(fn):
+  """Generate the records of a run file, deleting it when done."""
+  fd = open(fn,"rb")
+  try:
+    while True:
+      try:
+        block = pickle.load(fd)
+      except EOFError:
+        break
+      for iv in block:
+        yield iv
+  finally:
+    fd.close()
+    os.remove(fn)
+
+def _decorate(i,run):
+  for j,iv in enumerate(run):
+    yield (iv.sortKey(),i,j,iv)
+
+def _mergeRuns(runs):
+  """k-way merge of sorted run files; ties keep their original order."""
+  streams = [_decorate(i,_readRun(fn)) for i,fn in enumerate(runs)]
+  for entry in heapq.merge(*streams):
+    yield entry[3]
@@ -0,0 +1,318 @@
+"""Reading, writing and indexing FASTA files.
+
+   ``FastaFile`` reads a FASTA file as a stream of ``Sequence`` objects,
+   one record at a time, so files far larger than memory can be processed.
+   With a samtools-compatible ``.fai`` index (read from ``fn + ".fai"``, or
+   built and saved on first use), ``fetch`` reads just the bases of a
+   region by seeking to them::
+
+     fa = FastaFile("hg19.fa")
+     for chrom in fa:
+       ...
+     promoter = fa.fetch("chr3",1000000,1002000)
+
+   ``FastaWriter`` writes records with lines wrapped to a fixed width, and
+   keeps the index entries of what it has written.
+"""
+import os
+
+from bode.io import FileFormatError, openInput
+from bode.seq import Sequence
+
+################################################################################
+
+class FastaIndex(object):
+  """A FASTA index, as made by ``samtools faidx``.
+
+     For each sequence the index holds its length, the file offset of its
+     first base, and the number of bases and of bytes in each (full) line.
+  """
+
+  def __init__(self,entries=None):
+    """Create an index, optionally from a list of
+       ``(name,length,offset,lineBases,lineWidth)`` tuples."""
+    self._names = list()
+    self._entries = dict()
+    for entry in entries or ():
+      self._add(*entry)
+
+  def _add(self,name,length,offset,lineBases,lineWidth):
+    if name not in self._entries:
+      self._names.append(name)
+    self._entries[name] = (length,offset,lineBases,lineWidth)
+
+  def _getNames(self):
+    return self._names
+  names = property(_getNames)
+  """The sequence names in the index, in file order (get)."""
+
+  def __contains__(self,name):
+    return name in self._entries
+
+  def length(self,name):
+    """The length of the named sequence."""
+    return self._entries[name][0]
+
+  def load(self,fn):
+    """Load an index from a ``.fai`` file.
+
+       :rtype: FastaIndex (``self``)
+    """
+    self._names = list()
+    self._entries = dict()
+    fd = open(fn)
+    try:
+      for lineNum,line in enumerate(fd):
+        flds = line.rstrip("\r\n").split("\t")
+        if len(flds) < 5:
+          raise FileFormatError(fn,lineNum+1,"Need >= 5 fields in line.")
+        try:
+          self._add(flds[0],*[int(f) for f in flds[1:5]])
+        except ValueError:
+          raise FileFormatError(fn,lineNum+1,"Non-integer field.")
+    finally:
+      fd.close()
+    return self
+
+  def save(self,fn):
+    """Write the index to a ``.fai`` file."""
+    fd = open(fn,"w")
+    try:
+      for name in self._names:
+        fd.write("%s\t%d\t%d\t%d\t%d\n" % ((name,) + self._entries[name]))
+    finally:
+      fd.close()
+
+  def build(self,fn):
+    """Build the index of an (uncompressed) FASTA file.
+
+       As for ``samtools faidx``, every line of a sequence except the last
+       must hold the same number of bases.
+
+       :rtype: FastaIndex (``self``)
+    """
+    self._names = list()
+    self._entries = dict()
+    fd = open(fn,"rb")
+    try:
+      pos = 0
+      name = None
+      for lineNum,line in enumerate(fd):
+        pos += len(line)
+        if line.startswith(">"):
+          if name != None:
+            self._add(name,length,offset,lineBases,lineWidth)
+          name = line[1:].split(None,1)[0] if line[1:].strip() else ""
+          if name in self._entries:
+            raise FileFormatError(fn,lineNum+1,"Duplicate sequence name %s." % (name,))
+          length = 0
+          offset = pos
+          lineBases = lineWidth = 0
+          ended = False
+          continue
+        bases = len(line.rstrip("\r\n"))
+        if name == None:
+          if bases:
+            raise FileFormatError(fn,lineNum+1,"Sequence before first header.")
+          continue
+        if bases == 0:
+          ended = True
+          continue
+        if ended:
+          raise FileFormatError(fn,lineNum+1,"Different line length in sequence %s." % (name,))
+        if lineBases == 0:
+          lineBases = bases
+          lineWidth = len(line)
+        elif bases > lineBases or (bases == lineBases and len(line) not in (lineWidth,bases)):
+          raise FileFormatError(fn,lineNum+1,"Different line length in sequence %s." % (name,))
+        if bases < lineBases or len(line) < lineWidth:
+          ended = True
+        length += bases
+      if name != None:
+        self._add(name,length,offset,lineBases,lineWidth)
+    finally:
+      fd.close()
+    return self
+
+  def region(self,name,left,right):
+    """The byte range of a region of a sequence.
+
+       :returns: The file offsets of the first base and just past the last
+                 base (equal if the region is empty).
+    """
+    length,offset,lineBases,lineWidth = self._entries[name]
+    left = max(0,left)
+    right = length if right == None else min(right,length)
+    if left >= right:
+      return offset,offset
+    start = offset + left // lineBases * lineWidth + left % lineBases
+    end = offset + (right - 1) // lineBases * lineWidth + (right - 1) % lineBases + 1
+    return start,end
+
+  def fetch(self,fd,name,left=0,right=None):
+    """Read the bases of a region of a sequence.
+
+       :param fd: The FASTA file, open in binary mode.
+       :param name: The sequence name.
+       :param left: The start of the region (0-based).
+       :param right: The end of the region (exclusive; default: the end
+                     of the sequence).
+       :rtype: str
+    """
+    start,end = self.region(name,left,right)
+    fd.seek(start)
+    return fd.read(end - start).translate(None,"\r\n")
+
+def indexFasta(fn):
+  """Build and save the index (``fn`` + ``.fai``) of a FASTA file.
+
+     :rtype: FastaIndex
+  """
+  idx = FastaIndex().build(fn)
+  idx.save(fn + ".fai")
+  return idx
+
+################################################################################
+
+class FastaFile(object):
+  """A FASTA file, read as ``Sequence`` objects.
+
+     Each record becomes a ``Sequence`` named by the first word of its
+     header line.  Sequence types are not guessed until they are needed.
+  """
+
+  def __init__(self,fn=None,fd=None):
+    """Open a FASTA file, by name or from an open file object (which can be
+       streamed, but not indexed).  Gzipped files can be streamed."""
+    self._fn = fn
+    self._fd = fd
+    self._index = None
+    self._fetchFd = None
+
+  def __iter__(self):
+    fd = self._fd if self._fd != None else openInput(self._fn)
+    try:
+      name = None
+      parts = list()
+      for lineNum,line in enumerate(fd):
+        if line.startswith(">"):
+          if name != None:
+            yield Sequence("".join(parts),name=name)
+          name = line[1:].split(None,1)[0] if line[1:].strip() else ""
+          parts = list()
+        elif name != None:
+          parts.append(line.strip())
+        elif line.strip() and not line.startswith(";"):
+          raise FileFormatError(self._fn,lineNum+1,"Sequence before first header.")
+      if name != None:
+        yield Sequence("".join(parts),name=name)
+    finally:
+      if self._fd == None:
+        fd.close()
+
+  def _getIndex(self):
+    if self._index == None:
+      if self._fn == None:
+        raise ValueError("Only named FASTA files can be indexed")
+      faiFn = self._fn + ".fai"
+      if os.path.exists(faiFn) and os.path.getmtime(faiFn) >= os.path.getmtime(self._fn):
+        self._index = FastaIndex().load(faiFn)
+      else:
+        self._index = indexFasta(self._fn)
+    return self._index
+  index = property(_getIndex)
+  """The ``FastaIndex`` of the file, loaded or built on first use (get)."""
+
+  def fetch(self,chrom,left=0,right=None):
+    """The sequence of a region, read directly from the file.
+
+       :param chrom: The sequence name.
+       :param left: The start of the region (0-based).
+       :param right: The end of the region (exclusive; default: the end
+                     of the sequence).
+       :rtype: Sequence
+    """
+    if chrom not in self.index:
+      raise KeyError("No sequence %s in %s" % (chrom,self._fn))
+    if right == None:
+      right = self.index.length(chrom)
+    if self._fetchFd == None:
+      self._fetchFd = open(self._fn,"rb")
+    return Sequence(self.index.fetch(self._fetchFd,chrom,left,right),
+                    name="%s:%d-%d" % (chrom,left,right))
+
+  def close(self):
+    if self._fetchFd != None:
+      self._fetchFd.close()
+      self._fetchFd = None
+
+################################################################################
+
+class FastaWriter(object):
+  """Write sequences in FASTA format, with lines wrapped to a fixed width.
+
+     Output is collected in a buffer and written in large pieces.  The
+     index entries of the records written are available from ``index``.
+  """
+
+  def __init__(self,fn=None,fd=None,width=60,bufferSize=1<<20):
+    """Create a FASTA file, by name or on an open file object.
+
+       :param width: The number of bases per line.
+       :param bufferSize: The amount of output buffered before writing.
+    """
+    self._fn = fn
+    self._fd = fd if fd != None else open(fn,"wb")
+    self._width = width
+    self._bufferSize = bufferSize
+    self._buffer = list()
+    self._buffered = 0
+    self._offset = 0
+    self._index = FastaIndex()
+
+  def write(self,seq,name=None):
+    """Write one record.
+
+       :param seq: A ``Sequence`` (or string).
+       :param name: The record name (default: the name of ``seq``).
+    """
+    if name == None:
+      name = seq.name if isinstance(seq,Sequence) and seq.name != None else "sequence"
+    text = str(seq)
+    w = self._width
+    head = ">%s\n" % (name,)
+    body = "".join([text[i:i+w] + "\n" for i in range(0,len(text),w)])
+    lineBases = min(w,len(text))
+    self._index._add(name,len(text),self._offset + len(head),lineBases,lineBases + 1 if lineBases else 0)
+    self._buffer.append(head)
+    self._buffer.append(body)
+    self._buffered += len(head) + len(body)
+    self._offset += len(head) + len(body)
+    if self._buffered >= self._bufferSize:
+      self._flushBuffer()
+
+  def _flushBuffer(self):
+    self._fd.write("".join(self._buffer))
+    self._buffer = list()
+    self._buffered = 0
+
+  def flush(self):
+    self._flushBuffer()
+    self._fd.flush()
+
+  def _getIndex(self):
+    return self._index
+  index = property(_getIndex)
+  """The ``FastaIndex`` of the records written so far (get)."""
+
+  def close(self,index=False):
+    """Flush and close the file.
+
+       :param index: If ``True``, also save the index (``fn`` + ``.fai``).
+    """
+    if self._fd != None:
+      self._flushBuffer()
+      self._fd.close()
+      self._fd = None
+      if index:
+        self._index.save(self._fn + ".fai")
@@ -0,0 +1,106 @@
+"""Reading FASTQ files.
+
+   ``FastqFile`` reads (four-line) FASTQ records as ``FastqSequence``
+   objects, either one at a time or in batches of a configurable size::
+
+     for batch in FastqFile("reads.fastq.gz").batches(100000):
+       ...
+
+   The file is read in large chunks and split into lines in bulk, rather
+   than line by line.  Gzipped files are decompressed in a background
+   thread (see ``bode.io.threaded``), so that decompression and parsing
+   overlap.  Sequence types and quality scores are worked out only when
+   they are used.
+"""
+import gzip
+
+from bode.io import FileFormatError
+from bode.io.bgzf import isGzip
+from bode.io.threaded import ThreadedReader
+from bode.seq.fastq import FastqSequence
+
+################################################################################
+
+class FastqFile(object):
+  """A FASTQ file, read as ``FastqSequence`` objects."""
+
+  def __init__(self,fn=None,fd=None,batchSize=10000,offset=33,chunkSize=1<<22):
+    """Open a FASTQ file, by name or from an open file object.
+
+       :param batchSize: The default number of reads per batch.
+       :param offset: The quality encoding offset.
+       :param chunkSize: The amount of data read at a time.
+    """
+    self._fn = fn
+    self._fd = fd
+    self._batchSize = batchSize
+    self._offset = offset
+    self._chunkSize = chunkSize
+
+  def __iter__(self):
+    for batch in self.batches():
+      for read in batch:
+        yield read
+
+  def _open(self):
+    if self._fd != None:
+      return ThreadedReader(self._fd,self._chunkSize)
+    if isGzip(self._fn):
+      return ThreadedReader(gzip.open(self._fn,"rb"),self._chunkSize)
+    return ThreadedReader(open(self._fn,"rb"),self._chunkSize)
+
+  def _records(self,lines,lineNum):
+    """Build the reads from a list of lines (a multiple of four)."""
+    names = lines[0::4]
+    seqs = lines[1::4]
+    pluses = lines[2::4]
+    quals = lines[3::4]
+    reads = list()
+    offset = self._offset
+    for i,(name,seq,plus,qual) in enumerate(zip(names,seqs,pluses,quals)):
+      if name[:1] != "@" or plus[:1] != "+" or len(seq) != len(qual):
+        for j,(line,first) in enumerate(((name,"@"),(seq,None),(plus,"+"))):
+          if first != None and line[:1] != first:
+            raise FileFormatError(self._fn,lineNum+4*i+j+1,"Expected a line starting with '%s'." % (first,))
+        raise FileFormatError(self._fn,lineNum+4*i+4,"Quality length differs from sequence length.")
+      words = name[1:].split(None,1)
+      reads.append(FastqSequence(seq,name=words[0] if words else "",quality=qual,offset=offset))
+    return reads
+
+  def batches(self,batchSize=None):
+    """Generate the reads in batches.
+
+       :param batchSize: The number of reads per batch (the last batch may
+                         be smaller; default: as given to the constructor).
+       :returns: A generator of lists of ``FastqSequence`` objects.
+    """
+    nlines = 4 * (batchSize or self._batchSize)
+    reader = self._open()
+    try:
+      lineNum = 0
+      tail = ""
+      pending = list()
+      chunk = reader.read()
+      while chunk:
+        if "\r" in chunk:
+          chunk = chunk.replace("\r","")
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop()
+        pending.extend(lines)
+        start = 0
+        while len(pending) - start >= nlines:
+          yield self._records(pending[start:start+nlines],lineNum)
+          start += nlines
+          lineNum += nlines
+        del pending[:start]
+        chunk = reader.read()
+      if tail:
+        pending.append(tail)
+      while pending and not pending[-1]:
+        pending.pop()
+      if len(pending) % 4:
+        raise FileFormatError(self._fn,lineNum+len(pending),"Truncated record.")
+      if pending:
+        yield self._records(pending,lineNum)
+    finally:
+      reader.close()
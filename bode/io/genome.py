@@ -0,0 +1,251 @@
+"""Memory-mapped access to reference genomes.
+
+   ``Genome`` opens an indexed FASTA file (see ``bode.io.fasta``) or a UCSC
+   ``.2bit`` file with ``mmap``, and extracts the sequence under intervals::
+
+     genome = Genome("hg19.2bit")
+     for seq in genome.sequences(BedFile().load("peaks.bed")):
+       ...
+
+   Sequences of ``-`` strand intervals are reverse-complemented.  Nothing
+   is read up front: the operating system pages in the parts of the file
+   that are used, and since the mapping is read-only, all the processes
+   using a genome share a single copy in the page cache.  A ``Genome`` can
+   be pickled (it is reopened by name), so it can be handed to
+   ``multiprocessing`` workers.
+"""
+import mmap
+import struct
+
+import numpy
+
+from bode.io.fasta import FastaFile
+from bode.seq import Sequence, SeqType, reverseComplement, reverseComplementAll
+
+################################################################################
+
+twoBitMagic = 0x1A412743
+"""The signature at the start of every ``.2bit`` file."""
+
+_twoBitLetters = numpy.frombuffer(b"TCAG",dtype=numpy.uint8)
+
+def isTwoBit(fn):
+  """True if the named file is a ``.2bit`` file."""
+  fd = open(fn,"rb")
+  try:
+    head = fd.read(4)
+  finally:
+    fd.close()
+  return len(head) == 4 and twoBitMagic in struct.unpack("<I",head) + struct.unpack(">I",head)
+
+class Genome(object):
+  """A reference genome, in an indexed FASTA file or a ``.2bit`` file."""
+
+  def __init__(self,fn):
+    """Open a genome file.
+
+       A FASTA file is indexed (``fn`` + ``.fai``) if it is not already.
+       Compressed FASTA files cannot be memory-mapped.
+    """
+    self._fn = fn
+    self._open()
+
+  def _open(self):
+    self._fd = open(self._fn,"rb")
+    self._map = mmap.mmap(self._fd.fileno(),0,access=mmap.ACCESS_READ)
+    self._records = dict()
+    if isTwoBit(self._fn):
+      self._twoBit = True
+      self._readTwoBitIndex()
+    else:
+      self._twoBit = False
+      self._index = FastaFile(self._fn).index
+      self._names = list(self._index.names)
+
+  def __getstate__(self):
+    return {"fn":self._fn}
+
+  def __setstate__(self,state):
+    self._fn = state["fn"]
+    self._open()
+
+  def _readTwoBitIndex(self):
+    m = self._map
+    self._endian = "<" if struct.unpack("<I",m[0:4])[0] == twoBitMagic else ">"
+    version,count = struct.unpack(self._endian + "II",m[4:12])
+    offsetFormat = self._endian + ("Q" if version == 1 else "I")
+    offsetSize = struct.calcsize(offsetFormat)
+    self._names = list()
+    self._offsets = dict()
+    pos = 16
+    for i in range(0,count):
+      size = ord(m[pos])
+      name = m[pos+1:pos+1+size]
+      pos += 1 + size
+      self._offsets[name] = struct.unpack(offsetFormat,m[pos:pos+offsetSize])[0]
+      pos += offsetSize
+      self._names.append(name)
+
+  def _twoBitRecord(self,chrom):
+    """The length, N blocks, mask blocks and packed-DNA offset of a
+       ``.2bit`` sequence (read on first use)."""
+    record = self._records.get(chrom)
+    if record == None:
+      m = self._map
+      e = self._endian
+      pos = self._offsets[chrom]
+      length,nblocks = struct.unpack(e + "II",m[pos:pos+8])
+      pos += 8
+      nStarts = numpy.frombuffer(m,dtype=e + "u4",count=nblocks,offset=pos).astype(numpy.int64)
+      nEnds = nStarts + numpy.frombuffer(m,dtype=e + "u4",count=nblocks,offset=pos+4*nblocks)
+      pos += 8 * nblocks
+      mblocks = struct.unpack(e + "I",m[pos:pos+4])[0]
+      pos += 4
+      mStarts = numpy.frombuffer(m,dtype=e + "u4",count=mblocks,offset=pos).astype(numpy.int64)
+      mEnds = mStarts + numpy.frombuffer(m,dtype=e + "u4",count=mblocks,offset=pos+4*mblocks)
+      pos += 8 * mblocks + 4
+      record = (length,nStarts,nEnds,mStarts,mEnds,pos)
+      self._records[chrom] = record
+    return record
+
+  def _getNames(self):
+    return self._names
+  names = property(_getNames)
+  """The sequence (chromosome) names, in file order (get)."""
+
+  def __contains__(self,chrom):
+    return chrom in self._offsets if self._twoBit else chrom in self._index
+
+  def length(self,chrom):
+    """The length of a chromosome."""
+    if self._twoBit:
+      return self._twoBitRecord(chrom)[0]
+    return self._index.length(chrom)
+
+  def _twoBitFetch(self,chrom,left,right):
+    length,nStarts,nEnds,mStarts,mEnds,pos = self._twoBitRecord(chrom)
+    first = left // 4
+    quads = numpy.frombuffer(self._map,dtype=numpy.uint8,count=(right+3)//4-first,offset=pos+first)
+    codes = numpy.empty((len(quads),4),dtype=numpy.uint8)
+    codes[:,0] = quads >> 6
+    codes[:,1] = (quads >> 4) & 3
+    codes[:,2] = (quads >> 2) & 3
+    codes[:,3] = quads & 3
+    out = _twoBitLetters[codes.ravel()[left-4*first:right-4*first]]
+    for starts,ends,fill in ((nStarts,nEnds,None),(mStarts,mEnds,0x20)):
+      i = numpy.searchsorted(ends,left,side="right")
+      j = numpy.searchsorted(starts,right,side="left")
+      for s,e in zip(starts[i:j],ends[i:j]):
+        s = max(s,left) - left
+        e = min(e,right) - left
+        if fill == None:
+          out[s:e] = ord("N")
+        else:
+          out[s:e] |= fill
+    return out.tostring()
+
+  def fetch(self,chrom,left=0,right=None,strand="+"):
+    """The bases of a region, as a string.
+
+       :param chrom: The chromosome name.
+       :param left: The start of the region (0-based).
+       :param right: The end of the region (exclusive; default: the end of
+                     the chromosome).  Regions are clipped to the chromosome.
+       :param strand: If ``"-"``, the reverse complement is returned.
+       :rtype: str
+    """
+    if chrom not in self:
+      raise KeyError("No sequence %s in %s" % (chrom,self._fn))
+    length = self.length(chrom)
+    left = max(0,left)
+    right = length if right == None else min(right,length)
+    if left >= right:
+      return ""
+    if self._twoBit:
+      text = self._twoBitFetch(chrom,left,right)
+    else:
+      start,end = self._index.region(chrom,left,right)
+      text = self._map[start:end].translate(None,"\r\n")
+    return reverseComplement(text) if strand == "-" else text
+
+  def sequence(self,iv):
+    """The sequence under an interval (reverse-complemented if the interval
+       is on the ``-`` strand), named after the interval.
+
+       :rtype: Sequence
+    """
+    return Sequence(self.fetch(iv.chrom,iv.left,iv.right,iv.strand),name=iv.name,type=SeqType.DNA)
+
+  def sequences(self,intervals,batchSize=10000):
+    """Generate the sequences under a set of intervals (see ``sequence``).
+
+       The ``-`` strand sequences of each batch of intervals are
+       reverse-complemented together.
+
+       :param intervals: An ``IntervalSet``, or any iterable of intervals.
+       :param batchSize: The number of intervals handled at a time.
+    """
+    batch = list()
+    for iv in intervals:
+      batch.append(iv)
+      if len(batch) >= batchSize:
+        for seq in self._batchSequences(batch):
+          yield seq
+        batch = list()
+    for seq in self._batchSequences(batch):
+      yield seq
+
+  def _batchSequences(self,ivs):
+    texts = [self.fetch(iv.chrom,iv.left,iv.right) for iv in ivs]
+    minus = [i for i,iv in enumerate(ivs) if iv.strand == "-"]
+    for i,text in zip(minus,reverseComplementAll([texts[i] for i in minus])):
+      texts[i] = text
+    return [Sequence(text,name=iv.name,type=SeqType.DNA) for iv,text in zip(ivs,texts)]
+
+  def close(self):
+    if self._map != None:
+      self._map.close()
+      self._fd.close()
+      self._map = None
+
+################################################################################
+
+def writeTwoBit(fn,seqs):
+  """Write sequences to a ``.2bit`` file.
+
+     Runs of ``N`` become N blocks and lower-case runs mask blocks; any
+     other non-``ACGT`` character is stored as ``T`` (as by
+     ``faToTwoBit``).
+
+     :param fn: The name of the file.
+     :param seqs: A list of ``Sequence`` objects (names must be unique).
+  """
+  codes = numpy.zeros(256,dtype=numpy.uint8)
+  for i,c in enumerate("TCAG"):
+    codes[ord(c)] = codes[ord(c.lower())] = i
+  records = list()
+  for seq in seqs:
+    raw = numpy.frombuffer(str(seq),dtype=numpy.uint8)
+    blocks = list()
+    for flags in ((raw & 0xdf) == ord("N"),raw >= ord("a")):
+      edges = numpy.diff(numpy.concatenate(([0],flags.view(numpy.int8),[0])))
+      starts = numpy.flatnonzero(edges == 1)
+      sizes = numpy.flatnonzero(edges == -1) - starts
+      blocks.append(struct.pack("<I",len(starts)) + starts.astype("<u4").tostring() + sizes.astype("<u4").tostring())
+    padded = numpy.zeros(((len(raw) + 3) // 4) * 4,dtype=numpy.uint8)
+    padded[:len(raw)] = codes[raw]
+    quads = padded.reshape(-1,4)
+    packed = (quads[:,0] << 6) | (quads[:,1] << 4) | (quads[:,2] << 2) | quads[:,3]
+    records.append(struct.pack("<I",len(raw)) + blocks[0] + blocks[1] + struct.pack("<I",0) + packed.tostring())
+  names = [seq.name for seq in seqs]
+  offset = 16 + sum(5 + len(name) for name in names)
+  fd = open(fn,"wb")
+  try:
+    fd.write(struct.pack("<IIII",twoBitMagic,0,len(seqs),0))
+    for name,record in zip(names,records):
+      fd.write(struct.pack("<B",len(name)) + name + struct.pack("<I",offset))
+      offset += len(record)
+    for record in records:
+      fd.write(record)
+  finally:
+    fd.close()
@@ -0,0 +1,277 @@
+"""Reading HOMER ``peaks.txt`` files.
+
+   A HOMER peak file starts with ``#`` comment lines, most of the form
+   ``# name = value`` (the peak-finding parameters and statistics), and a
+   column header line starting ``#PeakID``.  Each following line describes
+   one peak: an ID, the chromosome, start, end and strand, then numeric
+   columns (tag counts, scores, fold changes, p-values).
+
+   ``HomerPeakFile`` reads a peak file as a stream of ``HomerPeak`` objects;
+   ``HomerPeakTable`` loads all the numeric columns into NumPy arrays at
+   once, for fast filtering of large numbers of files::
+
+     peaks = HomerPeakTable().load("peaks.txt")
+     strong = peaks.select(pvalueVsControl=(None,1e-8),foldChangeVsControl=(4,None))
+
+   HOMER reports 1-based, inclusive coordinates; they are converted to the
+   0-based, half-open convention of ``Interval``.
+"""
+import numpy
+
+from bode.io import IntervalSet, FileFormatError, openInput
+from bode.seq.homerPeak import HomerPeak
+
+################################################################################
+
+numericFields = ("normalizedTagCount","focusRatio","findPeaksScore",
+                 "totalTags","controlTags","foldChangeVsControl",
+                 "pvalueVsControl","foldChangeVsLocal","pvalueVsLocal",
+                 "clonalFoldChange")
+"""The numeric attributes of ``HomerPeak``, in ``peaks.txt`` column order."""
+
+_columnNames = (("normalized tag count","normalizedTagCount"),
+                ("focus ratio","focusRatio"),
+                ("findpeaks score","findPeaksScore"),
+                ("total tags","totalTags"),
+                ("control tags","controlTags"),
+                ("fold change vs control","foldChangeVsControl"),
+                ("p-value vs control","pvalueVsControl"),
+                ("fold change vs local","foldChangeVsLocal"),
+                ("p-value vs local","pvalueVsLocal"),
+                ("clonal fold change","clonalFoldChange"))
+
+def columnFields(names):
+  """Map the column names of a ``#PeakID`` header line to ``HomerPeak``
+     attributes.
+
+     :param names: The column names (the header line, split on tabs).
+     :returns: A dict mapping numeric attribute names to column indexes.
+  """
+  fields = dict()
+  for i,name in enumerate(names[5:]):
+    name = name.strip().lower()
+    for prefix,field in _columnNames:
+      if name.startswith(prefix) and field not in fields:
+        fields[field] = i + 5
+        break
+  return fields
+
+_defaultFields = dict((f,i+5) for i,f in enumerate(numericFields))
+
+class _HeaderMixin(object):
+  """Parsing of the comment header common to peak files and tables."""
+
+  def _parseHeaderLine(self,line):
+    line = line.rstrip("\r\n")
+    self._header.append(line)
+    if line.startswith("#PeakID"):
+      self._columns = line[1:].split("\t")
+      self._fields = columnFields(self._columns)
+    elif "=" in line:
+      name,value = line[1:].split("=",1)
+      self._parameters[name.strip()] = value.strip()
+
+  def _getParameters(self):
+    return self._parameters
+  parameters = property(_getParameters)
+  """The ``name = value`` pairs of the file header (get)."""
+
+################################################################################
+
+class HomerPeakFile(_HeaderMixin,IntervalSet):
+  """A HOMER ``peaks.txt`` file, read as ``HomerPeak`` objects."""
+
+  def __init__(self,keep=True):
+    super(HomerPeakFile,self).__init__(keep=keep)
+    self._parameters = dict()
+    self._columns = None
+    self._fields = _defaultFields
+    self._nextLine = None
+
+  @classmethod
+  def loadTable(cls,fn):
+    """Load a peak file in bulk, as a ``HomerPeakTable``."""
+    return HomerPeakTable().load(fn)
+
+  def readHeader(self):
+    """Read the comment lines, keeping the first data line for ``read()``."""
+    self._parameters = dict()
+    self._fields = _defaultFields
+    line = self._fd.readline()
+    self._lineNum += 1
+    while line.startswith("#"):
+      self._parseHeaderLine(line)
+      line = self._fd.readline()
+      self._lineNum += 1
+    self._nextLine = line
+
+  def read(self):
+    """Parse the next peak from the file.
+
+       :rtype: HomerPeak (or ``None`` at end of file)
+    """
+    if self._nextLine != None:
+      line = self._nextLine
+      self._nextLine = None
+    else:
+      line = self._fd.readline()
+      self._lineNum += 1
+    while line and not line.strip():
+      line = self._fd.readline()
+      self._lineNum += 1
+    if not line:
+      return None
+    return self.parseLine(line)
+
+  def parseLine(self,line):
+    """Construct a ``HomerPeak`` from one line of a peak file."""
+    flds = line.rstrip("\r\n").split("\t")
+    if len(flds) < 5:
+      raise FileFormatError(self._fn,self._lineNum,"Need >= 5 fields in line.")
+    try:
+      values = [float(flds[self._fields[f]]) if f in self._fields and self._fields[f] < len(flds) else None for f in numericFields]
+      return HomerPeak(flds[1],int(flds[2])-1,int(flds[3]),flds[0],flds[4],*values)
+    except ValueError:
+      raise FileFormatError(self._fn,self._lineNum,"Non-numeric coordinate or value.")
+
+################################################################################
+
+class HomerPeakTable(_HeaderMixin):
+  """A HOMER peak file loaded into NumPy arrays.
+
+     The columns are available from ``column(name)``; ``name`` may be
+     ``peakIds``, ``chroms``, ``lefts``, ``rights``, ``strands`` or any of
+     ``numericFields``.  Numeric columns missing from the file are filled
+     with NaN.  Indexing or iterating the table yields ``HomerPeak``
+     objects, built on demand.
+  """
+
+  def __init__(self):
+    self._fn = None
+    self._header = list()
+    self._parameters = dict()
+    self._columns = None
+    self._fields = _defaultFields
+    self._data = dict()
+    self._size = 0
+
+  def load(self,fn,fd=None):
+    """Load a whole peak file.
+
+       Once every line has been checked to have the same number of
+       (tab-separated) fields, the file is split into fields in a single
+       pass, and all the numeric columns are converted to ``float64`` with
+       a single NumPy operation.
+
+       :rtype: HomerPeakTable (``self``)
+    """
+    self._fn = fn
+    if fd == None:
+      fd = openInput(fn)
+    try:
+      text = fd.read()
+    finally:
+      fd.close()
+    start = 0
+    while text.startswith("#",start):
+      end = text.find("\n",start)
+      end = len(text) if end < 0 else end + 1
+      self._parseHeaderLine(text[start:end])
+      start = end
+    lines = text[start:].splitlines()
+    ncol = len(self._columns) if self._columns != None else (len(lines[0].split("\t")) if lines else 15)
+    if lines and all(line.count("\t") == ncol - 1 for line in lines):
+      tokens = "\t".join(lines).split("\t")
+    else:
+      tokens = list()
+      for i,line in enumerate(lines):
+        flds = line.split("\t")
+        if len(flds) == 1 and not flds[0].strip():
+          continue
+        if len(flds) != ncol:
+          raise FileFormatError(fn,len(self._header)+i+1,"Expected %d fields." % (ncol,))
+        tokens.extend(flds)
+    table = numpy.array(tokens).reshape(len(tokens) // ncol,ncol)
+    self._size = table.shape[0]
+    try:
+      self._data = {"peakIds":table[:,0],
+                    "chroms":table[:,1],
+                    "lefts":table[:,2].astype(numpy.int64) - 1,
+                    "rights":table[:,3].astype(numpy.int64),
+                    "strands":table[:,4]}
+      cols = [self._fields.get(f) for f in numericFields]
+      present = [c for c in cols if c != None and c < ncol]
+      values = table[:,present].astype(numpy.float64)
+    except ValueError:
+      raise FileFormatError(fn,None,"Non-numeric coordinate or value.")
+    for f,c in zip(numericFields,cols):
+      if c != None and c < ncol:
+        self._data[f] = values[:,present.index(c)].copy()
+      else:
+        self._data[f] = numpy.repeat(numpy.nan,self._size)
+    return self
+
+  def __len__(self):
+    return self._size
+
+  def column(self,name):
+    """The named column, as a NumPy array."""
+    return self._data[name]
+
+  def __getitem__(self,i):
+    if i < 0:
+      i += self._size
+    if i < 0 or i >= self._size:
+      raise IndexError("HomerPeakTable index out of range")
+    d = self._data
+    values = [None if numpy.isnan(d[f][i]) else float(d[f][i]) for f in numericFields]
+    return HomerPeak(str(d["chroms"][i]),int(d["lefts"][i]),int(d["rights"][i]),
+                     str(d["peakIds"][i]),str(d["strands"][i]),*values)
+
+  def __iter__(self):
+    for i in range(0,self._size):
+      yield self[i]
+
+  def mask(self,**ranges):
+    """A boolean mask of the peaks whose columns lie in the given ranges.
+
+       Each keyword names a column and gives a ``(min,max)`` pair; either
+       bound may be ``None``.  Bounds are inclusive.
+
+       :rtype: numpy.ndarray
+    """
+    m = numpy.ones(self._size,dtype=bool)
+    for name,(lo,hi) in ranges.items():
+      col = self._data[name]
+      if lo != None:
+        m &= col >= lo
+      if hi != None:
+        m &= col <= hi
+    return m
+
+  def filter(self,selector):
+    """A new table holding the selected peaks (by mask, indices or slice)."""
+    ht = HomerPeakTable()
+    ht._fn = self._fn
+    ht._header = list(self._header)
+    ht._parameters = dict(self._parameters)
+    ht._columns = self._columns
+    ht._fields = self._fields
+    ht._data = dict((k,v[selector]) for k,v in self._data.items())
+    ht._size = len(ht._data["lefts"])
+    return ht
+
+  def select(self,**ranges):
+    """A new table of the peaks whose columns lie in the given ranges
+       (see ``mask``)."""
+    return self.filter(self.mask(**ranges))
+
+def filterFiles(fns,**ranges):
+  """Load many peak files in bulk, keeping the peaks in the given ranges.
+
+     :param fns: The names of the peak files.
+     :param ranges: Column ranges, as for ``HomerPeakTable.mask``.
+     :returns: A generator of ``(fn,table)`` pairs.
+  """
+  for fn in fns:
+    yield fn,HomerPeakTable().load(fn).select(**ranges)
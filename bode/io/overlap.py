@@ -0,0 +1,134 @@
+"""Overlap queries on sets of intervals, using nested containment lists.
+
+   A nested containment list (NCList; Alekseyenko & Lee, 2007) stores each
+   chromosome's intervals as a list in which no interval contains another,
+   sorted by left endpoint.  Intervals contained in another interval are
+   stored in a sublist belonging to their container.  Within any one list
+   both endpoints are sorted, so the first overlapping interval can be found
+   by binary search, and a query for a region costs O(log n + k) for k hits.
+"""
+from bisect import bisect_right
+
+################################################################################
+
+class IntervalIndex(object):
+  """An index answering overlap queries over a set of intervals.
+
+     Intervals are half-open (``[left,right)``), as for ``Interval``; an
+     interval overlaps a query region if it shares at least one position
+     with it.  Each indexed interval carries an arbitrary ``item``, returned
+     by queries (by default, the interval itself).
+  """
+
+  def __init__(self,intervals=None):
+    """Create an index, optionally adding a collection of intervals.
+
+       :param intervals: ``Interval`` objects to add to the index.
+    """
+    self._entries = dict()
+    self._lists = None
+    self._count = 0
+    if intervals != None:
+      for iv in intervals:
+        self.add(iv.chrom,iv.left,iv.right,iv)
+
+  def __len__(self):
+    return self._count
+
+  def add(self,chrom,left,right,item):
+    """Add an interval to the index.
+
+       :param chrom: The chromosome name.
+       :param left: The left end of the interval.
+       :param right: The right end of the interval.
+       :param item: The object returned when the interval matches a query.
+    """
+    self._entries.setdefault(chrom,[]).append((left,-right,self._count,item))
+    self._count += 1
+    self._lists = None
+
+  def _build(self):
+    """Build the nested containment lists for every chromosome."""
+    self._lists = dict()
+    for chrom,entries in self._entries.items():
+      entries.sort(key=lambda e:e[:3])
+      top = ([],[],[],[])
+      stack = [(top,-1,None)]
+      for left,negRight,_,item in entries:
+        right = -negRight
+        while stack[-1][2] != None and right > stack[-1][2]:
+          stack.pop()
+        parent,idx,_ = stack[-1]
+        if idx < 0:
+          target = parent
+        else:
+          target = parent[3][idx]
+          if target == None:
+            target = ([],[],[],[])
+            parent[3][idx] = target
+        target[0].append(left)
+        target[1].append(right)
+        target[2].append(item)
+        target[3].append(None)
+        stack.append((target,len(target[0])-1,right))
+      self._lists[chrom] = top
+
+  def _query(self,nclist,left,right,out):
+    pending = [nclist]
+    while pending:
+      lefts,rights,items,children = pending.pop()
+      i = bisect_right(rights,left)
+      n = len(lefts)
+      while i < n and lefts[i] < right:
+        out.append(items[i])
+        if children[i] != None:
+          pending.append(children[i])
+        i += 1
+
+  def overlapping(self,chrom,left,right=None):
+    """Find the intervals overlapping a region or a single position.
+
+       :param chrom: The chromosome name.
+       :param left: The left end of the region (counting from 0).
+       :param right: One past the right end of the region (default
+                     ``left+1``, i.e. a point query).
+       :returns: The items of the overlapping intervals, in no particular
+                 order.
+       :rtype: list
+    """
+    if self._lists == None:
+      self._build()
+    if right == None:
+      right = left + 1
+    out = list()
+    nclist = self._lists.get(chrom)
+    if nclist != None:
+      self._query(nclist,left,right,out)
+    return out
+
+  def count(self,chrom,left,right=None):
+    """The number of intervals overlapping a region or position."""
+    return len(self.overlapping(chrom,left,right))
+
+  def overlapsAny(self,chrom,left,right=None):
+    """True if any interval overlaps the region or position."""
+    if self._lists == None:
+      self._build()
+    if right == None:
+      right = left + 1
+    nclist = self._lists.get(chrom)
+    if nclist == None:
+      return False
+    i = bisect_right(nclist[1],left)
+    return i < len(nclist[0]) and nclist[0][i] < right
+
+  def queryAll(self,intervals):
+    """Query the index with every interval of a second collection.
+
+       :param intervals: An iterable of ``Interval`` objects (for instance,
+                         an ``IntervalSet``).
+       :returns: A generator of ``(query,hits)`` pairs, where ``hits`` is the
+                 list returned by ``overlapping`` for ``query``.
+    """
+    for iv in intervals:
+      yield iv,self.overlapping(iv.chrom,iv.left,iv.right)
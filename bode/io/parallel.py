@@ -0,0 +1,203 @@
+"""Parallel loading of large BED files.
+
+   The file is split into byte ranges whose boundaries are moved forward to
+   the next line start, so that every line falls into exactly one range.
+   A pool of worker processes parses the ranges independently, and the
+   results are joined back together in file order::
+
+     peaks = parallelLoad("reads.bed",processes=16)
+
+   Columnar loading (the default) is much faster than building ``Bed``
+   objects, since the workers return compact arrays rather than pickled
+   objects.
+"""
+import os
+import multiprocessing
+
+import numpy
+
+from bode.io import FileFormatError
+from bode.io.bgzf import isGzip
+from bode.io.bed import BedFile
+from bode.io.columnar import ColumnarBedFile
+
+################################################################################
+
+def dataStart(fn,prefixes=BedFile.headerPrefixes):
+  """Find the header lines of a file, and the offset of its first data line.
+
+     :returns: A ``(header,offset)`` pair.
+  """
+  header = list()
+  fd = open(fn,"rb")
+  try:
+    offset = 0
+    line = fd.readline()
+    while line and line.startswith(prefixes):
+      header.append(line.rstrip("\r\n"))
+      offset = fd.tell()
+      line = fd.readline()
+  finally:
+    fd.close()
+  return header,offset
+
+def byteRanges(fn,nranges,start=0):
+  """Split a file into byte ranges aligned to line boundaries.
+
+     :param fn: The name of the file.
+     :param nranges: The (maximum) number of ranges.
+     :param start: The offset at which the first range starts.
+     :returns: A list of ``(start,end)`` offsets; ranges are contiguous and
+               each one starts at the beginning of a line.
+  """
+  size = os.path.getsize(fn)
+  bounds = [start]
+  fd = open(fn,"rb")
+  try:
+    for i in range(1,nranges):
+      pos = start + (size - start) * i // nranges
+      if pos <= bounds[-1]:
+        continue
+      fd.seek(pos-1)
+      fd.readline()
+      pos = fd.tell()
+      if pos >= size:
+        break
+      if pos > bounds[-1]:
+        bounds.append(pos)
+  finally:
+    fd.close()
+  bounds.append(size)
+  return [(bounds[i],bounds[i+1]) for i in range(0,len(bounds)-1) if bounds[i+1] > bounds[i]]
+
+def _readRange(fn,start,end):
+  fd = open(fn,"rb")
+  try:
+    fd.seek(start)
+    return fd.read(end-start)
+  finally:
+    fd.close()
+
+def _lineNumber(fn,offset,chunkSize=1<<20):
+  """The number of lines of a file before a byte offset."""
+  count = 0
+  fd = open(fn,"rb")
+  try:
+    while offset > 0:
+      chunk = fd.read(min(chunkSize,offset))
+      if not chunk:
+        break
+      count += chunk.count("\n")
+      offset -= len(chunk)
+  finally:
+    fd.close()
+  return count
+
+def _badLine(fn,text):
+  """The number (in ``text``) of the first line rejected by the ``Bed``
+     parser, and the error message, or ``(None,None)``."""
+  bf = BedFile()
+  bf._fn = fn
+  for line in text.splitlines():
+    bf._lineNum += 1
+    flds = line.split()
+    if flds:
+      try:
+        bf.parseFields(flds)
+      except FileFormatError as e:
+        return e.line,e.msg
+  return None,None
+
+def _parseRange(args):
+  """Worker: parse one byte range, into arrays or ``Bed`` objects."""
+  fn,start,end,columnar = args
+  text = _readRange(fn,start,end)
+  try:
+    if columnar:
+      cb = ColumnarBedFile()
+      cb._fn = fn
+      cb.parse(text,header=False)
+      return (cb.chromNames,cb.chroms,cb.lefts,cb.rights,cb.strands,cb.scores,cb.names)
+    bf = BedFile()
+    bf._fn = fn
+    beds = list()
+    for line in text.splitlines():
+      bf._lineNum += 1
+      flds = line.split()
+      if flds:
+        beds.append(bf.parseFields(flds))
+    return beds
+  except FileFormatError as e:
+    # the line within the range (the columnar parser may not know it),
+    # then within the file
+    line,msg = (e.line,e.msg) if e.line != None else _badLine(fn,text)
+    if line == None:
+      raise FileFormatError(fn,None,"%s (in bytes %d-%d)" % (e.msg,start,end))
+    raise FileFormatError(fn,_lineNumber(fn,start) + line,msg)
+
+def _stitch(fn,header,chunks):
+  """Join the column arrays parsed from consecutive byte ranges."""
+  chromIndex = dict()
+  parts = [[],[],[],[],[],[]]
+  named = any(chunk[6] is not None for chunk in chunks)
+  for chromNames,chroms,lefts,rights,strands,scores,names in chunks:
+    remap = numpy.array([chromIndex.setdefault(c,len(chromIndex)) for c in chromNames],dtype=numpy.int32)
+    parts[0].append(remap[chroms] if len(chroms) else chroms.astype(numpy.int32))
+    parts[1].append(lefts)
+    parts[2].append(rights)
+    parts[3].append(strands)
+    parts[4].append(scores)
+    if named:
+      parts[5].append(names if names is not None else numpy.array([None]*len(lefts),dtype=object))
+  chromNames = [None] * len(chromIndex)
+  for c,i in chromIndex.items():
+    chromNames[i] = c
+  cb = ColumnarBedFile()
+  cb._fn = fn
+  cb._header = header
+  if chunks:
+    cb._setColumns(chromNames,numpy.concatenate(parts[0]),
+                   numpy.concatenate(parts[1]),numpy.concatenate(parts[2]),
+                   numpy.concatenate(parts[3]),numpy.concatenate(parts[4]),
+                   numpy.concatenate(parts[5]) if named else None)
+  return cb
+
+def parallelLoad(fn,processes=None,columnar=True,rangesPerProcess=4,minRangeSize=1<<20):
+  """Load a BED file using several processes.
+
+     :param fn: The name of the BED file.  Compressed files cannot be split
+                into byte ranges, so they are loaded by a single process.
+     :param processes: The number of worker processes (default: the number
+                       of CPUs).
+     :param columnar: If ``True``, return a ``ColumnarBedFile``; otherwise a
+                      ``BedFile`` holding ``Bed`` objects.
+     :param rangesPerProcess: Ranges per process, to balance the load.
+     :param minRangeSize: The smallest byte range worth handing to a
+                          worker; small files are parsed in this process.
+     :rtype: ColumnarBedFile or BedFile
+  """
+  if isGzip(fn):
+    return ColumnarBedFile().load(fn) if columnar else BedFile().load(fn,lazy=False)
+  if processes == None:
+    processes = multiprocessing.cpu_count()
+  header,start = dataStart(fn)
+  size = os.path.getsize(fn)
+  nranges = max(1,min(processes * rangesPerProcess,(size - start) // minRangeSize))
+  tasks = [(fn,s,e,columnar) for s,e in byteRanges(fn,nranges,start)]
+  if len(tasks) <= 1 or processes <= 1:
+    results = [_parseRange(t) for t in tasks]
+  else:
+    pool = multiprocessing.Pool(processes)
+    try:
+      results = pool.map(_parseRange,tasks,chunksize=1)
+    finally:
+      pool.close()
+      pool.join()
+  if columnar:
+    return _stitch(fn,header,results)
+  bf = BedFile()
+  bf._fn = fn
+  bf._header = header
+  for beds in results:
+    bf._intervals.extend(beds)
+  return bf
@@ -0,0 +1,358 @@
+"""Coverage ("pileup") tracks built from sets of intervals.
+
+   ``Pileup`` counts, for every base of every chromosome, the number of
+   intervals covering it.  Each interval adds +1 at its left end and -1 at
+   its right end to a difference array; the running sum (``cumsum``) of the
+   sorted differences is the coverage.  Only the positions where the
+   coverage changes are kept, as runs of constant coverage, so memory grows
+   with the number of intervals, not with the size of the genome::
+
+     pile = Pileup().add(BedFile().load("reads.bed"))
+     pile.writeBedGraph("reads.bedGraph")
+     pile.save("reads.bcov")
+
+   The input is processed in one streaming pass; sorted input (each
+   chromosome contiguous) keeps only one chromosome's pending intervals in
+   memory.  A ``ColumnarIntervalSet`` is processed without building
+   interval objects at all.
+
+   ``save`` writes a compact binary file in the spirit of bigWig: the runs
+   of each chromosome, plus "zoom levels" of mean coverage in fixed bins
+   (1 kb, 10 kb, ... by default), each compressed separately (run starts
+   as gaps from the previous start, which compress better), so that
+   summaries of large regions can be read without the full-resolution
+   data.  ``CoverageTrack`` reads these files.
+"""
+import zlib
+import struct
+
+import numpy
+
+from bode.seq import chromKey
+
+################################################################################
+
+magic = "BCOV"
+"""The signature at the start of a binary coverage file."""
+
+version = 1
+
+defaultZoomLevels = (1000,10000,100000,1000000)
+"""The bin sizes of the zoom levels written by default."""
+
+flushSize = 1 << 22
+"""The number of pending intervals of a chromosome that are folded into its
+   runs at a time."""
+
+def _runsFromEvents(positions,deltas):
+  """Runs of constant coverage from (unsorted) coverage changes.
+
+     :returns: ``(starts,values)``: the coverage is ``values[i]`` from
+               ``starts[i]`` up to ``starts[i+1]``, and 0 before the first
+               start and after the last (whose value is always 0).
+  """
+  if not len(positions):
+    return numpy.zeros(0,dtype=numpy.int64),numpy.zeros(0,dtype=numpy.int32)
+  order = numpy.argsort(positions,kind="mergesort")
+  positions = positions[order]
+  deltas = deltas[order]
+  first = numpy.concatenate(([0],numpy.flatnonzero(positions[1:] != positions[:-1]) + 1))
+  deltas = numpy.add.reduceat(deltas,first)
+  keep = deltas != 0
+  return positions[first][keep],numpy.cumsum(deltas[keep]).astype(numpy.int32)
+
+def _events(starts,values):
+  """The coverage changes of a set of runs (the inverse of
+     ``_runsFromEvents``)."""
+  return starts,numpy.diff(numpy.concatenate(([0],values.astype(numpy.int64))))
+
+def _integral(starts,values,xs):
+  """The total coverage of the bases before each position in ``xs``."""
+  if not len(starts):
+    return numpy.zeros(len(xs),dtype=numpy.float64)
+  widths = numpy.diff(starts)
+  area = numpy.concatenate(([0],numpy.cumsum(widths * values[:-1].astype(numpy.float64))))
+  i = numpy.searchsorted(starts,xs,side="right") - 1
+  inside = i >= 0
+  j = numpy.maximum(i,0)
+  return numpy.where(inside,area[j] + values[j] * (xs - starts[j]),0.0)
+
+def _binMeans(starts,values,left,right,binSize):
+  """The mean coverage in consecutive bins of ``[left,right)`` (the last
+     bin may be short)."""
+  edges = numpy.append(numpy.arange(left,right,binSize),right)
+  return numpy.diff(_integral(starts,values,edges)) / numpy.diff(edges)
+
+def _perBase(starts,values,left,right):
+  """The coverage of each base of ``[left,right)``."""
+  if right <= left:
+    return numpy.zeros(0,dtype=numpy.int32)
+  i = max(0,numpy.searchsorted(starts,left,side="right") - 1)
+  j = numpy.searchsorted(starts,right,side="left")
+  bounds = numpy.concatenate(([left],numpy.clip(starts[i:j],left,right),[right]))
+  return numpy.repeat(numpy.concatenate(([0],values[i:j])).astype(numpy.int32),numpy.diff(bounds))
+
+class _RunsAccess(object):
+  """Queries on per-chromosome runs (``_runs(chrom)``)."""
+
+  def values(self,chrom,left,right):
+    """The coverage of each base of a region, as an ``int32`` array."""
+    starts,values = self._runs(chrom)
+    return _perBase(starts,values,left,right)
+
+  def binned(self,chrom,binSize,left=0,right=None):
+    """The mean coverage in bins of a chromosome (or region of one).
+
+       :param binSize: The size of the bins.
+       :param right: The end of the region (default: the chromosome end).
+       :rtype: numpy.ndarray (of ``float64``)
+    """
+    starts,values = self._runs(chrom)
+    if right == None:
+      right = self.length(chrom)
+    return _binMeans(starts,values,left,right,binSize)
+
+  def summary(self,chrom,left,right,nbins):
+    """The mean coverage in ``nbins`` equal bins of a region.
+
+       :rtype: numpy.ndarray (of ``float64``)
+    """
+    starts,values = self._runs(chrom)
+    edges = numpy.linspace(left,right,nbins + 1)
+    return numpy.diff(_integral(starts,values,edges)) / numpy.diff(edges)
+
+################################################################################
+
+class Pileup(_RunsAccess):
+  """The coverage of a genome by a set of intervals."""
+
+  def __init__(self,chromSizes=None):
+    """Create an empty pileup.
+
+       :param chromSizes: A dict of chromosome lengths (optional; otherwise
+                          a chromosome ends where its last interval does).
+    """
+    self._chromSizes = dict(chromSizes or {})
+    self._runsByChrom = dict()
+    self._ends = dict()
+    self._pending = None
+    self._lefts = list()
+    self._rights = list()
+
+  def _fold(self,chrom,lefts,rights):
+    """Add intervals (as arrays of ends) to the runs of a chromosome."""
+    if not len(lefts):
+      return
+    positions = [lefts,rights]
+    deltas = [numpy.ones(len(lefts),dtype=numpy.int64),numpy.repeat(numpy.int64(-1),len(rights))]
+    if chrom in self._runsByChrom:
+      p,d = _events(*self._runsByChrom[chrom])
+      positions.append(p)
+      deltas.append(d)
+    self._runsByChrom[chrom] = _runsFromEvents(numpy.concatenate(positions),numpy.concatenate(deltas))
+    self._ends[chrom] = max(self._ends.get(chrom,0),int(rights.max()))
+
+  def _flush(self):
+    if self._pending != None:
+      self._fold(self._pending,numpy.array(self._lefts,dtype=numpy.int64),
+                 numpy.array(self._rights,dtype=numpy.int64))
+    self._lefts = list()
+    self._rights = list()
+
+  def add(self,intervals):
+    """Add the coverage of a set of intervals.
+
+       :param intervals: An ``IntervalSet`` (a ``ColumnarIntervalSet`` is
+                         handled as arrays) or any iterable of intervals.
+       :rtype: Pileup (``self``)
+    """
+    if hasattr(intervals,"lefts") and hasattr(intervals,"chromNames"):
+      chroms = intervals.chroms
+      order = numpy.argsort(chroms,kind="mergesort")
+      bounds = numpy.searchsorted(chroms[order],numpy.arange(len(intervals.chromNames)+1))
+      lefts = intervals.lefts[order]
+      rights = intervals.rights[order]
+      for c,name in enumerate(intervals.chromNames):
+        for s in range(bounds[c],bounds[c+1],flushSize):
+          e = min(s + flushSize,bounds[c+1])
+          self._fold(name,lefts[s:e].astype(numpy.int64),rights[s:e].astype(numpy.int64))
+      return self
+    for iv in intervals:
+      if iv.chrom != self._pending or len(self._lefts) >= flushSize:
+        self._flush()
+        self._pending = iv.chrom
+      self._lefts.append(iv.left)
+      self._rights.append(iv.right)
+    self._flush()
+    self._pending = None
+    return self
+
+  def _getChroms(self):
+    return sorted(self._runsByChrom,key=chromKey)
+  chroms = property(_getChroms)
+  """The chromosomes with any coverage, in sort order (get)."""
+
+  def length(self,chrom):
+    """The length of a chromosome (given, or the end of its last interval)."""
+    return self._chromSizes.get(chrom,self._ends.get(chrom,0))
+
+  def _runs(self,chrom):
+    return self._runsByChrom.get(chrom,(numpy.zeros(0,dtype=numpy.int64),numpy.zeros(0,dtype=numpy.int32)))
+
+  def runs(self,chrom):
+    """The runs of constant coverage of a chromosome.
+
+       :returns: ``(starts,values)`` arrays; the coverage is ``values[i]``
+                 from ``starts[i]`` to ``starts[i+1]``, and 0 elsewhere.
+    """
+    return self._runs(chrom)
+
+  def writeBedGraph(self,fn,name=None,batchSize=100000):
+    """Write the coverage in bedGraph format (regions of zero coverage are
+       left out).
+
+       :param fn: The name of the file.
+       :param name: The track name, for the ``track`` line.
+    """
+    fd = open(fn,"w")
+    try:
+      fd.write("track type=bedGraph%s\n" % (' name="%s"' % (name,) if name != None else "",))
+      for chrom in self.chroms:
+        starts,values = self._runs(chrom)
+        nonzero = numpy.flatnonzero(values[:-1])
+        ends = starts[1:]
+        for b in range(0,len(nonzero),batchSize):
+          rows = nonzero[b:b+batchSize]
+          fd.write("".join(["%s\t%d\t%d\t%d\n" % (chrom,s,e,v) for s,e,v in
+                            zip(starts[rows].tolist(),ends[rows].tolist(),values[rows].tolist())]))
+    finally:
+      fd.close()
+
+  def save(self,fn,zoomLevels=defaultZoomLevels,level=1):
+    """Write the coverage to a binary coverage file (see ``CoverageTrack``).
+
+       :param zoomLevels: The bin sizes of the zoom levels.
+       :param level: The zlib compression level (higher levels make files
+                     slightly smaller, but are several times slower).
+    """
+    chroms = self.chroms
+    blocks = list()
+    for chrom in chroms:
+      starts,values = self._runs(chrom)
+      length = self.length(chrom)
+      gaps = numpy.diff(numpy.concatenate(([0],starts)))
+      data = [zlib.compress(gaps.astype("<u4").tostring() + values.astype("<i4").tostring(),level)]
+      for size in zoomLevels:
+        data.append(zlib.compress(_binMeans(starts,values,0,length,size).astype("<f4").tostring(),level))
+      blocks.append((chrom,length,len(starts),data))
+    header = [struct.pack("<4sIII",magic,version,len(chroms),len(zoomLevels)),
+              struct.pack("<%dI" % (len(zoomLevels),),*zoomLevels)]
+    offset = sum(len(h) for h in header)
+    offset += sum(2 + len(chrom) + 16 + 16 * len(data) for chrom,length,nruns,data in blocks)
+    for chrom,length,nruns,data in blocks:
+      header.append(struct.pack("<H",len(chrom)) + chrom + struct.pack("<QQ",length,nruns))
+      for d in data:
+        header.append(struct.pack("<QQ",offset,len(d)))
+        offset += len(d)
+    fd = open(fn,"wb")
+    try:
+      fd.write("".join(header))
+      for chrom,length,nruns,data in blocks:
+        for d in data:
+          fd.write(d)
+    finally:
+      fd.close()
+
+################################################################################
+
+class CoverageTrack(_RunsAccess):
+  """A binary coverage file written by ``Pileup.save``.
+
+     Each chromosome's runs, and each zoom level, are read and decompressed
+     only when first needed.
+  """
+
+  def __init__(self,fn):
+    self._fn = fn
+    self._fd = open(fn,"rb")
+    head = self._fd.read(16)
+    if len(head) < 16 or head[:4] != magic:
+      raise IOError("Not a coverage file: %s" % (fn,))
+    ver,nchrom,nzoom = struct.unpack("<III",head[4:16])
+    self._zoomLevels = struct.unpack("<%dI" % (nzoom,),self._fd.read(4 * nzoom))
+    self._chroms = list()
+    self._entries = dict()
+    for i in range(0,nchrom):
+      size = struct.unpack("<H",self._fd.read(2))[0]
+      chrom = self._fd.read(size)
+      length,nruns = struct.unpack("<QQ",self._fd.read(16))
+      blocks = [struct.unpack("<QQ",self._fd.read(16)) for j in range(0,nzoom+1)]
+      self._chroms.append(chrom)
+      self._entries[chrom] = (length,nruns,blocks)
+    self._cache = dict()
+
+  def _block(self,chrom,i):
+    key = (chrom,i)
+    if key not in self._cache:
+      offset,size = self._entries[chrom][2][i]
+      self._fd.seek(offset)
+      self._cache[key] = zlib.decompress(self._fd.read(size))
+    return self._cache[key]
+
+  def _getChroms(self):
+    return self._chroms
+  chroms = property(_getChroms)
+  """The chromosomes in the file (get)."""
+
+  def _getZoomLevels(self):
+    return self._zoomLevels
+  zoomLevels = property(_getZoomLevels)
+  """The bin sizes of the zoom levels (get)."""
+
+  def length(self,chrom):
+    """The length of a chromosome."""
+    return self._entries[chrom][0]
+
+  def _runs(self,chrom):
+    if chrom not in self._entries:
+      return numpy.zeros(0,dtype=numpy.int64),numpy.zeros(0,dtype=numpy.int32)
+    nruns = self._entries[chrom][1]
+    data = self._block(chrom,0)
+    starts = numpy.cumsum(numpy.frombuffer(data,dtype="<u4",count=nruns),dtype=numpy.int64)
+    values = numpy.frombuffer(data,dtype="<i4",count=nruns,offset=4*nruns)
+    return starts,values
+
+  def zoom(self,chrom,binSize):
+    """The mean coverage in the bins of a zoom level.
+
+       :param binSize: One of ``zoomLevels``.
+       :rtype: numpy.ndarray (of ``float32``)
+    """
+    return numpy.frombuffer(self._block(chrom,1 + self._zoomLevels.index(binSize)),dtype="<f4")
+
+  def summary(self,chrom,left,right,nbins):
+    """The mean coverage in ``nbins`` equal bins of a region.
+
+       The coarsest zoom level with bins no larger than the requested ones
+       is used (the full-resolution runs if there is none), so large
+       regions are summarised without reading the runs.  Zoom-level
+       summaries are approximate where bin edges do not line up.
+
+       :rtype: numpy.ndarray (of ``float64``)
+    """
+    width = float(right - left) / nbins
+    usable = [z for z in self._zoomLevels if z <= width]
+    if not usable:
+      return super(CoverageTrack,self).summary(chrom,left,right,nbins)
+    edges = numpy.linspace(left,right,nbins + 1)
+    size = max(usable)
+    means = self.zoom(chrom,size).astype(numpy.float64)
+    length = self.length(chrom)
+    bounds = numpy.minimum(numpy.arange(len(means) + 1) * size,length)
+    area = numpy.concatenate(([0],numpy.cumsum(means * numpy.diff(bounds))))
+    return numpy.diff(numpy.interp(edges,bounds,area)) / numpy.diff(edges)
+
+  def close(self):
+    if self._fd != None:
+      self._fd.close()
+      self._fd = None
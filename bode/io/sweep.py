@@ -0,0 +1,227 @@
+"""Set operations on coordinate-sorted streams of intervals.
+
+   The functions here implement ``bedtools``-style operations (``intersect``,
+   ``merge``, ``subtract``, ``closest``, ``coverage``) as a single sweep along
+   the genome.  Each input is read once, in order, so the operations run in
+   O(n+m) time (plus the size of the output) and hold in memory only the
+   intervals of the second input that overlap the current position.
+
+   Inputs may be any iterables of ``Interval`` objects (lists, ``IntervalSet``
+   objects, generators), and must be sorted in the order defined by
+   ``Interval`` comparison: by chromosome (see ``bode.seq.chromCompare``), then
+   left endpoint.  A ``ValueError`` is raised if an input is found to be out
+   of order.  Results are generated lazily, in the order of the first input.
+"""
+import copy
+
+from bode.seq import Interval, chromCompare
+
+################################################################################
+
+def _checkOrder(prev,cur):
+  if prev != None:
+    if prev.chrom != cur.chrom:
+      if chromCompare(prev.chrom,cur.chrom) > 0:
+        raise ValueError("Intervals not sorted: %s after %s" % (cur,prev))
+    elif prev.left > cur.left:
+      raise ValueError("Intervals not sorted: %s after %s" % (cur,prev))
+  return cur
+
+def _piece(iv,left,right):
+  """A copy of ``iv`` with new endpoints."""
+  piece = copy.copy(iv)
+  piece.left = left
+  piece.right = right
+  return piece
+
+class _Sweep(object):
+  """Sweeps along a sorted stream ``b``, tracking the intervals near the
+     current position of a second sorted stream.
+
+     For each interval ``x`` passed to ``advance``, the window holds the
+     intervals of ``b`` read so far that are on the same chromosome and do
+     not end before ``x`` starts; this includes every interval overlapping
+     ``x``.  ``upstream`` holds, for each strand, the interval with the
+     rightmost right end among those that do end before ``x``.
+  """
+
+  def __init__(self,b):
+    self._b = iter(b)
+    self._prevB = None
+    self._prevA = None
+    self.chrom = None
+    self.window = list()
+    self.upstream = dict()
+    self.nextB = self._pull()
+
+  def _pull(self):
+    for iv in self._b:
+      self._prevB = _checkOrder(self._prevB,iv)
+      return iv
+    return None
+
+  def advance(self,x):
+    self._prevA = _checkOrder(self._prevA,x)
+    if x.chrom != self.chrom:
+      self.chrom = x.chrom
+      self.window = list()
+      self.upstream = dict()
+      while self.nextB != None and self.nextB.chrom != x.chrom and chromCompare(self.nextB.chrom,x.chrom) < 0:
+        self.nextB = self._pull()
+    while self.nextB != None and self.nextB.chrom == x.chrom and self.nextB.left < x.right:
+      self.window.append(self.nextB)
+      self.nextB = self._pull()
+    keep = list()
+    for y in self.window:
+      if y.right > x.left:
+        keep.append(y)
+      else:
+        up = self.upstream.get(y.strand)
+        if up == None or y.right >= up.right:
+          self.upstream[y.strand] = y
+    self.window = keep
+
+  def hits(self,x,sameStrand=False):
+    """The intervals of ``b`` overlapping ``x``, in sorted order."""
+    return [y for y in self.window if y.left < x.right and y.right > x.left and (not sameStrand or y.strand == x.strand)]
+
+  def downstream(self,x,match):
+    """The first interval of ``b`` starting at or after the end of ``x``
+       for which ``match`` is true, reading ahead in ``b`` if necessary."""
+    for y in self.window:
+      if y.left >= x.right and match(y):
+        return y
+    while self.nextB != None and self.nextB.chrom == x.chrom:
+      y = self.nextB
+      self.window.append(y)
+      self.nextB = self._pull()
+      if y.left >= x.right and match(y):
+        return y
+    return None
+
+def overlapGroups(a,b,sameStrand=False):
+  """Pair each interval of ``a`` with the intervals of ``b`` overlapping it.
+
+     :param a: A sorted iterable of intervals.
+     :param b: A sorted iterable of intervals.
+     :param sameStrand: Only report overlaps on the same strand.
+     :returns: A generator of ``(x,hits)`` pairs, one for each interval ``x``
+               of ``a``, where ``hits`` is a (sorted) list of intervals of
+               ``b``.
+  """
+  sweep = _Sweep(b)
+  for x in a:
+    sweep.advance(x)
+    yield x,sweep.hits(x,sameStrand)
+
+def intersect(a,b,sameStrand=False):
+  """The overlapping parts of intervals in ``a`` and ``b``.
+
+     For each overlapping pair ``(x,y)``, yields a copy of ``x`` trimmed to
+     the part that overlaps ``y`` (as ``bedtools intersect``).
+  """
+  for x,hits in overlapGroups(a,b,sameStrand):
+    for y in hits:
+      yield _piece(x,max(x.left,y.left),min(x.right,y.right))
+
+def merge(a,distance=0,sameStrand=False):
+  """Merge overlapping (or nearby) intervals of ``a``.
+
+     Intervals are merged if they overlap, are book-ended, or are separated
+     by at most ``distance`` bases (as ``bedtools merge``).
+
+     :param a: A sorted iterable of intervals.
+     :param distance: The largest gap to merge across.
+     :param sameStrand: Only merge intervals on the same strand (the merged
+                        intervals are then grouped by chromosome, but not
+                        strictly sorted within a chromosome).
+     :returns: A generator of ``Interval`` objects.
+  """
+  prev = None
+  current = dict()
+  for x in a:
+    if prev != None and x.chrom != prev.chrom:
+      for strand,(left,right) in sorted(current.items(),key=lambda c:c[1]):
+        yield Interval(prev.chrom,left,right,strand=strand)
+      current = dict()
+    prev = _checkOrder(prev,x)
+    strand = x.strand if sameStrand else "."
+    cur = current.get(strand)
+    if cur != None and x.left > cur[1] + distance:
+      yield Interval(x.chrom,cur[0],cur[1],strand=strand)
+      cur = None
+    if cur == None:
+      current[strand] = [x.left,x.right]
+    elif x.right > cur[1]:
+      cur[1] = x.right
+  for strand,(left,right) in sorted(current.items(),key=lambda c:c[1]):
+    yield Interval(prev.chrom,left,right,strand=strand)
+
+def subtract(a,b,sameStrand=False):
+  """The parts of intervals in ``a`` not covered by any interval in ``b``.
+
+     Yields copies of the intervals of ``a``, trimmed or split so as to
+     remove the covered parts (as ``bedtools subtract``).
+  """
+  for x,hits in overlapGroups(a,b,sameStrand):
+    left = x.left
+    for y in hits:
+      if y.left > left:
+        yield _piece(x,left,y.left)
+      if y.right > left:
+        left = y.right
+    if left < x.right:
+      yield x if left == x.left else _piece(x,left,x.right)
+
+def closest(a,b,sameStrand=False):
+  """Find the closest interval of ``b`` to each interval of ``a``.
+
+     Distances follow ``bedtools closest -d``: 0 for overlapping intervals,
+     otherwise the gap between them plus one (so book-ended intervals are at
+     distance 1).  Ties are broken in favour of the interval that sorts
+     first.
+
+     :returns: A generator of ``(x,y,distance)`` triples, one for each ``x``
+               in ``a``; ``y`` is ``None`` (and the distance -1) if ``b`` has
+               no interval on the same chromosome.
+  """
+  sweep = _Sweep(b)
+  for x in a:
+    sweep.advance(x)
+    hits = sweep.hits(x,sameStrand)
+    if hits:
+      yield x,hits[0],0
+      continue
+    if sameStrand:
+      match = lambda y:y.strand == x.strand
+    else:
+      match = lambda y:True
+    best,dist = None,-1
+    for up in sweep.upstream.values():
+      if match(up) and (best == None or up.right > best.right):
+        best,dist = up,x.left - up.right + 1
+    down = sweep.downstream(x,match)
+    if down != None and (best == None or down.left - x.right + 1 < dist):
+      best,dist = down,down.left - x.right + 1
+    yield x,best,dist
+
+def coverage(a,b,sameStrand=False):
+  """Coverage of each interval of ``a`` by the intervals of ``b``.
+
+     :returns: A generator of ``(x,count,covered,fraction)`` tuples, where
+               ``count`` is the number of intervals of ``b`` overlapping
+               ``x``, ``covered`` the number of bases of ``x`` covered by
+               them, and ``fraction`` the covered proportion of ``x`` (as
+               ``bedtools coverage``).
+  """
+  for x,hits in overlapGroups(a,b,sameStrand):
+    covered = 0
+    end = x.left
+    for y in hits:
+      left = max(y.left,end)
+      right = min(y.right,x.right)
+      if right > left:
+        covered += right - left
+        end = right
+    length = x.right - x.left
+    yield x,len(hits),covered,float(covered)/length if length > 0 else 0.0
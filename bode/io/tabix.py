@@ -0,0 +1,274 @@
+"""Tabix indexes of BGZF-compressed, position-sorted text files.
+
+   ``TabixIndex`` reads and writes the ``.tbi`` files produced by ``tabix``,
+   and can also build them itself (so ``tabix`` need not be installed).  An
+   index maps each region of each sequence to the BGZF *chunks* (ranges of
+   virtual offsets) that may contain overlapping records, using the UCSC
+   binning scheme plus a linear index of 16 kb windows.  Fetching a region
+   then decompresses only the blocks in those chunks::
+
+     idx = TabixIndex().load("peaks.bed.gz.tbi")
+     for line in idx.fetch(BgzfReader("peaks.bed.gz"),"chr3",1000000,1002000):
+       ...
+"""
+import struct
+
+from bode.io import FileFormatError
+from bode.io.bgzf import BgzfReader, BgzfWriter
+
+################################################################################
+
+flagUCSC = 0x10000
+"""Format flag: coordinates are 0-based, half-open (as BED)."""
+
+linearShift = 14
+"""log2 of the size of the linear index windows."""
+
+bedHeaderPrefixes = ("track","browser")
+"""Prefixes of the header lines of BED files, skipped (as well as the lines
+   starting with the meta character) in 0-based files."""
+
+def reg2bin(beg,end):
+  """The smallest bin containing the region ``[beg,end)``."""
+  end -= 1
+  if beg >> 14 == end >> 14: return ((1 << 15) - 1) // 7 + (beg >> 14)
+  if beg >> 17 == end >> 17: return ((1 << 12) - 1) // 7 + (beg >> 17)
+  if beg >> 20 == end >> 20: return ((1 << 9) - 1) // 7 + (beg >> 20)
+  if beg >> 23 == end >> 23: return ((1 << 6) - 1) // 7 + (beg >> 23)
+  if beg >> 26 == end >> 26: return ((1 << 3) - 1) // 7 + (beg >> 26)
+  return 0
+
+def reg2bins(beg,end):
+  """All bins that may contain records overlapping ``[beg,end)``."""
+  end -= 1
+  bins = [0]
+  for shift,offset in ((26,1),(23,9),(20,73),(17,585),(14,4681)):
+    bins.extend(range(offset + (beg >> shift),offset + (end >> shift) + 1))
+  return bins
+
+class TabixIndex(object):
+  """A tabix index.
+
+     The default settings are those of ``tabix -p bed``: sequence name,
+     start and end in columns 1, 2 and 3, 0-based coordinates, and ``#``,
+     ``track`` and ``browser`` marking header lines.
+  """
+
+  def __init__(self,seqCol=1,begCol=2,endCol=3,zeroBased=True,meta="#",skip=0):
+    """Create an (empty) index.
+
+       :param meta: The character marking header lines (stored in the
+                    index); in 0-based files, lines starting with one of
+                    ``bedHeaderPrefixes`` are also skipped.
+    """
+    self._format = flagUCSC if zeroBased else 0
+    self._seqCol = seqCol
+    self._begCol = begCol
+    self._endCol = endCol
+    self._meta = meta
+    self._setHeaderPrefixes()
+    self._skip = skip
+    self._names = list()
+    self._bins = list()
+    self._linear = list()
+
+  def _getNames(self):
+    return self._names
+  names = property(_getNames)
+  """The sequence names in the index, in file order (get)."""
+
+  def _setHeaderPrefixes(self):
+    prefixes = (self._meta,)
+    if self._format & flagUCSC:
+      prefixes += bedHeaderPrefixes
+    self._headerPrefixes = prefixes
+
+  def load(self,fn):
+    """Load an index from a ``.tbi`` file.
+
+       :rtype: TabixIndex (``self``)
+    """
+    reader = BgzfReader(fn)
+    try:
+      data = reader.read()
+    finally:
+      reader.close()
+    if data[:4] != "TBI\1":
+      raise IOError("Not a tabix index: %s" % (fn,))
+    (nref,self._format,self._seqCol,self._begCol,self._endCol,meta,
+     self._skip,lnm) = struct.unpack("<8i",data[4:36])
+    self._meta = chr(meta)
+    self._setHeaderPrefixes()
+    pos = 36
+    self._names = data[pos:pos+lnm].split("\0")[:nref]
+    pos += lnm
+    self._bins = list()
+    self._linear = list()
+    for i in range(0,nref):
+      bins = dict()
+      nbin = struct.unpack("<i",data[pos:pos+4])[0]
+      pos += 4
+      for j in range(0,nbin):
+        b,nchunk = struct.unpack("<Ii",data[pos:pos+8])
+        pos += 8
+        chunks = struct.unpack("<%dQ" % (2*nchunk,),data[pos:pos+16*nchunk])
+        pos += 16 * nchunk
+        bins[b] = [(chunks[k],chunks[k+1]) for k in range(0,len(chunks),2)]
+      nintv = struct.unpack("<i",data[pos:pos+4])[0]
+      pos += 4
+      linear = list(struct.unpack("<%dQ" % (nintv,),data[pos:pos+8*nintv]))
+      pos += 8 * nintv
+      self._bins.append(bins)
+      self._linear.append(linear)
+    return self
+
+  def save(self,fn):
+    """Write the index to a ``.tbi`` file."""
+    names = "".join(n + "\0" for n in self._names)
+    parts = ["TBI\1",struct.pack("<8i",len(self._names),self._format,
+                                  self._seqCol,self._begCol,self._endCol,
+                                  ord(self._meta),self._skip,len(names)),names]
+    for bins,linear in zip(self._bins,self._linear):
+      parts.append(struct.pack("<i",len(bins)))
+      for b in sorted(bins):
+        chunks = bins[b]
+        parts.append(struct.pack("<Ii",b,len(chunks)))
+        for cbeg,cend in chunks:
+          parts.append(struct.pack("<QQ",cbeg,cend))
+      parts.append(struct.pack("<i",len(linear)))
+      parts.append(struct.pack("<%dQ" % (len(linear),),*linear))
+    out = BgzfWriter(fn)
+    out.write("".join(parts))
+    out.close()
+
+  def _region(self,line):
+    """The sequence, start and end (0-based, half-open) of a record."""
+    flds = line.rstrip("\r\n").split("\t")
+    beg = int(flds[self._begCol-1])
+    if not self._format & flagUCSC:
+      beg -= 1
+    end = int(flds[self._endCol-1]) if self._endCol > 0 else beg + 1
+    if end <= beg:
+      end = beg + 1
+    return flds[self._seqCol-1],beg,end
+
+  def build(self,fn):
+    """Build the index for a BGZF file, which must be sorted by sequence
+       (in any order, but with each sequence contiguous) and start.
+
+       :rtype: TabixIndex (``self``)
+    """
+    self._names = list()
+    self._bins = list()
+    self._linear = list()
+    reader = BgzfReader(fn)
+    try:
+      for i in range(0,self._skip):
+        reader.readline()
+      prev = None
+      voff = reader.tell()
+      line = reader.readline()
+      lineNum = self._skip + 1
+      while line:
+        nextOff = reader.tell()
+        if not line.startswith(self._headerPrefixes) and line.strip():
+          try:
+            seq,beg,end = self._region(line)
+          except (IndexError,ValueError):
+            raise FileFormatError(fn,lineNum,"No sequence, start and end in columns %d, %d and %d." %
+                                  (self._seqCol,self._begCol,self._endCol))
+          if seq != prev:
+            if seq in self._names:
+              raise ValueError("%s: sequence %s is not contiguous" % (fn,seq))
+            self._names.append(seq)
+            bins = dict()
+            linear = list()
+            self._bins.append(bins)
+            self._linear.append(linear)
+            prev = seq
+            lastBeg = beg
+          elif beg < lastBeg:
+            raise ValueError("%s: not sorted at %s:%d" % (fn,seq,beg))
+          lastBeg = beg
+          chunks = bins.setdefault(reg2bin(beg,end),[])
+          if chunks and chunks[-1][1] == voff:
+            chunks[-1] = (chunks[-1][0],nextOff)
+          else:
+            chunks.append((voff,nextOff))
+          last = (end - 1) >> linearShift
+          if len(linear) <= last:
+            linear.extend([0] * (last + 1 - len(linear)))
+          for w in range(beg >> linearShift,last + 1):
+            if linear[w] == 0:
+              linear[w] = voff
+        voff = nextOff
+        line = reader.readline()
+        lineNum += 1
+    finally:
+      reader.close()
+    for linear in self._linear:
+      for w in range(1,len(linear)):
+        if linear[w] == 0:
+          linear[w] = linear[w-1]
+    return self
+
+  def chunks(self,seq,beg,end):
+    """The chunks of the file that may hold records overlapping a region.
+
+       :returns: A sorted list of non-overlapping ``(start,end)`` pairs of
+                 virtual offsets.
+    """
+    if seq not in self._names:
+      return []
+    i = self._names.index(seq)
+    bins = self._bins[i]
+    linear = self._linear[i]
+    w = beg >> linearShift
+    minOff = linear[w] if w < len(linear) else (linear[-1] if linear else 0)
+    found = list()
+    for b in reg2bins(beg,end):
+      for cbeg,cend in bins.get(b,()):
+        if cend > minOff:
+          found.append((cbeg,cend))
+    found.sort()
+    merged = list()
+    for cbeg,cend in found:
+      if merged and cbeg <= merged[-1][1]:
+        if cend > merged[-1][1]:
+          merged[-1] = (merged[-1][0],cend)
+      else:
+        merged.append((cbeg,cend))
+    return merged
+
+  def fetch(self,reader,seq,beg,end):
+    """Generate the lines of a file overlapping a region.
+
+       :param reader: A ``BgzfReader`` for the indexed file.
+       :param seq: The sequence name.
+       :param beg: The start of the region (0-based).
+       :param end: The end of the region (exclusive).
+    """
+    for cbeg,cend in self.chunks(seq,beg,end):
+      reader.seek(cbeg)
+      while reader.tell() < cend:
+        line = reader.readline()
+        if not line:
+          break
+        if line.startswith(self._headerPrefixes):
+          continue
+        s,b,e = self._region(line)
+        if s == seq and b < end and e > beg:
+          yield line
+        elif s == seq and b >= end:
+          break
+
+def indexFile(fn,**settings):
+  """Build and save the tabix index (``fn`` + ``.tbi``) of a BGZF file.
+
+     Keyword arguments are passed to ``TabixIndex``.
+
+     :rtype: TabixIndex
+  """
+  idx = TabixIndex(**settings).build(fn)
+  idx.save(fn + ".tbi")
+  return idx
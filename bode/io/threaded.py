@@ -0,0 +1,125 @@
+"""Background-thread I/O.
+
+   Decompression in ``zlib`` releases the interpreter lock, so reading a
+   gzipped file in a separate thread lets decompression overlap with
+   parsing in the main thread.  ``ThreadedReader`` reads a file in large
+   chunks in a background thread, keeping a few chunks queued ahead::
+
+     reader = ThreadedReader(gzip.open("reads.fastq.gz"))
+     chunk = reader.read()
+     while chunk:
+       ...
+       chunk = reader.read()
+     reader.close()
+
+   ``ThreadedWriter`` does the same for output: compression (e.g. by a
+   ``BgzfWriter``) happens in the background while the main thread
+   formats the next chunk.
+"""
+import threading
+try:
+  import Queue as queue
+except ImportError:
+  import queue
+
+################################################################################
+
+class ThreadedReader(object):
+  """Read a file object in chunks, in a background thread."""
+
+  def __init__(self,fd,chunkSize=1<<22,depth=4):
+    """Start reading.
+
+       :param fd: The (open) file object; it is closed by ``close()``.
+       :param chunkSize: The size of each read.
+       :param depth: The number of chunks read ahead.
+    """
+    self._fd = fd
+    self._chunkSize = chunkSize
+    self._queue = queue.Queue(depth)
+    self._stop = False
+    self._done = False
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _run(self):
+    try:
+      while not self._stop:
+        chunk = self._fd.read(self._chunkSize)
+        self._queue.put(chunk)
+        if not chunk:
+          return
+    except Exception as e:
+      self._queue.put(e)
+
+  def read(self):
+    """The next chunk of the file (``""`` at end of file).
+
+       Errors raised while reading are raised again here.
+    """
+    if self._done:
+      return ""
+    chunk = self._queue.get()
+    if isinstance(chunk,Exception):
+      self._done = True
+      raise chunk
+    if not chunk:
+      self._done = True
+    return chunk
+
+  def close(self):
+    """Stop the background thread, and close the file."""
+    self._stop = True
+    while self._thread.is_alive():
+      try:
+        self._queue.get(timeout=0.1)
+      except queue.Empty:
+        pass
+    self._done = True
+    self._fd.close()
+
+class ThreadedWriter(object):
+  """Write to a file object in a background thread."""
+
+  def __init__(self,fd,depth=4):
+    """Start the writer.
+
+       :param fd: The (open) file object; it is closed by ``close()``.
+       :param depth: The number of writes that may be queued.
+    """
+    self._fd = fd
+    self._queue = queue.Queue(depth)
+    self._error = None
+    self._thread = threading.Thread(target=self._run)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def _run(self):
+    while True:
+      data = self._queue.get()
+      if data == None:
+        return
+      if self._error == None:
+        try:
+          self._fd.write(data)
+        except Exception as e:
+          self._error = e
+
+  def write(self,data):
+    """Queue a string to be written.
+
+       Errors raised by earlier writes are raised again here.
+    """
+    if self._error != None:
+      raise self._error
+    self._queue.put(data)
+
+  def close(self):
+    """Wait for the queued writes, and close the file."""
+    if self._thread.is_alive():
+      self._queue.put(None)
+      self._thread.join()
+    self._fd.close()
+    if self._error != None:
+      raise self._error
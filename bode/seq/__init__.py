@@ -3,9 +3,57 @@
 """
 
 import re
+import string
 
 ################################################################################
 
+chromPat = re.compile("^chr(\d+)(_\w+)?$")
+
+_chromKeys = dict()
+_chromNames = dict()
+
+strandRank = {".":0,"+":1,"-":2}
+"""Sort order of strands: unstranded first, then '+', then '-'."""
+
+def chromKey(chrom):
+  """The sort key of a chromosome name.
+
+     Numbered chromosomes (``chr1``, ``chr2_random``, ...) sort first, in
+     numeric order, followed by all other names in lexical order.  Keys are
+     computed once per name and cached, so sorting needs no regular
+     expression matching.
+
+     :rtype: tuple
+  """
+  try:
+    return _chromKeys[chrom]
+  except KeyError:
+    mo = chromPat.match(chrom)
+    if mo:
+      key = (0,int(mo.group(1)),mo.group(2) or "")
+    else:
+      key = (1,0,chrom)
+    _chromKeys[internChrom(chrom)] = key
+    return key
+
+def internChrom(chrom):
+  """Returns the shared copy of a chromosome name.
+
+     Intervals on the same chromosome then share a single string, rather
+     than each holding its own copy.
+  """
+  return _chromNames.setdefault(chrom,chrom)
+
+def chromCompare(c1,c2):
+  """Compare two chromosome names, in the order used to sort intervals.
+
+     :returns: negative, zero or positive, as for ``cmp``.
+     :rtype: int
+  """
+  k1 = chromKey(c1)
+  k2 = chromKey(c2)
+  return (k1 > k2) - (k1 < k2)
+
 class Interval(object):
   """Base class for representing genomic intervals.
 
@@ -17,10 +65,18 @@ class Interval(object):
      various sorts of interval formats: bed, peaks, BAM, etc.
 
      The ``Interval`` class supports the usual comparison operators: ``<``,
-     ``==`` and so on.
+     ``==`` and so on.  Intervals are ordered by chromosome (see
+     ``chromKey``), left end, right end and strand; ``sortKey`` returns the
+     same ordering as a tuple, for use with ``sorted(key=...)``.
+
+     Intervals are stored in ``__slots__`` rather than a per-instance
+     dictionary, to keep large sets of intervals compact.  Subclasses should
+     declare ``__slots__`` for their own fields to retain the benefit.
   """
 
-  chromPat = re.compile("^chr(\d+)(_\w+)?$")
+  __slots__ = ("_chrom","_left","_right","_strand","_name")
+
+  chromPat = chromPat
 
   def __init__(self,chrom,left,right,strand=".",name=None):
     """Construct an interval object.
@@ -34,7 +90,7 @@ class Interval(object):
        :param name: The name of the interval (default "chr:left-right").
        :type name: str
     """
-    self._chrom = chrom
+    self._chrom = internChrom(chrom)
     self._left = left
     self._right = right
     if strand == None:
@@ -55,6 +111,20 @@ class Interval(object):
     name = '"%s"' % (self._name,) if self._name != "" else "None"
     return "Interval(%s,%d,%d,strand='%s',name=%s)" % (self._chrom,self._left,self._right,self._strand,name)
 
+  def __getstate__(self):
+    state = dict()
+    for cls in type(self).__mro__:
+      for slot in cls.__dict__.get("__slots__",()):
+        if hasattr(self,slot):
+          state[slot] = getattr(self,slot)
+    if hasattr(self,"__dict__"):
+      state.update(self.__dict__)
+    return state
+
+  def __setstate__(self,state):
+    for k,v in state.items():
+      setattr(self,k,v)
+
   def __eq__(self,other):
     if other == None or not isinstance(other,type(self)):
       return False
@@ -66,48 +136,31 @@ class Interval(object):
     return self._chrom!=other._chrom or self._left!=other._left or self._right!=other._right or self._strand!=other._strand
 
   def _chromComp(self,c1,c2):
-    mo1 = self.chromPat.match(c1)
-    mo2 = self.chromPat.match(c2)
-    if mo1 and mo2:
-      i1 = int(mo1.group(1))
-      i2 = int(mo2.group(1))
-      if i1 == i2:
-        t1 = mo1.group(2)
-        t2 = mo2.group(2)
-        return cmp(t1,t2)
-      else:
-        return cmp(i1,i2)
-    elif mo1:
-      return -1
-    elif mo2:
-      return 1
-    else:
-      return cmp(c1,c2)
+    return chromCompare(c1,c2)
+
+  def sortKey(self):
+    """The key determining the sort order of the interval.
+
+       :rtype: tuple
+    """
+    return (chromKey(self._chrom),self._left,self._right,strandRank.get(self._strand,2))
 
   def __cmp__(self,other):
-    cc = self._chromComp(self._chrom,other._chrom)
-    if cc == 0: # chromosome is equal
-      if self._left < other._left:
-        return -1
-      elif self._left > other._left:
-        return 1
-      elif self._right < other._right:
-        return -1
-      elif self._right > other._right:
-        return 1
-      else:
-        if self._strand == other._strand:
-          return 0
-        elif self._strand == '.':
-          return -1
-        elif other._strand == '.':
-          return 1
-        elif self._strand == '+':
-          return -1
-        else:
-          return 1
-    else:
-      return cc
+    k1 = self.sortKey()
+    k2 = other.sortKey()
+    return (k1 > k2) - (k1 < k2)
+
+  def __lt__(self,other):
+    return self.sortKey() < other.sortKey()
+
+  def __le__(self,other):
+    return self.sortKey() <= other.sortKey()
+
+  def __gt__(self,other):
+    return self.sortKey() > other.sortKey()
+
+  def __ge__(self,other):
+    return self.sortKey() >= other.sortKey()
 
   def _getName(self):
     return self._name
@@ -119,7 +172,7 @@ class Interval(object):
   def _getChrom(self):
     return self._chrom
   def _setChrom(self,chr):
-    self._chrom = chr
+    self._chrom = internChrom(chr)
   chrom = property(_getChrom,_setChrom)
   """The chromosome of the interval (get/set)."""
 
@@ -170,6 +223,55 @@ SeqType = enum(DNA=1, RNA=2, PROTEIN=3, UNKNOWN=4)
    * ``seq.SeqType.PROTEIN`` -- protein sequence
 """
 
+def _deleteChars(s,chars):
+  """``s`` with every character in ``chars`` removed (in a single C pass)."""
+  if isinstance(s,str):
+    return s.translate(None,chars)
+  return s.translate(dict.fromkeys(map(ord,chars)))
+
+_alphabetTables = dict()
+
+def _alphabetTable(alphabets):
+  """The characters common to all the alphabets, the remaining legal
+     characters, and a ``(char,bits)`` probe for each of the latter giving
+     the alphabets it belongs to.
+  """
+  table = _alphabetTables.get(alphabets)
+  if table == None:
+    common = "".join(c for c in alphabets[0] if all(c in a for a in alphabets))
+    others = "".join(sorted(set("".join(alphabets)) - set(common)))
+    probes = [(c,sum(1 << i for i,a in enumerate(alphabets) if c in a)) for c in others]
+    table = (common,others,probes)
+    _alphabetTables[alphabets] = table
+  return table
+
+def _alphabetMask(seq,alphabets):
+  """Classify a sequence against several alphabets at once.
+
+     The characters shared by every alphabet are stripped with a single
+     ``translate``; only the (usually much shorter) remainder is examined
+     further, by probing for each character that tells the alphabets apart.
+
+     :param seq: The sequence.
+     :param alphabets: A tuple of strings of legal characters.
+     :returns: A bitmask, with bit ``i`` set if every character of ``seq``
+               is in ``alphabets[i]``.
+     :rtype: int
+  """
+  common,others,probes = _alphabetTable(alphabets)
+  mask = (1 << len(alphabets)) - 1
+  rest = _deleteChars(seq,common)
+  if not rest:
+    return mask
+  if _deleteChars(rest,others):
+    return 0
+  for c,bits in probes:
+    if c in rest:
+      mask &= bits
+      if not mask:
+        break
+  return mask
+
 class Sequence(object):
   """Base class for representing sequences (strings of DNA/RNA/protein).
 
@@ -192,17 +294,14 @@ class Sequence(object):
     :type seq: str
     :param name: The name of the sequence (if applicable).
     :type name: str
-    :param type: The sort of sequence (``seq.SeqType.DNA``, ``seq.SeqType.RNA``, ``seq.SeqType.PROTEIN``).  Defaults to "best guess": if all characters are legal DNA (including ambiguity codes), DNA is assumed; if all RNA, RNA is assumed; if all protein, protein is assumed; otherwise unknown is assumed.
+    :param type: The sort of sequence (``seq.SeqType.DNA``, ``seq.SeqType.RNA``, ``seq.SeqType.PROTEIN``).  Defaults to "best guess": if all characters are legal DNA (including ambiguity codes), DNA is assumed; if all RNA, RNA is assumed; if all protein, protein is assumed; otherwise unknown is assumed.  The guess is made when the type is first needed.
     :type type: SeqType
     """
     self._seq = seq
     self._name = name
-    if type == None:
-      self._type = self._guessType()
-      self._typeGuessed = True
-    else:
-      self._type = type
-      self._typeGuessed = False
+    self._mask = None
+    self._type = type
+    self._typeGuessed = type == None
 
   def __str__(self):
     return self._seq
@@ -233,9 +332,15 @@ class Sequence(object):
     return self._seq
   def _setSeq(self,newSeq):
     self._seq = newSeq
+    self._mask = None
+    if self._typeGuessed:
+      self._type = None
   seq = property(_getSeq,_setSeq)
   """The sequence itself (get/set)."""
 
+  def __len__(self):
+    return len(self._seq)
+
   def _seqLength(self):
     return len(self._seq)
   length = property(_seqLength)
@@ -245,32 +350,41 @@ class Sequence(object):
   """
 
   def _getSeqType(self):
+    if self._type == None:
+      self._type = self._guessType()
     return self._type
   def _setSeqType(self,newType):
     self._type = newType
+    self._typeGuessed = newType == None
   seqType = property(_getSeqType,_setSeqType)
-  """The type of the sequence (get/set)."""
+  """The type of the sequence (get/set).
+
+     If no type was given, it is guessed from the sequence on first access
+     (and guessed again if the sequence is changed).
+  """
+
+  _typeBits = ((SeqType.DNA,1),(SeqType.RNA,2),(SeqType.PROTEIN,4))
 
   def _allInSet(self,s1,s2):
     """True if all characters in s1 also in s2, false otherwise."""
-    s1len = len(s1)
-    allIn = True
-    for i in range(0,s1len):
-      if s1[i] not in s2:
-        allIn = False
-        break
-    return allIn
+    return not _deleteChars(s1,s2)
+
+  def _typeMask(self):
+    """Bitmask of the alphabets (DNA 1, RNA 2, protein 4) the sequence fits.
+
+       Computed once, and cached until the sequence is changed.
+    """
+    if self._mask == None:
+      self._mask = _alphabetMask(self._seq,(self.legalDNA,self.legalRNA,self.legalPROTEIN))
+    return self._mask
 
   def _guessType(self):
-    t = SeqType.UNKNOWN
-    if self._allInSet(self._seq,self.legalDNA):
-      t = SeqType.DNA
-    elif self._allInSet(self._seq,self.legalRNA):
-      t = SeqType.RNA
-    elif self._allInSet(self._seq,self.legalPROTEIN):
-      t = SeqType.PROTEIN
-    return t
-    
+    mask = self._typeMask()
+    for t,bit in self._typeBits:
+      if mask & bit:
+        return t
+    return SeqType.UNKNOWN
+
   def fasta(self,head=0,tail=0):
     """The sequence in Fasta format.
 
@@ -281,9 +395,41 @@ class Sequence(object):
        :rtype: str
     """
     slen = len(self._seq)
-    tag = self._name if not self._name == none else "sequence"
+    tag = self._name if self._name != None else "sequence"
     return ">%s\n%s\n" % (tag,self._seq[head:slen-tail])
 
+  def _derivedType(self):
+    """The type to give sequences derived from this one."""
+    return None if self._typeGuessed else self._type
+
+  def reverseComplement(self):
+    """The reverse complement of the sequence.
+
+       IUPAC ambiguity codes are complemented, and case is kept.  RNA
+       sequences are complemented with ``U`` rather than ``T``.
+
+       :rtype: Sequence
+    """
+    t = self.seqType
+    if t == SeqType.PROTEIN:
+      raise ValueError("Cannot reverse-complement a protein sequence")
+    return Sequence(reverseComplement(self._seq,t == SeqType.RNA),name=self._name,type=self._derivedType())
+
+  def translate(self,frame=0):
+    """Translate the sequence, with the standard genetic code.
+
+       A codon containing ambiguity codes translates to the amino acid
+       that every codon it could stand for codes for, or to ``X`` if they
+       differ.  Stop codons translate to ``*``.
+
+       :param frame: The reading frame (0, 1 or 2).
+       :type frame: int
+       :rtype: Sequence
+    """
+    if self.seqType == SeqType.PROTEIN:
+      raise ValueError("Cannot translate a protein sequence")
+    return Sequence(translate(self._seq,frame),name=self._name,type=SeqType.PROTEIN)
+
   def saneSeq(self):
     """Test whether the object is more or less real-looking.
 
@@ -299,18 +445,118 @@ class Sequence(object):
       sane = False
     elif self._name != None and not isinstance(self._name,str):
       sane = False
-    elif self._typeGuessed and self._type==SeqType.UNKNOWN:
+    elif self._typeGuessed and self.seqType==SeqType.UNKNOWN:
       sane = False
     else:
-      if self._type == SeqType.DNA:
-        if not self._allInSet(self._seq,self.legalDNA):
-          sane = False
-      elif self._type == SeqType.RNA:
-        if not self._allInSet(self._seq,self.legalRNA):
-          sane = False
-      elif self._type == SeqType.PROTEIN:
-        if not self._allInSet(self._seq,self.legalPROTEIN):
+      for t,bit in self._typeBits:
+        if self.seqType == t and not self._typeMask() & bit:
           sane = False
     return sane
 
 ################################################################################
+
+_complementDNA = string.maketrans("ACGTUMRWSYKVHDBNacgtumrwsykvhdbn",
+                                  "TGCAAKYWSRMBDHVNtgcaakywsrmbdhvn")
+_complementRNA = string.maketrans("ACGTUMRWSYKVHDBNacgtumrwsykvhdbn",
+                                  "UGCAAKYWSRMBDHVNugcaakywsrmbdhvn")
+
+geneticCode = "FFLLSSSSYY**CC*WLLLLPPPPHHQQRRRRIIIMTTTTNNKKSSRRVVVVAAAADDEEGGGG"
+"""The standard genetic code: the amino acids of the codons in ``TCAG``
+   order (``TTT``, ``TTC``, ``TTA``, ..., ``GGG``)."""
+
+_iupac = (("A","A"),("C","C"),("G","G"),("T","T"),("R","AG"),("Y","CT"),
+          ("S","CG"),("W","AT"),("K","GT"),("M","AC"),("B","CGT"),
+          ("D","AGT"),("H","ACT"),("V","ACG"),("N","ACGT"))
+
+_codonTables = list()
+
+def _codonTable():
+  """Lookup tables for translation: base codes (0-14 for the IUPAC codes,
+     15 for anything else), and the amino acid of each triple of codes.
+     Built on first use.
+  """
+  if not _codonTables:
+    import numpy
+    aminoAcids = dict()
+    for i,a in enumerate("TCAG"):
+      for j,b in enumerate("TCAG"):
+        for k,c in enumerate("TCAG"):
+          aminoAcids[a+b+c] = geneticCode[16*i+4*j+k]
+    codes = numpy.repeat(numpy.uint16(15),256)
+    for i,(c,bases) in enumerate(_iupac):
+      codes[ord(c)] = codes[ord(c.lower())] = i
+    codes[ord("U")] = codes[ord("u")] = codes[ord("T")]
+    table = numpy.repeat(numpy.uint8(ord("X")),4096)
+    for i,(c1,b1) in enumerate(_iupac):
+      for j,(c2,b2) in enumerate(_iupac):
+        for k,(c3,b3) in enumerate(_iupac):
+          found = set(aminoAcids[x+y+z] for x in b1 for y in b2 for z in b3)
+          if len(found) == 1:
+            table[256*i+16*j+k] = ord(found.pop())
+    _codonTables.extend((codes,table))
+  return _codonTables
+
+def reverseComplement(text,rna=False):
+  """The reverse complement of a DNA (or RNA) string.
+
+     IUPAC ambiguity codes are complemented, and case is kept.
+
+     :param rna: Complement ``A`` with ``U`` rather than ``T``.
+     :rtype: str
+  """
+  return text[::-1].translate(_complementRNA if rna else _complementDNA)
+
+def translate(text,frame=0):
+  """Translate a DNA (or RNA) string (see ``Sequence.translate``).
+
+     :rtype: str
+  """
+  import numpy
+  codes,table = _codonTable()
+  n = (len(text) - frame) // 3
+  if n <= 0:
+    return ""
+  bases = codes[numpy.frombuffer(text,dtype=numpy.uint8,count=3*n,offset=frame)].reshape(n,3)
+  return table[(bases[:,0] << 8) | (bases[:,1] << 4) | bases[:,2]].tostring()
+
+def _texts(seqs):
+  return [seq.seq if isinstance(seq,Sequence) else seq for seq in seqs]
+
+def reverseComplementAll(seqs,rna=False):
+  """Reverse-complement many sequences at once.
+
+     The sequences are joined, complemented with a single ``translate``,
+     and split again.
+
+     :param seqs: A list of ``Sequence`` objects or strings.
+     :param rna: Complement ``A`` with ``U`` rather than ``T``.
+     :returns: A list of the reverse complements (``Sequence`` objects for
+               ``Sequence`` objects, strings for strings).
+  """
+  done = reverseComplement("\n".join(_texts(seqs)),rna).split("\n")[::-1]
+  return [Sequence(text,name=seq.name,type=seq._derivedType()) if isinstance(seq,Sequence) else text
+          for seq,text in zip(seqs,done)]
+
+def translateAll(seqs,frame=0):
+  """Translate many sequences at once.
+
+     The codons of all the sequences are looked up in one NumPy operation.
+
+     :param seqs: A list of ``Sequence`` objects or strings.
+     :param frame: The reading frame (0, 1 or 2).
+     :returns: A list of the translations (protein ``Sequence`` objects for
+               ``Sequence`` objects, strings for strings).
+  """
+  import numpy
+  codes,table = _codonTable()
+  texts = _texts(seqs)
+  lengths = numpy.array([len(text) for text in texts],dtype=numpy.int64)
+  starts = numpy.cumsum(lengths) - lengths
+  ncodons = numpy.maximum(0,(lengths - frame) // 3)
+  ends = numpy.cumsum(ncodons)
+  pos = numpy.repeat(starts + frame - 3 * (ends - ncodons),ncodons) + 3 * numpy.arange(ends[-1] if len(ends) else 0)
+  bases = codes[numpy.frombuffer("".join(texts),dtype=numpy.uint8)]
+  protein = table[(bases[pos] << 8) | (bases[pos+1] << 4) | bases[pos+2]].tostring()
+  done = [protein[e-n:e] for e,n in zip(ends,ncodons)]
+  return [Sequence(text,name=seq.name,type=SeqType.PROTEIN) if isinstance(seq,Sequence) else text
+          for seq,text in zip(seqs,done)]
@@ -10,6 +10,8 @@ class Bed(Interval):
      the BED standard (from UCSC) are not supported.
   """
 
+  __slots__ = ("_score",)
+
   def __init__(self,chrom,left,right,name=None,score=0,strand="."):
     """Create a ``Bed`` object.
 
@@ -31,17 +33,12 @@ class Bed(Interval):
     self._score = score
 
   def __str__(self):
-    base = "%s\t%d\t%d" % (self._chrom,self._left,self._right)
-    if self._name != None:
-      base += "\t%s" % (self._name,)
-      if self._score != None:
-        base += "\t%g" % (self._score,)
-        st = self._strand
-        if st != None:
-          base += "\t%s" % (st,)
-        else:
-          base += "\t."
-    return base
+    if self._name == None:
+      return "%s\t%d\t%d" % (self._chrom,self._left,self._right)
+    if self._score == None:
+      return "%s\t%d\t%d\t%s" % (self._chrom,self._left,self._right,self._name)
+    st = self._strand if self._strand != None else "."
+    return "%s\t%d\t%d\t%s\t%g\t%s" % (self._chrom,self._left,self._right,self._name,self._score,st)
 
   def __repr__(self):
     base = "Bed('%s',%d,%d" % (self._chrom,self._left,self._right)
@@ -81,3 +78,34 @@ class Bed(Interval):
     return sane
 
 ################################################################################
+
+def bedText(intervals):
+  """Returns the BED lines of a sequence of intervals, as one string.
+
+     ``Bed`` objects are written as by ``str``; other intervals are written
+     with their name, their ``score`` (if any, otherwise 0) and strand.
+     Intervals with the default name (``chrom:left-right``), a score of 0
+     and no strand (as read from a three-column file) are written with
+     three columns, which read back as the same values.
+
+     :rtype: str
+  """
+  lines = list()
+  append = lines.append
+  bedLine = Bed.__str__
+  for iv in intervals:
+    if isinstance(iv,Bed):
+      score = iv._score
+      st = iv._strand
+    else:
+      score = getattr(iv,"score",0) or 0
+      st = iv.strand
+    if score == 0 and st in (".",None) and iv.name == "%s:%d-%d" % (iv.chrom,iv.left,iv.right):
+      append("%s\t%d\t%d" % (iv.chrom,iv.left,iv.right))
+    elif isinstance(iv,Bed):
+      append(bedLine(iv))
+    else:
+      append("%s\t%d\t%d\t%s\t%g\t%s" % (iv.chrom,iv.left,iv.right,iv.name,score,st if st != None else "."))
+  if lines:
+    append("")
+  return "\n".join(lines)
@@ -0,0 +1,88 @@
+import numpy
+
+from bode.seq import Sequence
+
+################################################################################
+
+class FastqSequence(Sequence):
+  """A class for representing sequencing reads, with base qualities.
+
+     The qualities are kept as the (Phred+``offset``-encoded) string read
+     from the FASTQ file; ``scores`` decodes them into a NumPy ``uint8``
+     array the first time it is used.
+  """
+
+  def __init__(self,seq,name=None,quality=None,offset=33,type=None):
+    """Create a ``FastqSequence`` object.
+
+       :param seq: The read sequence.
+       :type seq: str
+       :param name: The read name.
+       :type name: str
+       :param quality: The encoded base qualities (one character per base).
+       :type quality: str
+       :param offset: The quality encoding offset (33 for Sanger/Illumina
+                      1.8+, 64 for older Illumina files).
+       :type offset: int
+       :param type: The sort of sequence (see ``Sequence``).
+       :type type: SeqType
+    """
+    super(FastqSequence,self).__init__(seq,name=name,type=type)
+    self._quality = quality
+    self._offset = offset
+    self._scores = None
+
+  def __repr__(self):
+    seq = '"%s"' % (self._seq,) if self._seq != None else "None"
+    name = '"%s"' % (self._name,) if self._name != None else "None"
+    qual = '"%s"' % (self._quality,) if self._quality != None else "None"
+    return "FastqSequence(seq=%s,name=%s,quality=%s)" % (seq,name,qual)
+
+  def _getQuality(self):
+    return self._quality
+  def _setQuality(self,quality):
+    self._quality = quality
+    self._scores = None
+  quality = property(_getQuality,_setQuality)
+  """The encoded base qualities (get/set)."""
+
+  def _getOffset(self):
+    return self._offset
+  offset = property(_getOffset)
+  """The quality encoding offset (get)."""
+
+  def _getScores(self):
+    if self._scores is None and self._quality != None:
+      self._scores = numpy.frombuffer(self._quality,dtype=numpy.uint8) - numpy.uint8(self._offset)
+    return self._scores
+  scores = property(_getScores)
+  """The base qualities as Phred scores, in a NumPy ``uint8`` array (get).
+
+     :rtype: numpy.ndarray
+  """
+
+  def fastq(self):
+    """The read in FASTQ format.
+
+       :rtype: str
+    """
+    return "@%s\n%s\n+\n%s\n" % (self._name,self._seq,self._quality)
+
+  def reverseComplement(self):
+    """The reverse complement of the read, with the qualities reversed.
+
+       :rtype: FastqSequence
+    """
+    rc = super(FastqSequence,self).reverseComplement()
+    quality = self._quality[::-1] if self._quality != None else None
+    return FastqSequence(rc.seq,name=self._name,quality=quality,offset=self._offset,type=self._derivedType())
+
+  def saneSeq(self):
+    """Test whether the object is more or less real-looking.
+
+       As ``Sequence.saneSeq``, but also requires a quality for each base.
+
+       :rtype: bool
+    """
+    return (isinstance(self._quality,str) and len(self._quality) == len(self._seq) and
+            super(FastqSequence,self).saneSeq())
@@ -1,3 +1,5 @@
+from numbers import Number
+
 from bode.seq import Interval
 
 ################################################################################
@@ -8,6 +10,11 @@ class HomerPeak(Interval):
      Extends ``Interval`` with the various columns of a HOMER peaks.txt file.
   """
 
+  __slots__ = ("_normalizedTagCount","_focusRatio","_findPeaksScore",
+               "_totalTags","_controlTags","_foldChangeVsControl",
+               "_pvalueVsControl","_foldChangeVsLocal","_pvalueVsLocal",
+               "_clonalFoldChange")
+
   def __init__(self,chrom,left,right,name,strand,normalizedTagCount,focusRatio,findPeaksScore,totalTags,controlTags,foldChangeVsControl,pvalueVsControl,foldChangeVsLocal,pvalueVsLocal,clonalFoldChange):
     """Create a ``HomerPeak`` object.
 
@@ -27,7 +34,7 @@ class HomerPeak(Interval):
        :param pvalueVsLocal: p-value vs local.
        :param clonalFoldChange: Clonal fold change.
     """
-    super(HomerPeak,self).__init__(chrom,left,right,name)
+    super(HomerPeak,self).__init__(chrom,left,right,name=name)
     self._strand = strand
     self._normalizedTagCount = normalizedTagCount
     self._focusRatio = focusRatio
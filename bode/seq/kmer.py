@@ -0,0 +1,314 @@
+"""Counting k-mers in collections of sequences.
+
+   K-mers (``k`` <= 32) are encoded 2 bits per base (``A``=0, ``C``=1,
+   ``G``=2, ``T``=3, first base in the highest bits, so codes sort as the
+   k-mers do).  The codes of all the k-mers of many sequences are worked
+   out at once with NumPy: the sequences are joined with separators, and
+   the code of each k-mer is built from those of its two halves, taking
+   ``log2(k)`` whole-array steps rather than ``k`` steps per base::
+
+     counts = countKmers(genome.sequences(peaks),6,canonical=True,processes=8)
+     for kmer,n in counts.items():
+       ...
+
+   Canonical counting merges each k-mer with its reverse complement (the
+   smaller code is counted).  K-mers containing ``N`` or other ambiguity
+   codes are skipped, or, with ``skipAmbiguous=False``, rejected with
+   ``ValueError``.
+"""
+import itertools
+import multiprocessing
+
+import numpy
+
+from bode.seq import Sequence, reverseComplement
+
+################################################################################
+
+maxK = 32
+"""The longest k-mer that fits in a 64-bit code."""
+
+denseLimit = 1 << 22
+"""Counts are kept in a dense array when there are at most this many
+   possible k-mers, and as sorted (code,count) arrays otherwise."""
+
+mergeLimit = 1 << 22
+"""Sparse tables of counts are merged once the tables added since the last
+   merge hold this many k-mers, or as many as the merged table."""
+
+_codes = numpy.repeat(numpy.uint8(4),256)
+for _i,_c in enumerate("ACGT"):
+  _codes[ord(_c)] = _codes[ord(_c.lower())] = _i
+
+_separator = "\n"
+
+def encodeKmer(kmer):
+  """The code of a k-mer (given as a string)."""
+  code = 0
+  for c in kmer:
+    b = _codes[ord(c)]
+    if b > 3:
+      raise ValueError("Not an unambiguous base: %s" % (c,))
+    code = (code << 2) | int(b)
+  return code
+
+def decodeKmer(code,k):
+  """The k-mer (string) with a given code."""
+  return "".join("ACGT"[(int(code) >> (2 * (k - 1 - i))) & 3] for i in range(0,k))
+
+def _codeType(k):
+  """The narrowest unsigned type holding the codes of k-mers."""
+  return numpy.uint16 if k <= 8 else numpy.uint32 if k <= 16 else numpy.uint64
+
+def _hashes(codes,k):
+  """The codes of the k-mers of an array of base codes (0-3), built by
+     combining the codes of shorter k-mers whose lengths are powers of 2."""
+  dtype = _codeType(k)
+  if len(codes) < k:
+    return numpy.zeros(0,dtype=dtype)
+  result = None
+  width = 0
+  power = codes.astype(dtype)
+  plen = 1
+  remaining = k
+  while remaining:
+    if remaining & 1:
+      if result is None:
+        result = power
+      else:
+        m = len(codes) - width - plen + 1
+        result = numpy.left_shift(result[:m],dtype(2 * plen))
+        result |= power[width:width+m]
+      width += plen
+    remaining >>= 1
+    if remaining:
+      shifted = numpy.left_shift(power[:len(power)-plen],dtype(2 * plen))
+      shifted |= power[plen:]
+      power = shifted
+      plen *= 2
+  return result
+
+def kmerCodes(text,k,canonical=False,skipAmbiguous=True):
+  """The codes of the k-mers of a sequence (or of several, joined by
+     newlines), in order.
+
+     :param text: The sequence, as a string.
+     :param k: The k-mer length.
+     :param canonical: If ``True``, give the smaller of the codes of each
+                       k-mer and its reverse complement.
+     :param skipAmbiguous: If ``True``, leave out k-mers containing bases
+                           other than ``ACGT``; otherwise raise
+                           ``ValueError`` if there are any.
+     :rtype: numpy.ndarray (of unsigned integers, as narrow as ``k``
+             allows)
+  """
+  if k < 1 or k > maxK:
+    raise ValueError("k must be between 1 and %d" % (maxK,))
+  raw = numpy.frombuffer(text,dtype=numpy.uint8)
+  codes = _codes[raw]
+  invalid = codes == 4
+  nbad = numpy.count_nonzero(invalid)
+  if nbad and not skipAmbiguous and nbad != text.count(_separator):
+    raise ValueError("Ambiguous base in sequence")
+  if nbad:
+    codes[invalid] = 0
+  hashes = _hashes(codes,k)
+  if canonical and len(hashes):
+    rc = _hashes((3 - codes)[::-1],k)[::-1]
+    hashes = numpy.minimum(hashes,rc)
+  if nbad and len(hashes):
+    bad = numpy.concatenate(([0],numpy.cumsum(invalid)))
+    hashes = hashes[bad[k:] == bad[:-k]]
+  return hashes
+
+def _mergeCounts(keys,counts):
+  """Sum the counts of equal keys (given as lists of arrays).
+
+     :returns: Sorted, unique keys and their total counts.
+  """
+  keys = numpy.concatenate(keys)
+  counts = numpy.concatenate(counts)
+  if not len(keys):
+    return keys,counts
+  order = numpy.argsort(keys,kind="mergesort")
+  keys = keys[order]
+  counts = counts[order]
+  starts = numpy.concatenate(([0],numpy.flatnonzero(keys[1:] != keys[:-1]) + 1))
+  return keys[starts],numpy.add.reduceat(counts,starts)
+
+################################################################################
+
+class KmerCounter(object):
+  """Counts of the k-mers in a collection of sequences."""
+
+  def __init__(self,k,canonical=False,skipAmbiguous=True,batchSize=1<<22):
+    """Create an empty counter.
+
+       :param k: The k-mer length (at most ``maxK``).
+       :param canonical: Count k-mers and their reverse complements together.
+       :param skipAmbiguous: Skip k-mers containing ambiguity codes (rather
+                             than raising ``ValueError``).
+       :param batchSize: The number of bases joined into one batch by
+                         ``addAll``.
+    """
+    if k < 1 or k > maxK:
+      raise ValueError("k must be between 1 and %d" % (maxK,))
+    self._k = k
+    self._canonical = canonical
+    self._skipAmbiguous = skipAmbiguous
+    self._batchSize = batchSize
+    if 4 ** k <= denseLimit:
+      self._dense = numpy.zeros(4 ** k,dtype=numpy.int64)
+    else:
+      self._dense = None
+      self._keys = numpy.zeros(0,dtype=numpy.uint64)
+      self._counts = numpy.zeros(0,dtype=numpy.int64)
+      self._pending = list()
+      self._pendingSize = 0
+
+  def _getK(self):
+    return self._k
+  k = property(_getK)
+  """The k-mer length (get)."""
+
+  def _addCodes(self,codes):
+    if self._dense is not None:
+      self._dense += numpy.bincount(codes.astype(numpy.intp),minlength=len(self._dense))
+    elif len(codes):
+      keys,counts = numpy.unique(codes,return_counts=True)
+      self._addCounts(keys,counts)
+
+  def _addCounts(self,keys,counts):
+    if self._dense is not None:
+      self._dense[keys.astype(numpy.intp)] += counts
+    else:
+      self._pending.append((keys,counts.astype(numpy.int64)))
+      self._pendingSize += len(keys)
+      if self._pendingSize >= max(len(self._keys),mergeLimit):
+        self._consolidate()
+
+  def _consolidate(self):
+    """Merge the tables of counts added since the last merge.
+
+       Merging only once the new tables are as large as the merged one
+       keeps the cost of all the merges to ``O(N log N)`` in the number of
+       k-mers added, rather than a sort of the whole table per batch.
+    """
+    if self._dense is None and self._pending:
+      keys = [self._keys] + [k for k,n in self._pending]
+      counts = [self._counts] + [n for k,n in self._pending]
+      self._pending = list()
+      self._pendingSize = 0
+      self._keys,self._counts = _mergeCounts(keys,counts)
+
+  def add(self,seq):
+    """Count the k-mers of one sequence (a ``Sequence`` or a string)."""
+    text = seq.seq if isinstance(seq,Sequence) else seq
+    self._addCodes(kmerCodes(text,self._k,self._canonical,self._skipAmbiguous))
+
+  def addAll(self,seqs):
+    """Count the k-mers of many sequences, joined into large batches."""
+    for texts in _batches(seqs,self._batchSize):
+      self.add(_separator.join(texts))
+
+  def merge(self,other):
+    """Add the counts of another counter (with the same settings)."""
+    if other._k != self._k or other._canonical != self._canonical:
+      raise ValueError("Cannot merge counts of different k-mers")
+    self._addCounts(*other.counts())
+
+  def counts(self):
+    """The k-mers seen and their counts.
+
+       :returns: A pair of arrays: sorted k-mer codes, and counts.
+    """
+    if self._dense is not None:
+      keys = numpy.flatnonzero(self._dense)
+      return keys.astype(numpy.uint64),self._dense[keys]
+    self._consolidate()
+    return self._keys,self._counts
+
+  def __getitem__(self,kmer):
+    """The count of a k-mer (given as a string)."""
+    code = encodeKmer(kmer)
+    if self._canonical:
+      code = min(code,encodeKmer(reverseComplement(kmer)))
+    if self._dense is not None:
+      return int(self._dense[code])
+    self._consolidate()
+    i = numpy.searchsorted(self._keys,numpy.uint64(code))
+    return int(self._counts[i]) if i < len(self._keys) and self._keys[i] == code else 0
+
+  def __len__(self):
+    """The number of distinct k-mers seen."""
+    return len(self.counts()[0])
+
+  def _getTotal(self):
+    return int(self.counts()[1].sum())
+  total = property(_getTotal)
+  """The total number of k-mers counted (get)."""
+
+  def items(self):
+    """Generate ``(kmer,count)`` pairs, in k-mer order."""
+    keys,counts = self.counts()
+    for code,n in zip(keys,counts):
+      yield decodeKmer(code,self._k),int(n)
+
+def _batches(seqs,batchSize):
+  """Group the texts of sequences into lists of about ``batchSize`` bases."""
+  batch = list()
+  size = 0
+  for seq in seqs:
+    text = seq.seq if isinstance(seq,Sequence) else seq
+    batch.append(text)
+    size += len(text) + 1
+    if size >= batchSize:
+      yield batch
+      batch = list()
+      size = 0
+  if batch:
+    yield batch
+
+def _countBatch(args):
+  """Worker: count the k-mers of a batch of sequences."""
+  texts,k,canonical,skipAmbiguous = args
+  counter = KmerCounter(k,canonical,skipAmbiguous)
+  counter.add(_separator.join(texts))
+  return counter.counts()
+
+def countKmers(seqs,k,canonical=False,skipAmbiguous=True,processes=None,batchSize=1<<22):
+  """Count the k-mers of a collection of sequences, using several processes.
+
+     The sequences are split into batches of about ``batchSize`` bases;
+     each worker counts one batch at a time and returns its (compact)
+     table of counts, which is merged into the result.
+
+     :param seqs: An iterable of ``Sequence`` objects (or strings).
+     :param k: The k-mer length.
+     :param canonical: Count k-mers and their reverse complements together.
+     :param skipAmbiguous: Skip k-mers containing ambiguity codes (rather
+                           than raising ``ValueError``).
+     :param processes: The number of worker processes (default: the number
+                       of CPUs; 1 counts in this process).
+     :rtype: KmerCounter
+  """
+  if processes == None:
+    processes = multiprocessing.cpu_count()
+  counter = KmerCounter(k,canonical,skipAmbiguous,batchSize)
+  if processes <= 1:
+    counter.addAll(seqs)
+    return counter
+  tasks = ((texts,k,canonical,skipAmbiguous) for texts in _batches(seqs,batchSize))
+  first = list(itertools.islice(tasks,2))
+  if len(first) < 2:
+    for texts,k,canonical,skipAmbiguous in first:
+      counter.add(_separator.join(texts))
+    return counter
+  pool = multiprocessing.Pool(processes)
+  try:
+    for keys,counts in pool.imap_unordered(_countBatch,itertools.chain(first,tasks)):
+      counter._addCounts(keys,counts)
+  finally:
+    pool.close()
+    pool.join()
+  return counter
@@ -0,0 +1,238 @@
+"""Compact storage of DNA sequences, at 2 bits per base.
+
+   ``PackedSequence`` stores the bases ``A``, ``C``, ``G`` and ``T`` four to
+   a byte, as the UCSC 2bit format does.  Everything else is kept aside as
+   runs: runs of ``N`` and other IUPAC ambiguity codes (each run a single
+   repeated character), and runs of lower-case (soft-masked) bases.  A
+   human reference genome takes about 800 MB this way, rather than over
+   3 GB as ``str`` objects::
+
+     chrom = PackedSequence(text,name="chr1")
+     promoter = chrom[1000000:1002000]    # a PackedSequence
+     print promoter.fasta()
+
+   Slicing, ``len``, ``fasta()`` and comparison of two packed sequences work
+   on the packed form; only the bases actually needed are decoded.
+"""
+import numpy
+
+from bode.seq import Sequence, SeqType
+
+################################################################################
+
+_position = numpy.uint32
+"""The type of run positions (so sequences are limited to 4 Gb)."""
+
+_letters = numpy.frombuffer(b"ACGT",dtype=numpy.uint8)
+
+_codes = numpy.repeat(numpy.uint8(255),256)
+for _c in Sequence.legalDNA:
+  _codes[ord(_c)] = _codes[ord(_c.lower())] = 4
+for _i,_c in enumerate("ACGT"):
+  _codes[ord(_c)] = _codes[ord(_c.lower())] = _i
+
+def _boolRuns(flags):
+  """The starts and ends of the runs of ``True`` in a boolean array."""
+  edges = numpy.diff(numpy.concatenate(([0],flags.view(numpy.int8),[0])))
+  return (numpy.flatnonzero(edges == 1).astype(_position),
+          numpy.flatnonzero(edges == -1).astype(_position))
+
+def _clipRuns(starts,ends,left,right):
+  """The runs overlapping ``[left,right)``, clipped and shifted to start at
+     ``left``; also returns the indexes of the runs selected."""
+  i = numpy.searchsorted(ends,left,side="right")
+  j = numpy.searchsorted(starts,right,side="left") if right > left else i
+  return ((numpy.maximum(starts[i:j],left) - left).astype(_position),
+          (numpy.minimum(ends[i:j],right) - left).astype(_position),
+          slice(i,j))
+
+def _pack(codes):
+  """Pack an array of 2-bit codes, four to a byte (first base highest)."""
+  n = len(codes)
+  padded = numpy.zeros(((n + 3) // 4) * 4,dtype=numpy.uint8)
+  padded[:n] = codes
+  quads = padded.reshape(-1,4)
+  return (quads[:,0] << 6) | (quads[:,1] << 4) | (quads[:,2] << 2) | quads[:,3]
+
+class PackedSequence(Sequence):
+  """A DNA sequence stored at 2 bits per base.
+
+     The sequence may hold any IUPAC nucleotide code, in either case; other
+     characters raise ``ValueError``.  The type is always
+     ``SeqType.DNA``.  ``seq`` (and ``str()``) decode the whole sequence.
+  """
+
+  def __init__(self,seq,name=None):
+    """Pack a sequence.
+
+       :param seq: The sequence.
+       :type seq: str
+       :param name: The name of the sequence (if applicable).
+       :type name: str
+    """
+    super(PackedSequence,self).__init__(seq,name=name,type=SeqType.DNA)
+
+  @classmethod
+  def _fromParts(cls,length,packed,excStarts,excEnds,excChars,lowStarts,lowEnds,name=None):
+    ps = cls.__new__(cls)
+    ps._name = name
+    ps._type = SeqType.DNA
+    ps._typeGuessed = False
+    ps._mask = None
+    ps._length = length
+    ps._packed = packed
+    ps._excStarts = excStarts
+    ps._excEnds = excEnds
+    ps._excChars = excChars
+    ps._lowStarts = lowStarts
+    ps._lowEnds = lowEnds
+    return ps
+
+  def _encode(self,seq):
+    if not isinstance(seq,bytes):
+      seq = seq.encode("ascii")
+    raw = numpy.frombuffer(seq,dtype=numpy.uint8)
+    codes = _codes[raw]
+    bad = numpy.flatnonzero(codes == 255)
+    if len(bad):
+      raise ValueError("Not a nucleotide code: %r at position %d" % (seq[bad[0]:bad[0]+1],bad[0]))
+    self._length = len(raw)
+    self._lowStarts,self._lowEnds = _boolRuns(raw >= ord("a"))
+    exc = codes == 4
+    key = numpy.where(exc,raw & 0xdf,0)
+    if len(key):
+      bounds = numpy.flatnonzero(key[1:] != key[:-1]) + 1
+      starts = numpy.concatenate(([0],bounds))
+      ends = numpy.concatenate((bounds,[len(key)]))
+    else:
+      starts = ends = numpy.zeros(0,dtype=numpy.int64)
+    runs = key[starts] != 0
+    self._excStarts = starts[runs].astype(_position)
+    self._excEnds = ends[runs].astype(_position)
+    self._excChars = key[self._excStarts].astype(numpy.uint8)
+    codes[exc] = 0
+    self._packed = _pack(codes)
+
+  def _decodeCodes(self,left,right):
+    """The 2-bit codes of bases ``left`` to ``right``."""
+    first = left // 4
+    quads = self._packed[first:(right + 3) // 4]
+    codes = numpy.empty((len(quads),4),dtype=numpy.uint8)
+    codes[:,0] = quads >> 6
+    codes[:,1] = (quads >> 4) & 3
+    codes[:,2] = (quads >> 2) & 3
+    codes[:,3] = quads & 3
+    return codes.ravel()[left-4*first:right-4*first]
+
+  def decode(self,left=0,right=None):
+    """The bases from ``left`` to ``right`` (0-based, half-open), as a
+       string."""
+    if right == None or right > self._length:
+      right = self._length
+    if left >= right:
+      return ""
+    out = _letters[self._decodeCodes(left,right)]
+    starts,ends,sel = _clipRuns(self._excStarts,self._excEnds,left,right)
+    for s,e,c in zip(starts,ends,self._excChars[sel]):
+      out[s:e] = c
+    starts,ends,sel = _clipRuns(self._lowStarts,self._lowEnds,left,right)
+    for s,e in zip(starts,ends):
+      out[s:e] |= 0x20
+    return out.tostring()
+
+  def _getPackedSeq(self):
+    return self.decode()
+  def _setPackedSeq(self,seq):
+    self._encode(seq)
+  _seq = property(_getPackedSeq,_setPackedSeq)
+
+  def _getNBytes(self):
+    return (self._packed.nbytes + self._excStarts.nbytes + self._excEnds.nbytes +
+            self._excChars.nbytes + self._lowStarts.nbytes + self._lowEnds.nbytes)
+  nbytes = property(_getNBytes)
+  """The memory used by the packed sequence, in bytes (get)."""
+
+  def _seqLength(self):
+    return self._length
+  length = property(_seqLength)
+  """The length of the sequence (get).
+
+     :rtype: int
+  """
+
+  def __len__(self):
+    return self._length
+
+  def __getitem__(self,key):
+    """A single base (as a string), or a slice (as a ``PackedSequence``)."""
+    if isinstance(key,slice):
+      left,right,step = key.indices(self._length)
+      if step != 1:
+        return PackedSequence(self.decode()[key])
+      return self.subsequence(left,right)
+    if key < 0:
+      key += self._length
+    if key < 0 or key >= self._length:
+      raise IndexError("PackedSequence index out of range")
+    return self.decode(key,key+1)
+
+  def subsequence(self,left,right):
+    """The bases from ``left`` to ``right`` (0-based, half-open), as a new
+       ``PackedSequence``, without decoding them.
+
+       :rtype: PackedSequence
+    """
+    left = max(0,left)
+    right = max(left,min(right,self._length))
+    if left % 4 == 0:
+      packed = self._packed[left//4:(right+3)//4].copy()
+      if right % 4 and len(packed):
+        packed[-1] &= (0xff << (2 * (4 - right % 4))) & 0xff
+    else:
+      packed = _pack(self._decodeCodes(left,right))
+    excStarts,excEnds,sel = _clipRuns(self._excStarts,self._excEnds,left,right)
+    lowStarts,lowEnds,unused = _clipRuns(self._lowStarts,self._lowEnds,left,right)
+    return PackedSequence._fromParts(right-left,packed,excStarts,excEnds,
+                                     self._excChars[sel].copy(),lowStarts,lowEnds)
+
+  def __eq__(self,other):
+    if isinstance(other,PackedSequence):
+      return (self._length == other._length and
+              numpy.array_equal(self._packed,other._packed) and
+              numpy.array_equal(self._excStarts,other._excStarts) and
+              numpy.array_equal(self._excEnds,other._excEnds) and
+              numpy.array_equal(self._excChars,other._excChars) and
+              numpy.array_equal(self._lowStarts,other._lowStarts) and
+              numpy.array_equal(self._lowEnds,other._lowEnds))
+    if isinstance(other,Sequence):
+      return self._length == len(other.seq) and self.decode() == other.seq
+    return False
+
+  def __ne__(self,other):
+    return not self == other
+
+  def saneSeq(self):
+    """Test whether the object is more or less real-looking.
+
+       The sequence was checked when it was packed, so this only tests
+       that the name is either ``None`` or a string.
+
+       :rtype: bool
+    """
+    return self._name == None or isinstance(self._name,str)
+
+  def __repr__(self):
+    name = '"%s"' % (self._name,) if self._name != None else "None"
+    return "PackedSequence(length=%d,name=%s)" % (self._length,name)
+
+  def fasta(self,head=0,tail=0):
+    """The sequence in Fasta format.
+
+       :param head: The number of bp to trim from the head of the sequence.
+       :type head: int
+       :param tail: The number of bp to trim from the tail of the sequence.
+       :type tail: int
+       :rtype: str
+    """
+    tag = self._name if self._name != None else "sequence"
+    return ">%s\n%s\n" % (tag,self.decode(head,self._length-tail))
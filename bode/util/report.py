@@ -0,0 +1,140 @@
+"""Buffered writing of reports (for ``xgrep`` and ``xdiff``).
+
+   ``ReportWriter`` collects rows or records in memory and writes them to
+   the output in large blocks, as tab-separated lines or as JSON lines::
+
+     report = ReportWriter(sys.stdout,format="json",columns=("file","row"))
+     report.writeRow((fn,i))
+     ...
+     report.close()
+
+   ``cellText`` formats spreadsheet cells as ``xgrep`` prints them; dates,
+   which usually repeat many times in a workbook, are converted with
+   ``xldate_as_tuple`` once per distinct value.
+"""
+import sys
+import json
+import collections
+import xlrd
+
+################################################################################
+
+# the default (ASCII-escaped) encoding uses the C encoder; ensure_ascii=False
+# does not, and is several times slower
+_encodeJson = json.JSONEncoder().encode
+_encodeSortedJson = json.JSONEncoder(sort_keys=True).encode
+
+_text = xlrd.XL_CELL_TEXT
+_number = xlrd.XL_CELL_NUMBER
+_date = xlrd.XL_CELL_DATE
+_boolean = xlrd.XL_CELL_BOOLEAN
+_error = xlrd.XL_CELL_ERROR
+
+_dateCache = dict()
+_dateCacheSize = 1 << 16
+
+def formatDate(value,datemode):
+  """A date cell value as ``year-month-day@hour:minute``."""
+  key = (value,datemode)
+  text = _dateCache.get(key)
+  if text == None:
+    t = xlrd.xldate_as_tuple(value,datemode)
+    text = "%d-%d-%d@%d:%d" % (t[0],t[1],t[2],t[3],t[4])
+    if len(_dateCache) >= _dateCacheSize:
+      _dateCache.clear()
+    _dateCache[key] = text
+  return text
+
+def cellText(cell,datemode):
+  """The text of a cell, as printed by ``xgrep``."""
+  return rowTexts((cell,),datemode)[0]
+
+def rowTexts(row,datemode):
+  """The texts of the cells of a row (see ``cellText``)."""
+  texts = []
+  append = texts.append
+  for cell in row:
+    t = cell.ctype
+    if t == _text:
+      append(cell.value)
+    elif t == _number:
+      append("%f" % (cell.value,))
+    elif t == _date:
+      text = _dateCache.get((cell.value,datemode))
+      append(text if text != None else formatDate(cell.value,datemode))
+    elif t == _boolean:
+      append("T" if cell.value == 1 else "F")
+    elif t == _error:
+      append("ERROR")
+    else:
+      append("")
+  return texts
+
+################################################################################
+
+class ReportWriter(object):
+  """Buffered output of rows (as TSV or JSON lines) and text."""
+
+  formats = ("tsv","json")
+
+  def __init__(self,fd=None,format="tsv",columns=None,bufferSize=1<<20):
+    """Create a writer.
+
+       :param fd: The output file object (default: ``sys.stdout``).  It is
+                  not closed by ``close``.
+       :param format: ``"tsv"`` or ``"json"``.
+       :param columns: The column names: rows are written as JSON objects
+                       with these keys (otherwise as arrays), and records
+                       as TSV lines of these fields.
+       :param bufferSize: The amount of output (in bytes) collected
+                          before it is written.
+    """
+    if format not in self.formats:
+      raise ValueError("Unknown report format: %s" % (format,))
+    self.fd = fd if fd != None else sys.stdout
+    self.format = format
+    self.columns = list(columns) if columns != None else None
+    self.bufferSize = bufferSize
+    self._parts = []
+    self._size = 0
+
+  def write(self,text):
+    """Write text (already formatted) to the report.  Unicode text is
+       written as UTF-8; byte strings are written as they are."""
+    if isinstance(text,unicode):
+      text = text.encode("utf-8")
+    self._parts.append(text)
+    self._size += len(text)
+    if self._size >= self.bufferSize:
+      self.flush()
+
+  def writeRow(self,values):
+    """Write a row of values."""
+    if self.format == "json":
+      record = collections.OrderedDict(zip(self.columns,values)) if self.columns != None else list(values)
+      self.write(_encodeJson(record) + "\n")
+    else:
+      try:
+        line = "\t".join(values)
+      except TypeError:
+        line = "\t".join([v if isinstance(v,basestring) else unicode(v) for v in values])
+      self.write(line + "\n")
+
+  def writeRecord(self,record):
+    """Write a record (a dict): as a JSON object (with sorted keys), or as
+       a TSV row of its values for ``columns``."""
+    if self.format == "json":
+      self.write(_encodeSortedJson(record) + "\n")
+    else:
+      self.writeRow([record.get(c,"") for c in self.columns or sorted(record)])
+
+  def flush(self):
+    if self._parts:
+      self.fd.write("".join(self._parts))
+      self._parts = []
+      self._size = 0
+    self.fd.flush()
+
+  def close(self):
+    """Write anything buffered (the output file is left open)."""
+    self.flush()
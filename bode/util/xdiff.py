@@ -1,41 +1,293 @@
 import sys
+import bisect
+import difflib
+import multiprocessing
 import xlrd
 
+import report
+
+################################################################################
+
+_books = dict()
+
+def openBook(fn):
+  """Open a workbook, loading sheets only as they are used (``.xls`` only;
+     ``xlrd`` always loads the whole of an ``.xlsx`` file).  Each process
+     keeps the workbooks it has opened."""
+  if fn not in _books:
+    fd = open(fn,"rb")
+    zipped = fd.read(2) == "PK"
+    fd.close()
+    _books[fn] = xlrd.open_workbook(fn,on_demand=not zipped)
+  return _books[fn]
+
+def _rowValues(sheet,j):
+  """The values of a row, without trailing empty cells."""
+  values = sheet.row_values(j)
+  while values and values[-1] == "":
+    values.pop()
+  return tuple(values)
+
+matcherLimit = 1 << 18
+"""Unanchored stretches of rows are aligned with ``difflib.SequenceMatcher``
+   if the product of their lengths is at most this, and paired by position
+   otherwise."""
+
+def _trim(rowsa,rowsb,alo,ahi,blo,bhi):
+  """The lengths of the common prefix and suffix of two ranges of rows."""
+  n = min(ahi - alo,bhi - blo)
+  pre = 0
+  while pre < n and rowsa[alo+pre] == rowsb[blo+pre]:
+    pre += 1
+  post = 0
+  while post < n - pre and rowsa[ahi-1-post] == rowsb[bhi-1-post]:
+    post += 1
+  return pre,post
+
+def _anchors(rowsa,rowsb,alo,ahi,blo,bhi):
+  """The rows occurring exactly once in each of two ranges, as ``(ja,jb)``
+     pairs: the longest series whose positions increase in both."""
+  seen = dict()
+  for j in range(alo,ahi):
+    seen[rowsa[j]] = j if rowsa[j] not in seen else -1
+  inB = dict()
+  for j in range(blo,bhi):
+    r = rowsb[j]
+    if seen.get(r,-1) >= 0:
+      inB[r] = j if r not in inB else -1
+  pairs = [(seen[r],jb) for r,jb in inB.iteritems() if jb >= 0]
+  pairs.sort()
+  # longest increasing subsequence of the positions in B (patience sorting)
+  tails = []
+  tailPairs = []
+  previous = []
+  for k,(ja,jb) in enumerate(pairs):
+    t = bisect.bisect_left(tails,jb)
+    previous.append(tailPairs[t-1] if t else -1)
+    if t == len(tails):
+      tails.append(jb)
+      tailPairs.append(k)
+    else:
+      tails[t] = jb
+      tailPairs[t] = k
+  result = []
+  k = tailPairs[-1] if tailPairs else -1
+  while k >= 0:
+    result.append(pairs[k])
+    k = previous[k]
+  result.reverse()
+  return result
+
+def alignRows(rowsa,rowsb):
+  """Align two lists of rows.
+
+     The common head and tail are stripped, and the rest anchored on the
+     rows occurring exactly once in each list (as in "patience" diff), so
+     the many copies of a repeated row (such as a blank one) are never
+     compared with each other; the stretches between anchors are aligned
+     in the same way, in turn.  Stretches with no such rows are aligned
+     with ``difflib.SequenceMatcher`` if small (see ``matcherLimit``), and
+     paired by position otherwise.
+
+     :returns: A list of opcodes, as from ``SequenceMatcher.get_opcodes``
+               (except that successive ``"equal"`` blocks are not joined).
+  """
+  opcodes = []
+  stack = [(0,len(rowsa),0,len(rowsb))]
+  while stack:
+    alo,ahi,blo,bhi = stack.pop()
+    pre,post = _trim(rowsa,rowsb,alo,ahi,blo,bhi)
+    if pre:
+      opcodes.append(("equal",alo,alo+pre,blo,blo+pre))
+    if post:
+      # handled after the middle (the stack is last in, first out)
+      stack.append((ahi-post,ahi,bhi-post,bhi))
+    alo += pre
+    blo += pre
+    ahi -= post
+    bhi -= post
+    if alo == ahi and blo == bhi:
+      continue
+    if alo == ahi or blo == bhi:
+      opcodes.append(("insert" if alo == ahi else "delete",alo,ahi,blo,bhi))
+      continue
+    anchors = _anchors(rowsa,rowsb,alo,ahi,blo,bhi)
+    if anchors:
+      gaps = []
+      for ja,jb in anchors:
+        gaps.append((alo,ja,blo,jb))
+        gaps.append((ja,ja+1,jb,jb+1))
+        alo = ja + 1
+        blo = jb + 1
+      gaps.append((alo,ahi,blo,bhi))
+      stack.extend(reversed(gaps))
+    elif (ahi - alo) * (bhi - blo) <= matcherLimit:
+      matcher = difflib.SequenceMatcher(None,rowsa[alo:ahi],rowsb[blo:bhi],autojunk=False)
+      for op,a0,a1,b0,b1 in matcher.get_opcodes():
+        opcodes.append((op,alo+a0,alo+a1,blo+b0,blo+b1))
+    else:
+      opcodes.append(("replace",alo,ahi,blo,bhi))
+  return opcodes
+
+def _cellDiffs(i,ja,jb,ra,rb):
+  records = []
+  for k in range(0,max(len(ra),len(rb))):
+    va = ra[k] if k < len(ra) else ""
+    vb = rb[k] if k < len(rb) else ""
+    if va != vb:
+      records.append({"sheet":i,"op":"changed","rowA":ja,"rowB":jb,"col":k,"a":va,"b":vb})
+  return records
+
+def formatRecord(record):
+  """A line of the text report for a record of ``diffSheet``."""
+  op = record["op"]
+  if op == "changed":
+    ja = record["rowA"]
+    jb = record["rowB"]
+    at = "%d" % (ja,) if ja == jb else "%d/%d" % (ja,jb)
+    return u"%s,%d: %s != %s\n" % (at,record["col"],record["a"],record["b"])
+  elif op == "deleted":
+    return u"< %d: %s\n" % (record["rowA"],"\t".join([unicode(v) for v in record["values"]]))
+  elif op == "inserted":
+    return u"> %d: %s\n" % (record["rowB"],"\t".join([unicode(v) for v in record["values"]]))
+  elif op == "sheet":
+    return u"Sheet %d (%s): %d rows, %d rows\n" % (record["sheet"],record["name"],record["rowsA"],record["rowsB"])
+  return u"Sheet %d only in %s\n" % (record["sheet"],record["file"])
+
+def diffSheet(args):
+  """Compare one sheet of two workbooks.
+
+     Each row is reduced to a tuple of its values, which are compared as
+     wholes, and the rows aligned with ``alignRows``, so inserted and
+     deleted rows do not shift every later row.
+
+     :param args: The two file names and the sheet index.
+     :returns: The differences, as a list of records (dicts with an
+               ``"op"`` of ``"sheet"``, for the first, then ``"changed"``,
+               ``"deleted"`` or ``"inserted"``); empty if the sheets are
+               the same.
+  """
+  fna,fnb,i = args
+  bka = openBook(fna)
+  bkb = openBook(fnb)
+  sa = bka.sheet_by_index(i)
+  sb = bkb.sheet_by_index(i)
+  rowsa = [_rowValues(sa,j) for j in range(0,sa.nrows)]
+  rowsb = [_rowValues(sb,j) for j in range(0,sb.nrows)]
+  if bka.on_demand:
+    bka.unload_sheet(i)
+  if bkb.on_demand:
+    bkb.unload_sheet(i)
+  records = diffRows(i,rowsa,rowsb)
+  if records:
+    records.insert(0,{"sheet":i,"op":"sheet","name":sa.name,"rowsA":sa.nrows,"rowsB":sb.nrows})
+  return records
+
+def diffRows(i,rowsa,rowsb):
+  """The differences between two lists of rows (of sheet ``i``), as the
+     ``"changed"``, ``"deleted"`` and ``"inserted"`` records of
+     ``diffSheet``."""
+  records = []
+  for op,a0,a1,b0,b1 in alignRows(rowsa,rowsb):
+    if op == "equal":
+      continue
+    paired = min(a1 - a0,b1 - b0) if op == "replace" else 0
+    for k in range(0,paired):
+      records.extend(_cellDiffs(i,a0+k,b0+k,rowsa[a0+k],rowsb[b0+k]))
+    for j in range(a0+paired,a1):
+      records.append({"sheet":i,"op":"deleted","rowA":j,"values":rowsa[j]})
+    for j in range(b0+paired,b1):
+      records.append({"sheet":i,"op":"inserted","rowB":j,"values":rowsb[j]})
+  return records
+
+################################################################################
+
 class Xdiff(object):
 
-  def __init__(self):
+  def __init__(self,processes=None,writer=None):
     self.fna = None
     self.fda = None
     self.fnb = None
     self.fdb = None
+    self.processes = processes
+    self.report = writer if writer != None else report.ReportWriter(sys.stdout)
 
   def diff(self,fna,fnb):
     self.fna = fna
     self.fnb = fnb
     self.fda = xlrd.open_workbook(fna)
     self.fdb = xlrd.open_workbook(fnb)
-    
+    out = self.report
+
     nsheets = min(self.fda.nsheets,self.fdb.nsheets)
     for i in range(0,nsheets):
       sa = self.fda.sheet_by_index(i)
       sb = self.fdb.sheet_by_index(i)
       stopAtFirst = False
       if sa.nrows != sb.nrows:
-        sys.stdout.write("Size mismatch: sheet %d: %d != %d\n" % (i,sa.nrows,sb.nrows))
-        sys.stdout.write("(Stopping at first mismatch.)\n")
+        out.write("Size mismatch: sheet %d: %d != %d\n" % (i,sa.nrows,sb.nrows))
+        out.write("(Stopping at first mismatch.)\n")
         stopAtFirst = True
       for j in range(0,min(sa.nrows,sb.nrows)):
         ra = sa.row_slice(j)
         rb = sb.row_slice(j)
         if len(ra) != len(rb):
-          sys.stdout.write("%d: length mismatch: %d != %s\n" % (j,len(ra),len(rb)))
+          out.write("%d: length mismatch: %d != %s\n" % (j,len(ra),len(rb)))
           if stopAtFirst:
             break
         breaking = False
         for k in range(0,min(len(ra),len(rb))):
           if ra[k].value != rb[k].value:
-            sys.stdout.write("%d,%d: %s != %s\n" % (j,k,ra[k].value,rb[k].value))
+            out.write("%d,%d: %s != %s\n" % (j,k,ra[k].value,rb[k].value))
             if stopAtFirst:
               breaking = True
         if breaking:
           break
+    out.flush()
+
+  def streamDiff(self,fna,fnb):
+    """Compare two workbooks row by row, aligning inserted and deleted rows.
+
+       In the text (``"tsv"``) report, changed cells are shown as
+       ``row,col: a != b`` (``rowA/rowB,col`` when the rows have moved),
+       rows only in the first workbook as ``< row: values`` and rows only in
+       the second as ``> row: values``; a ``"json"`` report has one record
+       (see ``diffSheet``) per line.  Sheets are compared in parallel, in
+       ``processes`` worker processes (default: the number of CPUs), and
+       reported in order.
+
+       :returns: The number of sheets that differ.
+    """
+    self.fna = fna
+    self.fnb = fnb
+    self.fda = openBook(fna)
+    self.fdb = openBook(fnb)
+    out = self.report
+    put = out.writeRecord if out.format == "json" else lambda r:out.write(formatRecord(r))
+    nsheets = min(self.fda.nsheets,self.fdb.nsheets)
+    for fn,bk in ((fna,self.fda),(fnb,self.fdb)):
+      for i in range(nsheets,bk.nsheets):
+        put({"sheet":i,"op":"only","file":fn})
+    tasks = [(fna,fnb,i) for i in range(0,nsheets)]
+    processes = self.processes or multiprocessing.cpu_count()
+    if processes <= 1 or nsheets <= 1:
+      reports = (diffSheet(t) for t in tasks)
+      pool = None
+    else:
+      pool = multiprocessing.Pool(min(processes,nsheets))
+      reports = pool.imap(diffSheet,tasks)
+    ndiff = abs(self.fda.nsheets - self.fdb.nsheets)
+    try:
+      for records in reports:
+        if records:
+          ndiff += 1
+        for record in records:
+          put(record)
+      out.flush()
+    finally:
+      if pool != None:
+        pool.close()
+        pool.join()
+      _books.pop(fna,None)
+      _books.pop(fnb,None)
+    return ndiff
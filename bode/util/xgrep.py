@@ -1,47 +1,175 @@
+import re
 import sys
+import struct
+import zipfile
+import multiprocessing
 import xlrd
 
+import report
+
+################################################################################
+
+_numberChars = frozenset("0123456789.-infa")
+
+def _text(tag):
+  """A tag as unicode (byte strings, as from the command line, are taken to
+     be UTF-8), so that it can be compared with the text of cells."""
+  return tag.decode("utf-8") if isinstance(tag,str) else tag
+
+class Substring(object):
+  """Match rows with a text cell, or a number formatted as ``"%f"``,
+     containing a string.  Numbers are only formatted if the string could
+     occur in one."""
+
+  def __init__(self,tag):
+    tag = _text(tag)
+    self.tag = tag
+    self.numbers = bool(tag) and set(tag) <= _numberChars
+
+  def matchRow(self,types,values):
+    tag = self.tag
+    for t,v in zip(types,values):
+      if t == xlrd.XL_CELL_TEXT:
+        if tag in v:
+          return True
+      elif t == xlrd.XL_CELL_NUMBER and self.numbers:
+        if tag in "%f" % (v,):
+          return True
+    return False
+
+class Regex(object):
+  """Match rows with a text cell matching a regular expression."""
+
+  def __init__(self,pattern,flags=0):
+    self.pattern = re.compile(_text(pattern),flags)
+
+  def matchRow(self,types,values):
+    search = self.pattern.search
+    for t,v in zip(types,values):
+      if t == xlrd.XL_CELL_TEXT and search(v):
+        return True
+    return False
+
+class NumberRange(object):
+  """Match rows with a number cell in ``[lo,hi]`` (either bound may be
+     ``None``)."""
+
+  def __init__(self,lo=None,hi=None):
+    self.lo = lo
+    self.hi = hi
+
+  def matchRow(self,types,values):
+    lo = self.lo if self.lo != None else float("-inf")
+    hi = self.hi if self.hi != None else float("inf")
+    for t,v in zip(types,values):
+      if t == xlrd.XL_CELL_NUMBER and lo <= v <= hi:
+        return True
+    return False
+
+readErrors = (EnvironmentError,SyntaxError,struct.error,zipfile.BadZipfile,
+              xlrd.XLRDError,xlrd.compdoc.CompDocError,
+              AssertionError,IndexError,KeyError,ValueError)
+"""The exceptions raised by ``xlrd`` for an unreadable or corrupt workbook."""
+
+def errorText(e):
+  """The message for an exception of ``readErrors``."""
+  if isinstance(e,(EnvironmentError,xlrd.XLRDError)):
+    return str(e)
+  return "Corrupt workbook (%s: %s)" % (type(e).__name__,e)
+
+def _searchFile(args):
+  """Worker: the matching rows of one file, or an error message."""
+  fn,matcher = args
+  try:
+    grep = Xgrep()
+    grep.open(fn,onDemand=True)
+    return fn,list(grep.matches(matcher)),None
+  except readErrors as e:
+    return fn,[],errorText(e)
+
+def searchFiles(fns,matcher,processes=None,index=None):
+  """Search many workbooks in parallel.
+
+     :param fns: The file names.
+     :param matcher: A ``Substring``, ``Regex`` or ``NumberRange``.
+     :param processes: The number of worker processes (default: the number
+                       of CPUs; 1 searches in this process).
+     :param index: The name of an index file (see ``xindex``): if given,
+                   the index is brought up to date (re-reading only the
+                   workbooks that have changed) and searched instead of
+                   the workbooks.
+     :returns: A generator of ``(fn,rows,error)``, in the order of
+               ``fns``, as the files are searched: ``rows`` are the
+               matching rows, as ``(index,texts)`` pairs (see
+               ``Xgrep.matches``), and ``error`` is ``None`` unless the
+               file could not be read.
+  """
+  if index != None:
+    import xindex
+    idx = xindex.XIndex(index)
+    try:
+      idx.update(fns,processes)
+      for result in idx.search(matcher,fns):
+        yield result
+    finally:
+      idx.close()
+    return
+  tasks = ((fn,matcher) for fn in fns)
+  if processes == None:
+    processes = multiprocessing.cpu_count()
+  if processes <= 1:
+    for result in map(_searchFile,tasks):
+      yield result
+    return
+  pool = multiprocessing.Pool(processes)
+  try:
+    for result in pool.imap(_searchFile,tasks):
+      yield result
+  finally:
+    pool.terminate()
+    pool.join()
+
+def formatMatch(index,texts):
+  """A row (its index and cell texts) as a line of ``xgrep`` output."""
+  return "%d%s%s\n" % (index,"\t" if texts else "","\t".join(texts))
+
+################################################################################
+
 class Xgrep(object):
 
-  def __init__(self):
+  def __init__(self,writer=None):
     self.fn = None
     self.fd = None
+    self.report = writer if writer != None else report.ReportWriter(sys.stdout)
 
-  def open(self,fn):
+  def open(self,fn,onDemand=False):
     self.fn = fn
-    self.fd = xlrd.open_workbook(fn)
+    if onDemand:
+      fd = open(fn,"rb")
+      onDemand = fd.read(2) != "PK"
+      fd.close()
+    self.fd = xlrd.open_workbook(fn,on_demand=onDemand)
+
+  def formatRow(self,index,row):
+    return formatMatch(index,report.rowTexts(row,self.fd.datemode))
 
   def dumpRow(self,index,row):
-    sys.stdout.write("%d"%(index,))
-    for c in row:
-      if c.ctype==xlrd.XL_CELL_EMPTY:
-        sys.stdout.write("\t")
-      if c.ctype==xlrd.XL_CELL_TEXT:
-        sys.stdout.write("\t%s"%(c.value,))
-      elif c.ctype==xlrd.XL_CELL_NUMBER:
-        sys.stdout.write("\t%f"%(c.value,))
-      elif c.ctype==xlrd.XL_CELL_DATE:
-        t = xlrd.xldate_as_tuple(c.value)
-        sys.stdout.write("\t%d-%d-%d@%d:%d"%(t[0],t[1],t[2],t[3],t[4]))
-      elif c.ctype==xlrd.XL_CELL_BOOLEAN:
-        sys.stdout.write("\t%s"%("T" if c.value==1 else "F",))
-      elif c.ctype==xlrd.XL_CELL_ERROR:
-        sys.stdout.write("\tERROR")
-      elif c.ctype==xlrd.XL_CELL_BLANK:
-        sys.stdout.write("\t")
-    sys.stdout.write("\n")
-    
-  def search(self,tag):
-    for sheet in self.fd.sheets():
+    self.report.write(self.formatRow(index,row))
+
+  def matches(self,matcher):
+    """Generate the rows of the open workbook matched by ``matcher``, as
+       ``(index,texts)``: the row's index in its sheet, and the texts of its
+       cells (see ``report.rowTexts``)."""
+    datemode = self.fd.datemode
+    for k in range(0,self.fd.nsheets):
+      sheet = self.fd.sheet_by_index(k)
       for i in range(0,sheet.nrows):
-        row = sheet.row_slice(i)
-        for c in row:
-          if c.ctype==xlrd.XL_CELL_TEXT:
-            if tag in c.value:
-              self.dumpRow(i,row)
-              break;
-          elif c.ctype==xlrd.XL_CELL_NUMBER:
-            repr = "%f" % (c.value,)
-            if tag in repr:
-              self.dumpRow(i,row)
-              break;
+        if matcher.matchRow(sheet.row_types(i),sheet.row_values(i)):
+          yield i,report.rowTexts(sheet.row_slice(i),datemode)
+      if self.fd.on_demand:
+        self.fd.unload_sheet(k)
+
+  def search(self,tag):
+    for index,texts in self.matches(Substring(tag)):
+      self.report.write(formatMatch(index,texts))
+    self.report.flush()
@@ -0,0 +1,209 @@
+"""A persistent index of the cells of a collection of workbooks, for
+   ``xgrep``.
+
+   The index is an SQLite database holding, for every workbook indexed,
+   its modification time and size, the text of its text cells ("terms"),
+   the values of its number cells, and the cell texts of each of its rows
+   (see ``Xgrep.matches``).  Numbers are also stored as terms, formatted as
+   ``"%f"``, so a substring search is a single scan of the distinct terms
+   (not of every cell), and a number range is a lookup in the index of
+   values; no workbook is opened to answer a query::
+
+     index = XIndex("samples.xidx")
+     index.update(glob.glob("archive/*.xls"))
+     for fn,rows,error in index.search(xgrep.Substring("SLX-1234")):
+       ...
+
+   ``update`` re-reads only the workbooks whose modification time or size
+   has changed since they were indexed.
+"""
+import os
+import json
+import sqlite3
+import multiprocessing
+import xlrd
+
+import xgrep
+import report
+
+################################################################################
+
+_schema = """
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY,path TEXT UNIQUE,
+                                  mtime REAL,size INTEGER,error TEXT);
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY,term TEXT UNIQUE);
+CREATE TABLE IF NOT EXISTS cells (term INTEGER,file INTEGER,sheet INTEGER,row INTEGER,
+                                  number INTEGER);
+CREATE TABLE IF NOT EXISTS numbers (value REAL,file INTEGER,sheet INTEGER,row INTEGER);
+CREATE TABLE IF NOT EXISTS rows (file INTEGER,sheet INTEGER,row INTEGER,cells TEXT,
+                                 PRIMARY KEY (file,sheet,row));
+CREATE INDEX IF NOT EXISTS cellsByTerm ON cells (term);
+CREATE INDEX IF NOT EXISTS cellsByFile ON cells (file);
+CREATE INDEX IF NOT EXISTS numbersByValue ON numbers (value);
+CREATE INDEX IF NOT EXISTS numbersByFile ON numbers (file);
+"""
+
+_version = 3
+"""The schema version (``PRAGMA user_version``); older indexes are rebuilt."""
+
+def _readFile(args):
+  """Worker: the rows, terms (of text and number cells) and numbers of one
+     workbook."""
+  fn,mtime,size = args
+  rows = []
+  texts = []
+  numbers = []
+  try:
+    grep = xgrep.Xgrep()
+    grep.open(fn,onDemand=True)
+    bk = grep.fd
+    for k in range(0,bk.nsheets):
+      sheet = bk.sheet_by_index(k)
+      for i in range(0,sheet.nrows):
+        types = sheet.row_types(i)
+        values = sheet.row_values(i)
+        rows.append((k,i,json.dumps(report.rowTexts(sheet.row_slice(i),bk.datemode))))
+        for t,v in zip(types,values):
+          if t == xlrd.XL_CELL_TEXT:
+            texts.append((v,k,i,0))
+          elif t == xlrd.XL_CELL_NUMBER:
+            texts.append(("%f" % (v,),k,i,1))
+            numbers.append((v,k,i))
+      if bk.on_demand:
+        bk.unload_sheet(k)
+  except xgrep.readErrors as e:
+    return fn,mtime,size,[],[],[],xgrep.errorText(e)
+  return fn,mtime,size,rows,texts,numbers,None
+
+class XIndex(object):
+  """An index of the cells of a collection of workbooks."""
+
+  def __init__(self,fn):
+    """Open an index, creating it if it does not exist."""
+    self.fn = fn
+    self.db = sqlite3.connect(fn)
+    # paths are byte strings; text is returned as UTF-8 (but passed to
+    # functions as unicode)
+    self.db.text_factory = str
+    if self.db.execute("PRAGMA user_version").fetchone()[0] != _version:
+      self.db.executescript("DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS terms; DROP TABLE IF EXISTS cells;"
+                            "DROP TABLE IF EXISTS numbers; DROP TABLE IF EXISTS rows;")
+      self.db.execute("PRAGMA user_version = %d" % (_version,))
+    self.db.executescript(_schema)
+
+  def _remove(self,fileId):
+    for table in ("cells","numbers","rows"):
+      self.db.execute("DELETE FROM %s WHERE file = ?" % (table,),(fileId,))
+
+  def _store(self,fn,mtime,size,rows,texts,numbers,error):
+    db = self.db
+    old = db.execute("SELECT id FROM files WHERE path = ?",(fn,)).fetchone()
+    if old != None:
+      self._remove(old[0])
+      db.execute("DELETE FROM files WHERE id = ?",(old[0],))
+    fileId = db.execute("INSERT INTO files (path,mtime,size,error) VALUES (?,?,?,?)",
+                        (fn,mtime,size,error)).lastrowid
+    db.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)",((t,) for t in set(t for t,k,i,n in texts)))
+    db.executemany("INSERT INTO cells SELECT id,?,?,?,? FROM terms WHERE term = ?",
+                   ((fileId,k,i,n,t) for t,k,i,n in texts))
+    db.executemany("INSERT INTO numbers VALUES (?,?,?,?)",((v,fileId,k,i) for v,k,i in numbers))
+    db.executemany("INSERT INTO rows VALUES (?,?,?,?)",((fileId,k,i,cells) for k,i,cells in rows))
+
+  def stale(self,fns):
+    """The files (of ``fns``) not indexed, or changed since they were."""
+    result = []
+    for fn in fns:
+      st = os.stat(fn)
+      old = self.db.execute("SELECT mtime,size FROM files WHERE path = ?",(fn,)).fetchone()
+      if old == None or old[0] != st.st_mtime or old[1] != st.st_size:
+        result.append((fn,st.st_mtime,st.st_size))
+    return result
+
+  def update(self,fns,processes=None):
+    """Index the workbooks (of ``fns``) that are new or have changed.
+
+       Files that no longer exist are dropped from the index.  Workbooks
+       are read in ``processes`` worker processes (default: the number of
+       CPUs).
+
+       :returns: The number of files (re-)indexed.
+    """
+    fns = [os.path.abspath(fn) for fn in fns]
+    for fn in [fn for fn in fns if not os.path.exists(fn)]:
+      self.drop(fn)
+    tasks = self.stale([fn for fn in fns if os.path.exists(fn)])
+    if processes == None:
+      processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes) if processes > 1 and len(tasks) > 1 else None
+    try:
+      results = pool.imap_unordered(_readFile,tasks) if pool != None else map(_readFile,tasks)
+      for result in results:
+        with self.db:
+          self._store(*result)
+    finally:
+      if pool != None:
+        pool.close()
+        pool.join()
+    return len(tasks)
+
+  def drop(self,fn):
+    """Remove a file from the index."""
+    with self.db:
+      old = self.db.execute("SELECT id FROM files WHERE path = ?",(os.path.abspath(fn),)).fetchone()
+      if old != None:
+        self._remove(old[0])
+        self.db.execute("DELETE FROM files WHERE id = ?",(old[0],))
+
+  def _hits(self,matcher):
+    """An SQL query (and its arguments) for the (file,sheet,row) of the
+       rows matched by ``matcher``."""
+    if isinstance(matcher,xgrep.NumberRange):
+      lo = matcher.lo if matcher.lo != None else float("-inf")
+      hi = matcher.hi if matcher.hi != None else float("inf")
+      return "SELECT DISTINCT file,sheet,row FROM numbers WHERE value BETWEEN ? AND ?",(lo,hi)
+    if isinstance(matcher,xgrep.Regex):
+      self.db.create_function("matches",1,lambda t:matcher.pattern.search(t) != None)
+      where = "matches(term)"
+      args = ()
+      numbers = False
+    elif isinstance(matcher,xgrep.Substring):
+      where = "instr(term,?) > 0"
+      args = (matcher.tag,)
+      numbers = matcher.numbers
+    else:
+      raise TypeError("Unsupported matcher: %r" % (matcher,))
+    query = "SELECT DISTINCT file,sheet,row FROM cells WHERE term IN (SELECT id FROM terms WHERE %s)" % (where,)
+    if not numbers:
+      query += " AND number = 0"
+    return query,args
+
+  def search(self,matcher,fns=None):
+    """Search the index (as ``xgrep.searchFiles``, without reading any
+       workbook).
+
+       :param matcher: A ``Substring``, ``Regex`` or ``NumberRange``.
+       :param fns: The files to report, in order (default: all the files
+                   indexed, in path order).  Files not indexed are
+                   reported as errors.
+       :returns: A generator of ``(fn,rows,error)``.
+    """
+    db = self.db
+    files = dict((path,(fileId,error)) for fileId,path,error in
+                 db.execute("SELECT id,path,error FROM files"))
+    query,args = self._hits(matcher)
+    rows = dict()
+    for fileId,row,cells in db.execute("SELECT rows.file,rows.row,rows.cells FROM rows JOIN (%s) AS hits "
+                                       "ON rows.file = hits.file AND rows.sheet = hits.sheet AND rows.row = hits.row "
+                                       "ORDER BY rows.file,rows.sheet,rows.row" % (query,),args):
+      rows.setdefault(fileId,[]).append((row,json.loads(cells)))
+    if fns == None:
+      fns = sorted(files)
+    for fn in fns:
+      entry = files.get(os.path.abspath(fn))
+      if entry == None:
+        yield fn,[],"Not indexed"
+      else:
+        yield fn,rows.get(entry[0],[]),entry[1]
+
+  def close(self):
+    self.db.close()
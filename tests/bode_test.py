@@ -1,9 +1,14 @@
 import unittest
 import sys
+import pickle
 print sys.path
 from tests import TestUtil
-from bode.seq import Interval
+from bode.seq import Interval, chromKey, chromCompare
 from bode.seq import Sequence,SeqType
+from bode.seq import reverseComplement, reverseComplementAll, translate, translateAll
+from bode.seq.packed import PackedSequence
+from bode.seq.fastq import FastqSequence
+from bode.seq import kmer
 from bode.seq.bed import Bed
 from bode.seq.homerPeak import HomerPeak
 
@@ -126,6 +131,31 @@ class TestInterval(TestUtil):
     self.assertEquals("%s"%x,"chr1:10-20+")
     self.assertEquals(repr(x),"Interval(chr1,10,20,strand='+',name=\"chr1:10-20\")")
 
+  def test_chromKey(self):
+    names = ["chrX","chr10","chr2_random","chr2","chrM","chr1"]
+    self.assertEquals(sorted(names,key=chromKey),["chr1","chr2","chr2_random","chr10","chrM","chrX"])
+    self.assertEquals(chromCompare("chr2","chr10"),-1)
+    self.assertEquals(chromCompare("chrX","chr10"),1)
+    self.assertEquals(chromCompare("chrX","chrX"),0)
+
+  def test_sortKey(self):
+    ivs = [Interval("chr2",5,6,strand="-"),Interval("chr10",1,2),Interval("chr2",5,6),Interval("chr2",5,6,strand="+"),Interval("chr2",1,9)]
+    expected = [ivs[4],ivs[2],ivs[3],ivs[0],ivs[1]]
+    self.assertEquals(sorted(ivs,key=Interval.sortKey),expected)
+    self.assertEquals(sorted(ivs),expected)
+
+  def test_slots(self):
+    x = Interval("chr1",10,20)
+    self.assertEquals(hasattr(x,"__dict__"),False)
+    self.assertRaises(AttributeError,setattr,x,"zork",1)
+
+  def test_pickle(self):
+    x = Interval("chr1",10,20,strand="-",name="zork")
+    for protocol in range(0,pickle.HIGHEST_PROTOCOL+1):
+      y = pickle.loads(pickle.dumps(x,protocol))
+      self.assertEquals(y,x)
+      self.assertEquals(y.name,"zork")
+
 class TestBed(TestUtil):
 
   def test_basicBed(self):
@@ -150,6 +180,10 @@ class TestBed(TestUtil):
     x = Bed("chr1",10,20)
     self.assertEquals("%s"%x,"chr1\t10\t20\tchr1:10-20\t0\t.")
     self.assertEquals(repr(x),"Bed('chr1',10,20,name='chr1:10-20',score=0,strand='.')")
+    x.score = None
+    self.assertEquals(str(x),"chr1\t10\t20\tchr1:10-20")
+    x.name = None
+    self.assertEquals(str(x),"chr1\t10\t20")
 
   def test_bedScore(self):
     x = Bed("chr1",10,20,score=99)
@@ -165,6 +199,24 @@ class TestBed(TestUtil):
     x.score = "zork"
     self.assertEquals(x.saneInterval(),False)
 
+  def test_bedPickle(self):
+    x = Bed("chr1",10,20,name="zork",strand='+',score=99)
+    y = pickle.loads(pickle.dumps(x,0))
+    self.assertEquals(y.score,99)
+    self.assertEquals(repr(y),repr(x))
+
+class TestHomerPeak(TestUtil):
+
+  def test_homerPeak(self):
+    x = HomerPeak("chr1",10,20,"peak1","+",55.0,0.8,55.0,60.0,5.0,11.2,1e-10,4.3,2e-8,1.0)
+    self.assertEquals(x.name,"peak1")
+    self.assertEquals(x.strand,"+")
+    self.assertEquals(x.pvalueVsControl,1e-10)
+    self.assertEquals(x.saneInterval(),True)
+    self.assertEquals(hasattr(x,"__dict__"),False)
+    x.focusRatio = "zork"
+    self.assertEquals(x.saneInterval(),False)
+
 class TestSequence(TestUtil):
 
   def test_sequenceSanity(self):
@@ -173,3 +225,160 @@ class TestSequence(TestUtil):
     self.assertEquals(x.name,None)
     self.assertEquals(x.seqType,SeqType.DNA)
     self.assertEquals(x.length,4)
+
+  def test_sequenceType(self):
+    self.assertEquals(Sequence("ACGTN").seqType,SeqType.DNA)
+    self.assertEquals(Sequence("").seqType,SeqType.DNA)
+    self.assertEquals(Sequence("ACGUN").seqType,SeqType.RNA)
+    self.assertEquals(Sequence("MKTAYIAKQR").seqType,SeqType.PROTEIN)
+    self.assertEquals(Sequence("ACGTU").seqType,SeqType.UNKNOWN)
+    self.assertEquals(Sequence("ACGT*").seqType,SeqType.UNKNOWN)
+    self.assertEquals(Sequence("acgt").seqType,SeqType.UNKNOWN)
+
+  def test_saneSeq(self):
+    self.assertEquals(Sequence("ACGT").saneSeq(),True)
+    self.assertEquals(Sequence("ACGTU").saneSeq(),False)
+    self.assertEquals(Sequence("ACGU",type=SeqType.DNA).saneSeq(),False)
+    self.assertEquals(Sequence("MKTAYIAKQR",type=SeqType.PROTEIN).saneSeq(),True)
+    x = Sequence("ACGT")
+    x.seq = "ACG*"
+    self.assertEquals(x.saneSeq(),False)
+
+  def test_lazyType(self):
+    x = Sequence("ACGT")
+    x.seq = "ACGU"
+    self.assertEquals(x.seqType,SeqType.RNA)
+    x.seq = "MKTAYIAKQR"
+    self.assertEquals(x.seqType,SeqType.PROTEIN)
+    self.assertEquals(x.saneSeq(),True)
+    y = Sequence("ACGT",type=SeqType.DNA)
+    y.seq = "ACGU"
+    self.assertEquals(y.seqType,SeqType.DNA)
+    self.assertEquals(y.saneSeq(),False)
+    y.seqType = None
+    self.assertEquals(y.seqType,SeqType.RNA)
+
+class TestPackedSequence(TestUtil):
+
+  SEQ = "NNNNACGTacgtRYacgNNNTTGCAnnnnGATTACA"
+
+  def test_packed(self):
+    x = PackedSequence(self.SEQ,name="s1")
+    self.assertEquals(x.seq,self.SEQ)
+    self.assertEquals(len(x),len(self.SEQ))
+    self.assertEquals(x.length,len(self.SEQ))
+    self.assertEquals(x.seqType,SeqType.DNA)
+    self.assertEquals(x.fasta(2,3),">s1\n%s\n" % (self.SEQ[2:-3],))
+    self.assertEquals(x[5],"C")
+    self.assertEquals(x[-1],"A")
+    self.assertRaises(ValueError,PackedSequence,"ACGU")
+
+  def test_packedSlice(self):
+    x = PackedSequence(self.SEQ)
+    for left in range(0,len(self.SEQ)):
+      for right in range(left,len(self.SEQ)+2):
+        sub = x[left:right]
+        self.assertEquals(sub.seq,self.SEQ[left:right])
+        self.assertEquals(sub,PackedSequence(self.SEQ[left:right]))
+    self.assertEquals(x[::2].seq,self.SEQ[::2])
+
+  def test_packedEquality(self):
+    x = PackedSequence(self.SEQ)
+    self.assertEquals(x == PackedSequence(self.SEQ),True)
+    self.assertEquals(x != PackedSequence(self.SEQ.upper()),True)
+    self.assertEquals(x == Sequence(self.SEQ),True)
+    self.assertEquals(Sequence(self.SEQ) == x,True)
+    self.assertEquals(x == PackedSequence(self.SEQ[:-1]),False)
+
+class TestFastqSequence(TestUtil):
+
+  def test_fastqSequence(self):
+    x = FastqSequence("ACGTN",name="r1",quality="I5+!#")
+    self.assertEquals(x.seqType,SeqType.DNA)
+    self.assertEquals(list(x.scores),[40,20,10,0,2])
+    self.assertEquals(x.saneSeq(),True)
+    x.quality = "IIIII"
+    self.assertEquals(list(x.scores),[40] * 5)
+    self.assertEquals(FastqSequence("ACGT",quality="@@@@",offset=64).scores.sum(),0)
+    self.assertEquals(FastqSequence("ACGT",quality="II").saneSeq(),False)
+
+class TestKmer(TestUtil):
+
+  def test_codes(self):
+    self.assertEquals(kmer.encodeKmer("ACGT"),0x1b)
+    self.assertEquals(kmer.decodeKmer(0x1b,4),"ACGT")
+    self.assertEquals(list(kmer.kmerCodes("ACGTA",3)),[kmer.encodeKmer(k) for k in ("ACG","CGT","GTA")])
+    self.assertEquals(list(kmer.kmerCodes("ACGNTAC",2)),[kmer.encodeKmer(k) for k in ("AC","CG","TA","AC")])
+    self.assertEquals(list(kmer.kmerCodes("AAC",2,canonical=True)),[kmer.encodeKmer(k) for k in ("AA","AC")])
+    self.assertEquals(list(kmer.kmerCodes("GTT",2,canonical=True)),[kmer.encodeKmer(k) for k in ("AC","AA")])
+    self.assertRaises(ValueError,kmer.kmerCodes,"ACGN",2,skipAmbiguous=False)
+
+  def test_count(self):
+    seqs = [Sequence("ACGTACGTNNacgt"),Sequence("TTTT"),Sequence("A")]
+    for k in (2,13):
+      counts = kmer.countKmers(seqs,k,processes=1)
+      self.assertEquals(counts.total,sum(max(0,len(s) - k + 1) for s in ("ACGTACGT","acgt","TTTT","A")))
+    counts = kmer.countKmers(seqs,2,processes=1)
+    self.assertEquals(counts["AC"],3)
+    self.assertEquals(counts["TT"],3)
+    self.assertEquals(dict(counts.items())["GT"],3)
+    canon = kmer.countKmers(seqs,2,canonical=True,processes=1)
+    self.assertEquals(canon["TT"],3)
+    self.assertEquals(canon["AA"],3)
+    self.assertEquals(canon["AC"],canon["GT"])
+
+  def test_parallel(self):
+    seqs = [Sequence("ACGTTGCAGGCATTACAGATTACA" * 20) for i in range(0,50)]
+    for k in (3,15):
+      serial = kmer.countKmers(seqs,k,canonical=True,processes=1)
+      parallel = kmer.countKmers(seqs,k,canonical=True,processes=2,batchSize=1000)
+      self.assertEquals(list(serial.items()),list(parallel.items()))
+
+  def test_sparseMerge(self):
+    seqs = [Sequence("ACGTTGCAGGCATTACAGATTACA" * 5 + "ACGT" * i) for i in range(0,40)]
+    whole = kmer.KmerCounter(13)
+    whole.add("\n".join(s.seq for s in seqs))
+    limit = kmer.mergeLimit
+    try:
+      kmer.mergeLimit = 50
+      batched = kmer.KmerCounter(13)
+      for s in seqs:
+        batched.add(s)
+      self.assertEquals(batched["ACGTTGCAGGCAT"],whole["ACGTTGCAGGCAT"])
+      for s in seqs:
+        batched.add(s)
+    finally:
+      kmer.mergeLimit = limit
+    self.assertEquals(list(batched.items()),[(km,2 * n) for km,n in whole.items()])
+
+class TestSequenceOps(TestUtil):
+
+  def test_reverseComplement(self):
+    x = Sequence("AACGTRYKMBDHVNacgtn",name="s1")
+    rc = x.reverseComplement()
+    self.assertEquals(rc.seq,"nacgtNBDHVKMRYACGTT")
+    self.assertEquals(rc.name,"s1")
+    self.assertEquals(rc.reverseComplement().seq,x.seq)
+    self.assertEquals(Sequence("ACGU").reverseComplement().seq,"ACGU")
+    self.assertEquals(Sequence("AAGU").reverseComplement().seq,"ACUU")
+    self.assertRaises(ValueError,Sequence("MKQLE").reverseComplement)
+    r = FastqSequence("AACG",name="r1",quality="ABCD").reverseComplement()
+    self.assertEquals((r.seq,r.quality),("CGTT","DCBA"))
+
+  def test_translate(self):
+    x = Sequence("ATGGCCATTGTAATGGGCCGCTGAAAGGGTGCCCGATAG",name="orf")
+    self.assertEquals(x.translate().seq,"MAIVMGR*KGAR*")
+    self.assertEquals(x.translate().seqType,SeqType.PROTEIN)
+    self.assertEquals(x.translate(1).seq,"WPL*WAAERVPD")
+    self.assertEquals(Sequence("AUGUUUUAA").translate().seq,"MF*")
+    self.assertEquals(Sequence("atgGCNTGRNNN").translate().seq,"MAXX")
+    self.assertEquals(Sequence("AT").translate().seq,"")
+
+  def test_batch(self):
+    texts = ["ACGTTG","","AAAC","GCNTTTAA"]
+    self.assertEquals(reverseComplementAll(texts),[reverseComplement(t) for t in texts])
+    self.assertEquals(translateAll(texts,1),[translate(t,1) for t in texts])
+    seqs = [Sequence(t,name=str(i)) for i,t in enumerate(texts)]
+    self.assertEquals([s.seq for s in translateAll(seqs)],["TL","","K","AF"])
+    self.assertEquals([s.name for s in reverseComplementAll(seqs)],["0","1","2","3"])
+    self.assertEquals(translateAll([]),[])
@@ -0,0 +1,787 @@
+import os
+import zlib
+import struct
+import pickle
+import gzip
+import random
+import shutil
+import tempfile
+import unittest
+import numpy
+from tests import TestUtil
+from bode.io import FileFormatError
+from bode.io.bed import BedFile
+from bode.io.columnar import ColumnarIntervalSet, ColumnarBedFile
+from bode.io.overlap import IntervalIndex
+from bode.io import sweep
+from bode.io import extsort
+from bode.io import parallel
+from bode.io import bgzf
+from bode.io import threaded
+from bode.io import tabix
+from bode.io.homer import HomerPeakFile, HomerPeakTable
+from bode.io.fasta import FastaFile, FastaIndex, FastaWriter, indexFasta
+from bode.io import genome
+from bode.io.fastq import FastqFile
+from bode.io import pileup
+from bode.io.cdt import CdtMatrix
+from bode.seq import Interval, Sequence
+from bode.seq.bed import Bed
+
+BEDTEXT = """track name=test
+#comment
+chr1\t10\t20\tzork\t5\t+
+chr1\t30\t40
+
+chr2\t5\t15\tgeorge\t7\t-
+"""
+
+class IOTestCase(TestUtil):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def writeFile(self,name,text):
+    fn = os.path.join(self.tmpdir,name)
+    fd = open(fn,"w")
+    fd.write(text)
+    fd.close()
+    return fn
+
+class TestBedFile(IOTestCase):
+
+  def test_loadHeader(self):
+    bf = BedFile().load(self.writeFile("a.bed",BEDTEXT))
+    self.assertEquals(bf.header,["track name=test","#comment"])
+
+  def test_iterate(self):
+    bf = BedFile().load(self.writeFile("a.bed",BEDTEXT))
+    beds = list(bf)
+    self.assertEquals(len(beds),3)
+    self.assertEquals(beds[0],Bed("chr1",10,20,name="zork",score=5,strand="+"))
+    self.assertEquals(beds[1].name,"chr1:30-40")
+    self.assertEquals(beds[2].strand,"-")
+    self.assertEquals(list(bf),beds)
+    self.assertEquals(bf[2].name,"george")
+    self.assertEquals(len(bf),3)
+
+  def test_stream(self):
+    bf = BedFile(keep=False).load(self.writeFile("a.bed",BEDTEXT))
+    self.assertEquals([b.left for b in bf],[10,30,5])
+    self.assertEquals(len(bf),0)
+    self.assertEquals(list(bf),[])
+    self.assertRaises(IndexError,bf.__getitem__,0)
+
+  def test_notLazy(self):
+    bf = BedFile(keep=False).load(self.writeFile("a.bed",BEDTEXT),lazy=False)
+    self.assertEquals(len(bf),3)
+    self.assertEquals(bf[-1].chrom,"chr2")
+
+  def test_next(self):
+    bf = BedFile().load(self.writeFile("a.bed",BEDTEXT))
+    self.assertEquals(bf.next().left,10)
+    self.assertEquals(bf.next().left,30)
+    self.assertEquals(bf.next().left,5)
+    self.assertRaises(StopIteration,bf.next)
+    bf.rewind()
+    self.assertEquals(bf.next().left,10)
+
+  def test_badLine(self):
+    bf = BedFile().load(self.writeFile("a.bed","chr1\t10\n"))
+    self.assertRaises(FileFormatError,list,bf)
+
+  def test_save(self):
+    bf = BedFile().load(self.writeFile("a.bed",BEDTEXT))
+    fn = os.path.join(self.tmpdir,"b.bed")
+    bf.save(fn,batchSize=2)
+    saved = BedFile().load(fn)
+    self.assertEquals(saved.header,bf.header)
+    self.assertEquals(list(saved),list(bf))
+    self.assertEquals(open(fn).read().splitlines()[2],"chr1\t10\t20\tzork\t5\t+")
+
+class TestColumnarBedFile(IOTestCase):
+
+  def test_load(self):
+    cb = ColumnarBedFile().load(self.writeFile("a.bed",BEDTEXT))
+    self.assertEquals(cb.header,["track name=test","#comment"])
+    self.assertEquals(len(cb),3)
+    self.assertEquals(list(cb),list(BedFile().load(self.writeFile("b.bed",BEDTEXT))))
+    self.assertEquals(cb[1].name,"chr1:30-40")
+    self.assertEquals(cb[-1].score,7)
+
+  def test_uniformColumns(self):
+    cb = ColumnarBedFile().load(self.writeFile("a.bed","chr2\t1\t5\nchr1\t3\t9\n"))
+    self.assertEquals(list(cb.lefts),[1,3])
+    self.assertEquals([cb.chromNames[c] for c in cb.chroms],["chr2","chr1"])
+    self.assertEquals(cb.names,None)
+    self.assertEquals(cb[0],Bed("chr2",1,5))
+
+  def test_select(self):
+    cb = ColumnarBedFile().load(self.writeFile("a.bed",BEDTEXT))
+    self.assertEquals([b.left for b in cb.select(chrom="chr1")],[10,30])
+    self.assertEquals([b.left for b in cb.select(minScore=6)],[5])
+    self.assertEquals([b.left for b in cb.select(strand="+")],[10])
+    self.assertEquals([b.left for b in cb.select(chrom="chr1",left=25,right=35)],[30])
+    self.assertEquals(len(cb.select(chrom="chrX")),0)
+
+  def test_fromIntervals(self):
+    beds = [Bed("chr1",1,2,score=3),Bed("chr3",4,5,strand="-")]
+    cs = ColumnarIntervalSet.fromIntervals(beds)
+    self.assertEquals(list(cs),beds)
+    cs.append(Bed("chr1",7,8))
+    self.assertEquals(len(cs),3)
+    self.assertEquals(list(cs.chroms),[0,1,0])
+
+  def test_badLine(self):
+    self.assertRaises(FileFormatError,ColumnarBedFile().load,self.writeFile("a.bed","chr1\tx\t5\n"))
+
+  def test_raggedColumns(self):
+    # 18 fields, as if 3 lines of 6, but not 6 on every line
+    fn = self.writeFile("a.bed","chr1\t10\t20\ta\t5\t+\nchr1\t30\t40\tb\t7\nchr2\t5\t15\tc\t9\t-\tx\n")
+    beds = list(BedFile().load(fn))
+    self.assertEquals(list(ColumnarBedFile().load(fn)),beds)
+    self.assertEquals(list(parallel.parallelLoad(fn,processes=1)),beds)
+
+  def test_save(self):
+    cb = ColumnarBedFile().load(self.writeFile("a.bed",BEDTEXT))
+    fn = os.path.join(self.tmpdir,"b.bed")
+    cb.save(fn,batchSize=2)
+    text = open(fn).read()
+    BedFile().load(self.writeFile("a.bed",BEDTEXT)).save(fn)
+    self.assertEquals(text,open(fn).read())
+    self.assertEquals(list(ColumnarBedFile().load(fn)),list(cb))
+
+  def test_saveColumns(self):
+    beds = [Bed("chr2",0,10,name="a",score=1500000,strand="-"),Bed("chr10",123456789,123456790,score=-2)]
+    fn = os.path.join(self.tmpdir,"a.bed")
+    ColumnarIntervalSet.fromIntervals(beds).save(fn)
+    self.assertEquals(open(fn).read(),"".join("%s\n" % (b,) for b in beds))
+    cb = ColumnarBedFile().load(self.writeFile("b.bed","chr2\t1\t5\nchr1\t3\t9\n"))
+    cb.save(fn)
+    self.assertEquals(open(fn).read(),"chr2\t1\t5\nchr1\t3\t9\n")
+
+  def test_saveThreeColumns(self):
+    text = "chr2\t1\t5\nchr1\t3\t9\n"
+    fn = os.path.join(self.tmpdir,"b.bed")
+    for cls in (BedFile,ColumnarBedFile):
+      cls().load(self.writeFile("a.bed",text)).save(fn)
+      self.assertEquals(open(fn).read(),text)
+    # three columns only where nothing is lost
+    text = "chr1\t1\t5\nchr1\t3\t9\tchr1:3-9\t0\t+\nchr1\t4\t9\tchr1:4-9\t7\t.\nchr2\t4\t9\tx\t0\t.\n"
+    saved = []
+    for cls in (BedFile,ColumnarBedFile):
+      cls().load(self.writeFile("a.bed",text)).save(fn)
+      saved.append(open(fn).read())
+      self.assertEquals(list(cls().load(fn)),list(BedFile().load(self.writeFile("a.bed",text))))
+    self.assertEquals(saved,[text,text])
+
+  def test_saveCompressed(self):
+    cb = ColumnarBedFile().load(self.writeFile("a.bed",BEDTEXT))
+    fn = os.path.join(self.tmpdir,"b.bed.gz")
+    cb.save(fn)
+    self.assertEquals(bgzf.isBgzf(fn),True)
+    self.assertEquals(list(ColumnarBedFile().load(fn)),list(cb))
+    cb.save(os.path.join(self.tmpdir,"c.bed"),compress=True)
+    self.assertEquals(gzip.open(os.path.join(self.tmpdir,"c.bed")).read(),gzip.open(fn).read())
+
+class TestIntervalIndex(IOTestCase):
+
+  def brute(self,ivs,chrom,left,right):
+    return sorted((iv.left,iv.right) for iv in ivs if iv.chrom==chrom and iv.left<right and iv.right>left)
+
+  def test_randomQueries(self):
+    rng = random.Random(17)
+    ivs = []
+    for i in range(0,500):
+      left = rng.randint(0,1000)
+      ivs.append(Interval(rng.choice(["chr1","chr2"]),left,left+rng.randint(0,200)))
+    idx = IntervalIndex(ivs)
+    self.assertEquals(len(idx),500)
+    for i in range(0,200):
+      left = rng.randint(-10,1200)
+      right = left + rng.randint(1,100)
+      hits = sorted((iv.left,iv.right) for iv in idx.overlapping("chr1",left,right))
+      self.assertEquals(hits,self.brute(ivs,"chr1",left,right))
+      self.assertEquals(idx.overlapsAny("chr1",left,right),len(hits)>0)
+
+  def test_point(self):
+    idx = IntervalIndex([Interval("chr3",10,20),Interval("chr3",12,15),Interval("chr3",20,30)])
+    self.assertEquals(sorted(iv.left for iv in idx.overlapping("chr3",19)),[10])
+    self.assertEquals(sorted(iv.left for iv in idx.overlapping("chr3",13)),[10,12])
+    self.assertEquals(idx.count("chr3",20),1)
+    self.assertEquals(idx.overlapping("chrX",20),[])
+
+  def test_intervalSet(self):
+    bf = BedFile().load(self.writeFile("a.bed",BEDTEXT))
+    self.assertEquals(sorted(b.name for b in bf.overlapping("chr1",15,35)),["chr1:30-40","zork"])
+    cb = ColumnarBedFile().load(self.writeFile("b.bed",BEDTEXT))
+    self.assertEquals([b.name for b in cb.overlapping("chr1",15,35)],["zork","chr1:30-40"])
+    hits = [(q.name,len(h)) for q,h in bf.index().queryAll(cb)]
+    self.assertEquals(hits,[("zork",1),("chr1:30-40",1),("george",1)])
+
+class TestSweep(IOTestCase):
+
+  def ivs(self,*coords):
+    return [Interval(c,l,r) for c,l,r in coords]
+
+  def spans(self,ivs):
+    return [(iv.chrom,iv.left,iv.right) for iv in ivs]
+
+  def test_intersect(self):
+    a = self.ivs(("chr1",10,20),("chr1",30,40),("chr2",0,10))
+    b = self.ivs(("chr1",15,35),("chr2",5,6),("chr3",0,5))
+    self.assertEquals(self.spans(sweep.intersect(a,b)),[("chr1",15,20),("chr1",30,35),("chr2",5,6)])
+
+  def test_merge(self):
+    a = self.ivs(("chr1",10,20),("chr1",15,25),("chr1",25,30),("chr1",35,40),("chr2",0,10))
+    self.assertEquals(self.spans(sweep.merge(a)),[("chr1",10,30),("chr1",35,40),("chr2",0,10)])
+    self.assertEquals(self.spans(sweep.merge(a,distance=5)),[("chr1",10,40),("chr2",0,10)])
+
+  def test_subtract(self):
+    a = self.ivs(("chr1",10,50),("chr2",0,10))
+    b = self.ivs(("chr1",5,15),("chr1",20,25),("chr1",22,30),("chr1",45,60))
+    self.assertEquals(self.spans(sweep.subtract(a,b)),[("chr1",15,20),("chr1",30,45),("chr2",0,10)])
+
+  def test_closest(self):
+    a = self.ivs(("chr1",10,20),("chr1",50,60),("chr1",100,110),("chr2",0,10))
+    b = self.ivs(("chr1",15,16),("chr1",30,40),("chr1",61,70))
+    res = [(x.left,y.left if y != None else None,d) for x,y,d in sweep.closest(a,b)]
+    self.assertEquals(res,[(10,15,0),(50,61,2),(100,61,31),(0,None,-1)])
+
+  def test_coverage(self):
+    a = self.ivs(("chr1",10,20),("chr1",30,40))
+    b = self.ivs(("chr1",5,12),("chr1",11,15),("chr1",18,19))
+    res = [(n,c,f) for x,n,c,f in sweep.coverage(a,b)]
+    self.assertEquals(res,[(3,6,0.6),(0,0,0.0)])
+
+  def test_unsorted(self):
+    a = self.ivs(("chr2",10,20),("chr1",30,40))
+    self.assertRaises(ValueError,list,sweep.merge(a))
+
+  def test_intervalSet(self):
+    bf = BedFile(keep=False).load(self.writeFile("a.bed",BEDTEXT))
+    pieces = list(bf.subtract(self.ivs(("chr1",12,35))))
+    self.assertEquals(self.spans(pieces),[("chr1",10,12),("chr1",35,40),("chr2",5,15)])
+    self.assertEquals(pieces[0].name,"zork")
+
+class TestSort(IOTestCase):
+
+  UNSORTED = "chrX\t1\t2\nchr10\t5\t9\nchr2\t7\t8\t.\t0\t-\nchr2\t7\t8\nchr2\t3\t4\n"
+  SORTED = [("chr2",3),("chr2",7),("chr2",7),("chr10",5),("chrX",1)]
+
+  def test_sort(self):
+    bf = BedFile().load(self.writeFile("a.bed",self.UNSORTED))
+    bf.sort()
+    self.assertEquals([(b.chrom,b.left) for b in bf],self.SORTED)
+    self.assertEquals(bf[2].strand,"-")
+    self.assertRaises(ValueError,BedFile(keep=False).sort)
+
+  def test_columnarSort(self):
+    cb = ColumnarBedFile().load(self.writeFile("a.bed",self.UNSORTED))
+    cb.sort()
+    self.assertEquals([(b.chrom,b.left) for b in cb],self.SORTED)
+    self.assertEquals(cb[2].strand,"-")
+
+class TestExternalSort(IOTestCase):
+
+  def randomBeds(self,n):
+    rng = random.Random(3)
+    chroms = ["chr1","chr2","chr10","chrX"]
+    beds = []
+    for i in range(0,n):
+      left = rng.randint(0,1000)
+      beds.append(Bed(rng.choice(chroms),left,left+rng.randint(1,50),name="b%d" % (i,),strand=rng.choice("+-.")))
+    return beds
+
+  def test_inMemory(self):
+    beds = self.randomBeds(100)
+    self.assertEquals(list(extsort.externalSort(beds)),sorted(beds))
+
+  def test_spill(self):
+    beds = self.randomBeds(1000)
+    out = list(extsort.externalSort(beds,maxMemory=50*400,tmpdir=self.tmpdir,maxRuns=4))
+    self.assertEquals(out,sorted(beds,key=Interval.sortKey))
+    self.assertEquals([b.name for b in out],[b.name for b in sorted(beds,key=Interval.sortKey)])
+    self.assertEquals(os.listdir(self.tmpdir),[])
+
+  def test_bedFile(self):
+    fn = self.writeFile("a.bed",TestSort.UNSORTED)
+    out = BedFile(keep=False).load(fn).externalSort(maxMemory=800,tmpdir=self.tmpdir)
+    self.assertEquals([(b.chrom,b.left) for b in out],TestSort.SORTED)
+
+class TestParallelLoad(IOTestCase):
+
+  def bedText(self,n):
+    rng = random.Random(5)
+    lines = ["track name=par"]
+    for i in range(0,n):
+      left = rng.randint(0,100000)
+      lines.append("%s\t%d\t%d\tr%d\t%d\t%s" % (rng.choice(["chr1","chr2","chrX"]),left,left+36,i,rng.randint(0,1000),rng.choice("+-")))
+    return "\n".join(lines) + "\n"
+
+  def test_byteRanges(self):
+    fn = self.writeFile("a.bed",self.bedText(100))
+    header,start = parallel.dataStart(fn)
+    self.assertEquals(header,["track name=par"])
+    ranges = parallel.byteRanges(fn,7,start)
+    self.assertEquals(ranges[0][0],start)
+    self.assertEquals(ranges[-1][1],os.path.getsize(fn))
+    text = open(fn).read()
+    for s,e in ranges:
+      self.assertEquals(text[s-1],"\n")
+      self.assertEquals(text[e-1],"\n")
+
+  def test_columnar(self):
+    fn = self.writeFile("a.bed",self.bedText(500))
+    cb = parallel.parallelLoad(fn,processes=3,minRangeSize=100)
+    self.assertEquals(cb.header,["track name=par"])
+    self.assertEquals(list(cb),list(BedFile().load(fn)))
+
+  def test_objects(self):
+    fn = self.writeFile("a.bed",self.bedText(200))
+    bf = parallel.parallelLoad(fn,processes=2,columnar=False,minRangeSize=100)
+    self.assertEquals(list(bf),list(BedFile().load(fn)))
+
+  def test_badLine(self):
+    fn = self.writeFile("a.bed",self.bedText(200) + "chr1\t1\n")
+    self.assertRaises(FileFormatError,parallel.parallelLoad,fn,processes=2,minRangeSize=100)
+
+  def test_badLineNumber(self):
+    lines = self.bedText(300).splitlines()
+    lines[150] = lines[150].replace("\t","\tx",1)
+    lines[250] = "chr1\t1"
+    fn = self.writeFile("a.bed","\n".join(lines) + "\n")
+    for columnar in (True,False):
+      try:
+        parallel.parallelLoad(fn,processes=2,columnar=columnar,minRangeSize=100)
+        self.fail("no FileFormatError")
+      except FileFormatError as e:
+        self.assertEquals(e.line,151)
+    lines[150] = lines[149]
+    fn = self.writeFile("a.bed","\n".join(lines) + "\n")
+    for columnar in (True,False):
+      try:
+        parallel.parallelLoad(fn,processes=2,columnar=columnar,minRangeSize=100)
+        self.fail("no FileFormatError")
+      except FileFormatError as e:
+        self.assertEquals((e.line,e.msg),(251,"Need >= 3 fields in line."))
+
+class TestBgzfTabix(IOTestCase):
+
+  def sortedBed(self,n):
+    rng = random.Random(9)
+    beds = []
+    for chrom in ["chr1","chr2","chrX"]:
+      for i in range(0,n):
+        left = rng.randint(0,2000000)
+        beds.append(Bed(chrom,left,left+rng.randint(1,20000),name="p%d" % (i,),strand="+"))
+    beds.sort()
+    return beds
+
+  def test_roundTrip(self):
+    text = "".join("line %d\n" % (i,) for i in range(0,20000))
+    fn = os.path.join(self.tmpdir,"a.txt.gz")
+    out = bgzf.BgzfWriter(fn)
+    out.write(text)
+    out.close()
+    self.assertEquals(bgzf.isBgzf(fn),True)
+    self.assertEquals(gzip.open(fn).read(),text)
+    reader = bgzf.BgzfReader(fn)
+    self.assertEquals(reader.readline(),"line 0\n")
+    offsets = []
+    for i in range(1,20000):
+      offsets.append(reader.tell())
+      self.assertEquals(reader.readline(),"line %d\n" % (i,))
+    self.assertEquals(reader.readline(),"")
+    reader.seek(offsets[15000])
+    self.assertEquals(reader.readline(),"line 15001\n")
+
+  def test_threadedWriter(self):
+    fn = os.path.join(self.tmpdir,"a.txt.gz")
+    out = threaded.ThreadedWriter(bgzf.BgzfWriter(fn),depth=2)
+    for i in range(0,1000):
+      out.write("line %d\n" % (i,))
+    out.close()
+    self.assertEquals(gzip.open(fn).read(),"".join("line %d\n" % (i,) for i in range(0,1000)))
+    out = threaded.ThreadedWriter(open(fn))
+    out.write("x")
+    self.assertRaises(IOError,out.close)
+
+  def test_loadCompressed(self):
+    fn = self.writeFile("a.bed",BEDTEXT)
+    bgzf.bgzip(fn,fn + ".bgz")
+    self.assertEquals(list(BedFile().load(fn + ".bgz")),list(BedFile().load(fn)))
+    fd = gzip.open(fn + ".gz","wb")
+    fd.write(BEDTEXT)
+    fd.close()
+    self.assertEquals(list(ColumnarBedFile().load(fn + ".gz")),list(BedFile().load(fn)))
+
+  def test_fetch(self):
+    beds = self.sortedBed(2000)
+    fn = self.writeFile("a.bed","".join("%s\n" % (b,) for b in beds))
+    bgzf.bgzip(fn,fn + ".gz")
+    tabix.indexFile(fn + ".gz")
+    bf = BedFile(keep=False).load(fn + ".gz")
+    cb = ColumnarBedFile().load(fn + ".gz")
+    for chrom,left,right in [("chr1",1000000,1002000),("chr2",0,100),("chrX",1999000,2100000),("chr3",0,10)]:
+      expected = [b for b in beds if b.chrom == chrom and b.left < right and b.right > left]
+      self.assertEquals(list(bf.fetch(chrom,left,right)),expected)
+      self.assertEquals(list(cb.fetch(chrom,left,right)),expected)
+
+  def test_fetchWithHeader(self):
+    beds = self.sortedBed(500)
+    bf = BedFile()
+    bf.addHeader("track name=x")
+    bf.addHeader("browser position chr1")
+    bf.addHeader("#comment")
+    for b in beds:
+      bf.append(b)
+    fn = os.path.join(self.tmpdir,"a.bed.gz")
+    bf.save(fn)
+    tabix.indexFile(fn)
+    self.assertEquals(BedFile().load(fn).header,["track name=x","browser position chr1","#comment"])
+    expected = [b for b in beds if b.chrom == "chr2" and b.left < 500000 and b.right > 0]
+    self.assertEquals(list(BedFile().load(fn).fetch("chr2",0,500000)),expected)
+    self.assertEquals(list(ColumnarBedFile().load(fn).fetch("chr2",0,500000)),expected)
+
+  def test_indexBadLine(self):
+    fn = self.writeFile("a.bed","track name=x\nchr1\t10\t20\nchr1\tx\t30\n")
+    bgzf.bgzip(fn,fn + ".gz")
+    try:
+      tabix.indexFile(fn + ".gz")
+      self.fail("no FileFormatError")
+    except FileFormatError as e:
+      self.assertEquals(e.line,3)
+
+  def test_indexRoundTrip(self):
+    beds = self.sortedBed(300)
+    fn = self.writeFile("a.bed","".join("%s\n" % (b,) for b in beds))
+    bgzf.bgzip(fn,fn + ".gz")
+    idx = tabix.indexFile(fn + ".gz")
+    loaded = tabix.TabixIndex().load(fn + ".gz.tbi")
+    self.assertEquals(loaded.names,["chr1","chr2","chrX"])
+    self.assertEquals(loaded.chunks("chr2",5000,90000),idx.chunks("chr2",5000,90000))
+
+HOMERTEXT = """# HOMER Peaks
+# Peak finding parameters:
+# tag directory = ChIP
+# total peaks = 3
+#PeakID\tchr\tstart\tend\tstrand\tNormalized Tag Count\tfocus ratio\tfindPeaks Score\tTotal Tags\tControl Tags (normalized to IP Experiment)\tFold Change vs Control\tp-value vs Control\tFold Change vs Local\tp-value vs Local\tClonal Fold Change
+chr1-1\tchr1\t101\t300\t+\t55.0\t0.8\t55.0\t60.0\t5.0\t11.2\t1.50e-10\t4.3\t2.00e-08\t1.00
+chr2-7\tchr2\t1001\t1200\t+\t20.0\t0.6\t20.0\t22.0\t8.0\t2.5\t1.00e-03\t2.1\t1.00e-02\t1.00
+chr1-2\tchr1\t5001\t5200\t-\t35.0\t0.7\t35.0\t40.0\t4.0\t8.1\t2.00e-09\t3.3\t1.00e-06\t1.20
+"""
+
+class TestHomer(IOTestCase):
+
+  def test_peakFile(self):
+    hf = HomerPeakFile().load(self.writeFile("peaks.txt",HOMERTEXT))
+    peaks = list(hf)
+    self.assertEquals(hf.parameters["total peaks"],"3")
+    self.assertEquals(len(peaks),3)
+    self.assertEquals((peaks[0].chrom,peaks[0].left,peaks[0].right),("chr1",100,300))
+    self.assertEquals(peaks[0].name,"chr1-1")
+    self.assertEquals(peaks[2].strand,"-")
+    self.assertEquals(peaks[1].pvalueVsControl,1e-3)
+    self.assertEquals(peaks[2].clonalFoldChange,1.2)
+    self.assertEquals(peaks[0].saneInterval(),True)
+
+  def test_table(self):
+    fn = self.writeFile("peaks.txt",HOMERTEXT)
+    ht = HomerPeakTable().load(fn)
+    self.assertEquals(len(ht),3)
+    self.assertEquals(list(ht.column("lefts")),[100,1000,5000])
+    self.assertEquals(list(ht.column("foldChangeVsControl")),[11.2,2.5,8.1])
+    self.assertEquals(repr(list(ht)),repr(list(HomerPeakFile().load(fn))))
+    strong = ht.select(pvalueVsControl=(None,1e-8),foldChangeVsControl=(4,None))
+    self.assertEquals([p.name for p in strong],["chr1-1","chr1-2"])
+    self.assertEquals(strong.parameters["tag directory"],"ChIP")
+
+  def test_missingColumn(self):
+    lines = [l.split("\t") for l in HOMERTEXT.splitlines()]
+    text = "\n".join("\t".join(l[:-1]) if len(l) > 1 else l[0] for l in lines) + "\n"
+    fn = self.writeFile("peaks.txt",text)
+    ht = HomerPeakTable().load(fn)
+    self.assertEquals(numpy.isnan(ht.column("clonalFoldChange")).all(),True)
+    self.assertEquals(ht[0].clonalFoldChange,None)
+    self.assertEquals(list(HomerPeakFile().load(fn))[0].clonalFoldChange,None)
+
+  def test_fieldsByTab(self):
+    # a peak ID containing a space and an empty one: as many
+    # whitespace-separated fields as expected, but not tab-separated
+    lines = HOMERTEXT.splitlines()
+    n = len([l for l in lines if l.startswith("#")])
+    lines[n] = "peak 1" + lines[n][lines[n].index("\t"):]
+    lines[n+1] = lines[n+1][lines[n+1].index("\t"):]
+    fn = self.writeFile("peaks.txt","\n".join(lines) + "\n")
+    ht = HomerPeakFile.loadTable(fn)
+    self.assertEquals(list(ht.column("peakIds")),["peak 1","","chr1-2"])
+    self.assertEquals(list(ht.column("lefts")),[100,1000,5000])
+
+  def test_raggedLines(self):
+    lines = HOMERTEXT.splitlines()
+    n = len([l for l in lines if l.startswith("#")])
+    lines[n] += "\t0"
+    lines[n+1] = lines[n+1][:lines[n+1].rindex("\t")]
+    fn = self.writeFile("peaks.txt","\n".join(lines) + "\n")
+    self.assertRaises(FileFormatError,HomerPeakTable().load,fn)
+
+FASTATEXT = """>chr1 first
+ACGTACGTAC
+GTNNNNacgt
+ACG
+>chr2
+GGGGCCCCAA
+TT
+>empty
+"""
+
+class TestFasta(IOTestCase):
+
+  def test_read(self):
+    seqs = list(FastaFile(self.writeFile("a.fa",FASTATEXT)))
+    self.assertEquals([s.name for s in seqs],["chr1","chr2","empty"])
+    self.assertEquals(seqs[0].seq,"ACGTACGTACGTNNNNacgtACG")
+    self.assertEquals(seqs[1].seq,"GGGGCCCCAATT")
+    self.assertEquals(seqs[2].seq,"")
+
+  def test_index(self):
+    fn = self.writeFile("a.fa",FASTATEXT)
+    idx = indexFasta(fn)
+    self.assertEquals(idx.names,["chr1","chr2","empty"])
+    self.assertEquals(open(fn + ".fai").read(),
+                      "chr1\t23\t12\t10\t11\nchr2\t12\t44\t10\t11\nempty\t0\t65\t0\t0\n")
+    self.assertRaises(FileFormatError,FastaIndex().build,self.writeFile("b.fa",">x\nACG\nACGT\n"))
+
+  def test_fetch(self):
+    fa = FastaFile(self.writeFile("a.fa",FASTATEXT))
+    seq = "ACGTACGTACGTNNNNacgtACG"
+    for left in range(0,len(seq)):
+      for right in range(left,len(seq)+2):
+        self.assertEquals(fa.fetch("chr1",left,right).seq,seq[left:right])
+    self.assertEquals(fa.fetch("chr2").seq,"GGGGCCCCAATT")
+    self.assertEquals(fa.fetch("chr2",8,12).name,"chr2:8-12")
+    self.assertRaises(KeyError,fa.fetch,"chr3",0,10)
+    fa.close()
+
+  def test_write(self):
+    fn = os.path.join(self.tmpdir,"b.fa")
+    fw = FastaWriter(fn,width=4)
+    for seq in FastaFile(self.writeFile("a.fa",FASTATEXT)):
+      fw.write(seq)
+    fw.write("ACGT",name="extra")
+    fw.close(index=True)
+    self.assertEquals(open(fn).read()[:26],">chr1\nACGT\nACGT\nACGT\nNNNN\n")
+    written = FastaIndex().load(fn + ".fai")
+    self.assertEquals(written.names,["chr1","chr2","empty","extra"])
+    self.assertEquals(written._entries,FastaIndex().build(fn)._entries)
+    self.assertEquals(FastaFile(fn).fetch("chr1",5,10).seq,"CGTAC")
+
+class TestGenome(IOTestCase):
+
+  SEQS = [Sequence("ACGTACGTACGTNNNNacgtACGTTTGCA",name="chr1"),
+          Sequence("GGGGCCCCAATTnnRYK",name="chr2")]
+
+  def genomes(self):
+    faFn = os.path.join(self.tmpdir,"g.fa")
+    fw = FastaWriter(faFn,width=7)
+    for seq in self.SEQS:
+      fw.write(seq)
+    fw.close()
+    tbFn = os.path.join(self.tmpdir,"g.2bit")
+    genome.writeTwoBit(tbFn,self.SEQS)
+    return [genome.Genome(faFn),genome.Genome(tbFn)]
+
+  def test_fetch(self):
+    fa,tb = self.genomes()
+    self.assertEquals(genome.isTwoBit(fa._fn),False)
+    self.assertEquals(genome.isTwoBit(tb._fn),True)
+    seq = self.SEQS[0].seq
+    for left in range(0,len(seq)):
+      for right in range(left,len(seq)+2):
+        self.assertEquals(fa.fetch("chr1",left,right),seq[left:right])
+        self.assertEquals(tb.fetch("chr1",left,right),seq[left:right])
+    self.assertEquals(fa.fetch("chr2"),"GGGGCCCCAATTnnRYK")
+    self.assertEquals(tb.fetch("chr2"),"GGGGCCCCAATTnnTTT")
+    self.assertEquals(fa.fetch("chr1",8,20,"-"),"acgtNNNNACGT")
+    self.assertRaises(KeyError,tb.fetch,"chr3",0,10)
+    fa.close()
+    tb.close()
+
+  def test_sequences(self):
+    ivs = BedFile().load(self.writeFile("a.bed","chr1\t0\t6\tp1\t0\t+\nchr1\t2\t8\tp2\t0\t-\nchr2\t10\t20\n"))
+    for g in self.genomes():
+      seqs = list(g.sequences(ivs))
+      self.assertEquals([s.name for s in seqs],["p1","p2","chr2:10-20"])
+      self.assertEquals([s.seq for s in seqs[:2]],["ACGTAC","ACGTAC"])
+      self.assertEquals(seqs[2].seq[:4],"TTnn")
+      g = pickle.loads(pickle.dumps(g))
+      self.assertEquals(g.fetch("chr1",0,4),"ACGT")
+      g.close()
+
+FASTQTEXT = """@read1 1:N:0:ACGT
+ACGTNACGTA
++
+IIIIIIIII#
+@read2
+GGGCC
++read2
+!!+5I
+@read3
+T
++
+I
+"""
+
+class TestFastq(IOTestCase):
+
+  def test_read(self):
+    reads = list(FastqFile(self.writeFile("a.fq",FASTQTEXT)))
+    self.assertEquals([r.name for r in reads],["read1","read2","read3"])
+    self.assertEquals(reads[1].seq,"GGGCC")
+    self.assertEquals(reads[1].quality,"!!+5I")
+    self.assertEquals(list(reads[1].scores),[0,0,10,20,40])
+    self.assertEquals(reads[0].fastq(),"@read1\nACGTNACGTA\n+\nIIIIIIIII#\n")
+
+  def test_batches(self):
+    fn = self.writeFile("a.fq",FASTQTEXT * 5)
+    for size in (1,2,4,15,100):
+      batches = list(FastqFile(fn,chunkSize=7).batches(size))
+      self.assertEquals([len(b) for b in batches[:-1]],[size] * (len(batches) - 1))
+      self.assertEquals(sum(len(b) for b in batches),15)
+      self.assertEquals(batches[-1][-1].name,"read3")
+
+  def test_gzip(self):
+    fn = os.path.join(self.tmpdir,"a.fq.gz")
+    fd = gzip.open(fn,"wb")
+    fd.write(FASTQTEXT * 1000)
+    fd.close()
+    reads = list(FastqFile(fn,chunkSize=1000))
+    self.assertEquals(len(reads),3000)
+    self.assertEquals(reads[-2].quality,"!!+5I")
+
+  def test_badFile(self):
+    fq = FastqFile(self.writeFile("a.fq",FASTQTEXT.replace("+read2","-read2")))
+    self.assertRaises(FileFormatError,list,fq)
+    try:
+      list(fq)
+    except FileFormatError as e:
+      self.assertEquals(e.line,7)
+    self.assertRaises(FileFormatError,list,FastqFile(self.writeFile("b.fq",FASTQTEXT[:-3])))
+
+class TestPileup(IOTestCase):
+
+  def setUp(self):
+    IOTestCase.setUp(self)
+    rng = random.Random(5)
+    self.sizes = {"chr1":3000,"chr2":2500}
+    self.ivs = list()
+    for chrom in sorted(self.sizes):
+      for i in range(0,300):
+        left = rng.randint(0,2400)
+        self.ivs.append(Interval(chrom,left,left+rng.randint(0,100)))
+    self.dense = dict((c,numpy.zeros(n,dtype=int)) for c,n in self.sizes.items())
+    for iv in self.ivs:
+      self.dense[iv.chrom][iv.left:iv.right] += 1
+
+  def checkPileup(self,pile):
+    for chrom,n in self.sizes.items():
+      self.assertTrue((pile.values(chrom,0,n) == self.dense[chrom]).all())
+      self.assertTrue((pile.values(chrom,123,456) == self.dense[chrom][123:456]).all())
+      means = [self.dense[chrom][i:i+100].mean() for i in range(0,n,100)]
+      self.assertTrue(numpy.allclose(pile.binned(chrom,100),means))
+
+  def test_add(self):
+    self.checkPileup(pileup.Pileup(self.sizes).add(self.ivs))
+    self.checkPileup(pileup.Pileup(self.sizes).add(ColumnarIntervalSet.fromIntervals(self.ivs)))
+    shuffled = list(self.ivs)
+    random.Random(6).shuffle(shuffled)
+    flushSize = pileup.flushSize
+    pileup.flushSize = 50
+    try:
+      self.checkPileup(pileup.Pileup(self.sizes).add(shuffled))
+    finally:
+      pileup.flushSize = flushSize
+
+  def test_runs(self):
+    pile = pileup.Pileup().add([Interval("chr1",10,20),Interval("chr1",15,30),Interval("chr1",30,40)])
+    starts,values = pile.runs("chr1")
+    self.assertEquals(list(starts),[10,15,20,40])
+    self.assertEquals(list(values),[1,2,1,0])
+    self.assertEquals(pile.length("chr1"),40)
+    self.assertEquals(pile.chroms,["chr1"])
+
+  def test_bedGraph(self):
+    fn = os.path.join(self.tmpdir,"a.bedGraph")
+    pileup.Pileup().add([Interval("chr2",5,8),Interval("chr1",10,20),Interval("chr1",15,20),
+                         Interval("chr1",30,40)]).writeBedGraph(fn,name="x")
+    self.assertEquals(open(fn).read(),'track type=bedGraph name="x"\n'
+                      "chr1\t10\t15\t1\nchr1\t15\t20\t2\nchr1\t30\t40\t1\nchr2\t5\t8\t1\n")
+
+  def test_save(self):
+    fn = os.path.join(self.tmpdir,"a.bcov")
+    pileup.Pileup(self.sizes).add(self.ivs).save(fn,zoomLevels=(10,100))
+    track = pileup.CoverageTrack(fn)
+    self.assertEquals(track.chroms,["chr1","chr2"])
+    self.assertEquals(track.zoomLevels,(10,100))
+    self.checkPileup(track)
+    means = [self.dense["chr1"][i:i+100].mean() for i in range(0,3000,100)]
+    self.assertTrue(numpy.allclose(track.zoom("chr1",100),means))
+    self.assertTrue(numpy.allclose(track.summary("chr1",0,3000,30),means))
+    self.assertTrue(numpy.allclose(track.summary("chr1",100,105,1),[self.dense["chr1"][100:105].mean()]))
+    self.assertEquals(len(track.values("chr3",0,10)),10)
+    track.close()
+
+CDTTEXT = """GID\tUNIQID\tNAME\ta\tb\tc
+EWEIGHT\t\t\t1\t1\t1
+G1\tu1\tn1\t0\t8\t300
+G2\tu2\tn2\t1.5\t2\t0.5
+"""
+
+class TestCdt(IOTestCase):
+
+  def test_load(self):
+    m = CdtMatrix().load(self.writeFile("a.cdt",CDTTEXT))
+    self.assertEquals(m.shape,(2,3))
+    self.assertEquals(m.values.tolist(),[[0,8,300],[1.5,2,0.5]])
+    self.assertEquals(m.labels,["G1\tu1\tn1","G2\tu2\tn2"])
+    self.assertEquals(m.columns,["a","b","c"])
+    self.assertEquals(m.colours().tolist(),[[0,93,247],[0,31,0]])
+    fn = os.path.join(self.tmpdir,"b.cdt")
+    m.save(fn)
+    m2 = CdtMatrix().load(fn)
+    self.assertEquals(m2.values.tolist(),m.values.tolist())
+    self.assertEquals(m2.labels,m.labels)
+    self.assertEquals(m2.labelNames,["GID","UNIQID","NAME"])
+
+  def test_badFile(self):
+    fn = self.writeFile("a.cdt",CDTTEXT + "G3\tu3\tn3\t1\t2\n")
+    try:
+      CdtMatrix().load(fn)
+      self.fail("expected FileFormatError")
+    except FileFormatError as e:
+      self.assertEquals(e.line,5)
+
+  def test_png(self):
+    fn = os.path.join(self.tmpdir,"a.png")
+    CdtMatrix().load(self.writeFile("a.cdt",CDTTEXT)).writePng(fn,cellSize=2)
+    data = open(fn,"rb").read()
+    self.assertEquals(data[:8],"\x89PNG\r\n\x1a\n")
+    self.assertEquals(struct.unpack(">II",data[16:24]),(6,4))
+    start = data.index("IDAT")
+    size = struct.unpack(">I",data[start-4:start])[0]
+    raw = zlib.decompress(data[start+4:start+4+size])
+    self.assertEquals([ord(raw[i*7]) for i in range(0,4)],[0,2,0,2])
+    self.assertEquals(map(ord,raw[1:7]),[0,0,93,93,247,247])
+    self.assertEquals(map(ord,raw[8:14]),[0] * 6)
+    self.assertEquals(map(ord,raw[15:21]),[0,0,31,31,0,0])
+
+  def test_fromSignal(self):
+    pile = pileup.Pileup().add([Interval("chr1",0,10),Interval("chr1",5,20)])
+    m = CdtMatrix.fromSignal(pile,[Interval("chr1",0,20,name="p1"),
+                                   Interval("chr1",0,20,strand="-"),Interval("chr2",0,20)],4)
+    self.assertEquals(m.values.tolist(),[[1,2,1,1],[1,1,2,1],[0,0,0,0]])
+    self.assertEquals(m.labels[0],"chr1:0-20\tp1\tchr1:0-20")
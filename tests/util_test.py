@@ -0,0 +1,278 @@
+import os
+import re
+import sys
+import time
+import random
+import shutil
+import tempfile
+import unittest
+import StringIO
+import xlrd
+import xlwt
+from xlrd.sheet import Cell
+from tests import TestUtil
+
+# the spreadsheet tools are plain modules, run with bode/util on the path
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),"bode","util"))
+import report
+import xdiff
+import xgrep
+import xindex
+
+################################################################################
+
+class UtilTestCase(TestUtil):
+
+  def setUp(self):
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def writeBook(self,name,sheets):
+    """Write an ``.xls`` workbook with a sheet per list of rows."""
+    book = xlwt.Workbook()
+    for k,rows in enumerate(sheets):
+      sheet = book.add_sheet("Sheet%d" % (k,))
+      for i,row in enumerate(rows):
+        for j,value in enumerate(row):
+          sheet.write(i,j,value)
+    fn = os.path.join(self.tmpdir,name)
+    book.save(fn)
+    return fn
+
+class ListWriter(report.ReportWriter):
+  """A report writer collecting records (or text) in a list."""
+
+  def __init__(self,format="json"):
+    super(ListWriter,self).__init__(format=format)
+    self.records = []
+    self.text = []
+
+  def writeRecord(self,record):
+    self.records.append(record)
+
+  def write(self,text):
+    self.text.append(text)
+
+  def flush(self):
+    pass
+
+class TestReport(UtilTestCase):
+
+  def test_tsvRows(self):
+    fd = StringIO.StringIO()
+    out = report.ReportWriter(fd,bufferSize=10)
+    out.writeRow(["1","a"])
+    out.writeRow([2,u"b"])
+    out.writeRecord({"x":"3","y":"c"})
+    out.close()
+    self.assertEquals(fd.getvalue(),"1\ta\n2\tb\n3\tc\n")
+
+  def test_jsonRows(self):
+    fd = StringIO.StringIO()
+    out = report.ReportWriter(fd,"json",columns=("file","row"))
+    out.writeRow(("a.xls",3))
+    out.writeRecord({"op":"x","b":[1.5]})
+    out.close()
+    self.assertEquals(fd.getvalue(),'{"file": "a.xls", "row": 3}\n{"b": [1.5], "op": "x"}\n')
+    self.assertRaises(ValueError,report.ReportWriter,fd,"xml")
+
+  def test_nonAscii(self):
+    fd = StringIO.StringIO()
+    out = report.ReportWriter(fd)
+    out.write("r\xc3\xa9.xls:\n")
+    out.writeRow([u"0",u"\xe9t\xe9"])
+    out.close()
+    self.assertEquals(fd.getvalue(),"r\xc3\xa9.xls:\n0\t\xc3\xa9t\xc3\xa9\n")
+    fd = StringIO.StringIO()
+    out = report.ReportWriter(fd,"json")
+    out.writeRow([u"\xe9"])
+    out.close()
+    self.assertEquals(fd.getvalue(),'["\\u00e9"]\n')
+
+  def test_cells(self):
+    row = [Cell(xlrd.XL_CELL_TEXT,u"a"),Cell(xlrd.XL_CELL_NUMBER,1.5),
+           Cell(xlrd.XL_CELL_DATE,43000.5),Cell(xlrd.XL_CELL_BOOLEAN,1),
+           Cell(xlrd.XL_CELL_ERROR,7),Cell(xlrd.XL_CELL_EMPTY,"")]
+    self.assertEquals(report.rowTexts(row,0),[u"a","1.500000","2017-9-22@12:0","T","ERROR",""])
+    self.assertEquals(report.cellText(row[2],1),"2021-9-23@12:0")
+
+  def test_dateCache(self):
+    report._dateCache.clear()
+    self.assertEquals(report.formatDate(43000.0,0),"2017-9-22@0:0")
+    self.assertEquals(report._dateCache[(43000.0,0)],"2017-9-22@0:0")
+    size = report._dateCacheSize
+    try:
+      report._dateCacheSize = 2
+      report.formatDate(43001.0,0)
+      report.formatDate(43002.0,0)
+      self.assertEquals(len(report._dateCache),1)
+    finally:
+      report._dateCacheSize = size
+
+class TestXdiff(UtilTestCase):
+
+  rows = [["name","value"],["a",1.0],["b",-1.0],["c",3.0]]
+
+  def streamDiff(self,rowsa,rowsb,format="json"):
+    fna = self.writeBook("a.xls",[rowsa])
+    fnb = self.writeBook("b.xls",[rowsb])
+    out = ListWriter(format)
+    ndiff = xdiff.Xdiff(processes=1,writer=out).streamDiff(fna,fnb)
+    return ndiff,out
+
+  def test_same(self):
+    ndiff,out = self.streamDiff(self.rows,self.rows)
+    self.assertEquals(ndiff,0)
+    self.assertEquals(out.records,[])
+
+  def test_changedValue(self):
+    # hash(-1.0) == hash(-2.0): rows must be compared by value
+    rowsb = [list(r) for r in self.rows]
+    rowsb[2][1] = -2.0
+    ndiff,out = self.streamDiff(self.rows,rowsb)
+    self.assertEquals(ndiff,1)
+    self.assertEquals(out.records[1:],[{"sheet":0,"op":"changed","rowA":2,"rowB":2,"col":1,"a":-1.0,"b":-2.0}])
+
+  def test_insertedDeleted(self):
+    rowsb = self.rows[:1] + [["x",9.0]] + self.rows[1:2] + self.rows[3:]
+    ndiff,out = self.streamDiff(self.rows,rowsb,"tsv")
+    self.assertEquals(ndiff,1)
+    self.assertEquals(out.text,[u"Sheet 0 (Sheet0): 4 rows, 4 rows\n",
+                                u"> 1: x\t9.0\n",u"< 2: b\t-1.0\n"])
+
+  def test_repeatedRows(self):
+    # every fifth row blank: the copies must not be compared with each other
+    n = 120000
+    rowsa = [() if j % 5 == 0 else (u"s%d" % (j,),float(j)) for j in range(0,n)]
+    rowsb = list(rowsa)
+    rowsb.insert(n // 2,(u"new",1.0))
+    rowsb[1001] = (u"s1001",-1.0)
+    start = time.time()
+    records = xdiff.diffRows(0,rowsa,rowsb)
+    self.assertEquals(time.time() - start < 5,True)
+    self.assertEquals(records,[{"sheet":0,"op":"changed","rowA":1001,"rowB":1001,"col":1,"a":1001.0,"b":-1.0},
+                               {"sheet":0,"op":"inserted","rowB":n // 2,"values":(u"new",1.0)}])
+
+  def test_alignRows(self):
+    rng = random.Random(3)
+    for trial in range(0,200):
+      rowsa = [(rng.randint(0,8),) for j in range(0,rng.randint(0,40))]
+      rowsb = [(rng.randint(0,8),) for j in range(0,rng.randint(0,40))]
+      if trial % 2:
+        rowsb = rowsa[:5] + rowsb + rowsa[-5:]
+      rebuilt = []
+      ja = jb = 0
+      for op,a0,a1,b0,b1 in xdiff.alignRows(rowsa,rowsb):
+        self.assertEquals((a0,b0),(ja,jb))
+        if op == "equal":
+          self.assertEquals(rowsa[a0:a1],rowsb[b0:b1])
+        rebuilt.extend(rowsb[b0:b1])
+        ja,jb = a1,b1
+      self.assertEquals((ja,jb),(len(rowsa),len(rowsb)))
+      self.assertEquals(rebuilt,rowsb)
+
+class TestXgrep(UtilTestCase):
+
+  def test_corruptFile(self):
+    bad = os.path.join(self.tmpdir,"bad.xlsx")
+    fd = open(bad,"w")
+    fd.write("PK\x03\x04" + "x" * 100)
+    fd.close()
+    fn = self.writeBook("a.xls",[[["SLX-1"]]])
+    results = list(xgrep.searchFiles([bad,fn],xgrep.Substring("SLX"),processes=1))
+    self.assertEquals([r[0] for r in results],[bad,fn])
+    self.assertEquals(results[0][1],[])
+    self.assertEquals(results[0][2].startswith("Corrupt workbook (BadZipfile"),True)
+    self.assertEquals(results[1][1:],([(0,[u"SLX-1"])],None))
+
+  def search(self,matcher,sheets):
+    fn = self.writeBook("a.xls",sheets)
+    return list(xgrep.searchFiles([fn],matcher,processes=1))[0][1]
+
+  def test_substring(self):
+    sheets = [[["SLX-1","x\ty"],["SLX-2",12.5]],[["other",-1.0]]]
+    self.assertEquals(self.search(xgrep.Substring("SLX"),sheets),
+                      [(0,[u"SLX-1",u"x\ty"]),(1,[u"SLX-2","12.500000"])])
+    self.assertEquals(self.search(xgrep.Substring("12.5"),sheets),[(1,[u"SLX-2","12.500000"])])
+    self.assertEquals(self.search(xgrep.Substring("-1"),sheets),[(0,[u"SLX-1",u"x\ty"]),(0,[u"other","-1.000000"])])
+    self.assertEquals(xgrep.formatMatch(0,[u"SLX-1",u"x"]),u"0\tSLX-1\tx\n")
+
+  def test_nonAsciiTag(self):
+    sheets = [[[u"r\xe9sum\xe9"],["re"]]]
+    self.assertEquals(self.search(xgrep.Substring("\xc3\xa9s"),sheets),[(0,[u"r\xe9sum\xe9"])])
+    self.assertEquals(self.search(xgrep.Regex("\xc3\xa9$"),sheets),[(0,[u"r\xe9sum\xe9"])])
+
+  def test_regex(self):
+    sheets = [[["SLX-1"],["slx-22"],[12.0]]]
+    self.assertEquals(self.search(xgrep.Regex(r"^SLX-\d$"),sheets),[(0,[u"SLX-1"])])
+    self.assertEquals([i for i,t in self.search(xgrep.Regex("slx",re.I),sheets)],[0,1])
+
+  def test_numberRange(self):
+    sheets = [[["a",1.0],["b",5.0],["c",10.0],["7"]]]
+    self.assertEquals([i for i,t in self.search(xgrep.NumberRange(2,10),sheets)],[1,2])
+    self.assertEquals([i for i,t in self.search(xgrep.NumberRange(None,5),sheets)],[0,1])
+    self.assertEquals([i for i,t in self.search(xgrep.NumberRange(6),sheets)],[2])
+
+  def test_fileOrder(self):
+    fns = [self.writeBook("w%d.xls" % (k,),[[["tag%d" % (k,)]] * (k+1)]) for k in range(0,6)]
+    fns.insert(3,os.path.join(self.tmpdir,"missing.xls"))
+    results = list(xgrep.searchFiles(fns,xgrep.Substring("tag"),processes=3))
+    self.assertEquals([r[0] for r in results],fns)
+    self.assertEquals([len(r[1]) for r in results],[1,2,3,0,4,5,6])
+    self.assertEquals([r[2] != None for r in results],[False,False,False,True,False,False,False])
+
+class TestXIndex(UtilTestCase):
+
+  matchers = [xgrep.Substring("SLX"),xgrep.Substring("2.5"),xgrep.Substring("-1"),
+              xgrep.Substring("a"),xgrep.Substring(""),xgrep.Substring(u"\xe9"),
+              xgrep.Substring("r\xc3\xa9"),xgrep.Regex("\xc3\xa9$"),
+              xgrep.Regex("^S"),xgrep.Regex("1"),xgrep.NumberRange(0,10),
+              xgrep.NumberRange(None,-1)]
+
+  def checkParity(self,index,fns):
+    for matcher in self.matchers:
+      self.assertEquals(list(index.search(matcher,fns)),
+                        list(xgrep.searchFiles(fns,matcher,processes=1)))
+
+  def test_parity(self):
+    fns = [self.writeBook("a.xls",[[["SLX-1",2.5],["x",-1.0]],[["nan 12"]]]),
+           self.writeBook("r\xc3\xa9.xls",[[[u"r\xe9",10.0,"a1"]]]),
+           self.writeBook("c.xls",[[["SLX-22"],[],[0.25,"b"]]])]
+    index = xindex.XIndex(os.path.join(self.tmpdir,"a.xidx"))
+    try:
+      self.assertEquals(index.update(fns,processes=1),3)
+      self.checkParity(index,fns)
+      self.assertEquals(index.update(fns,processes=1),0)
+      # re-index a changed file
+      self.writeBook("c.xls",[[["SLX-3",-12.5]]])
+      st = os.stat(fns[2])
+      os.utime(fns[2],(st.st_atime,st.st_mtime + 10))
+      self.assertEquals(index.update(fns,processes=1),1)
+      self.checkParity(index,fns)
+      # drop a deleted file
+      os.remove(fns[0])
+      index.update(fns,processes=1)
+      self.assertEquals([fn for fn,rows,error in index.search(xgrep.Substring("SLX"))],
+                        [os.path.abspath(fn) for fn in sorted(fns[1:])])
+      self.checkParity(index,fns[1:])
+    finally:
+      index.close()
+
+  def test_corruptFile(self):
+    bad = os.path.join(self.tmpdir,"bad.xlsx")
+    fd = open(bad,"w")
+    fd.write("PK\x03\x04" + "x" * 100)
+    fd.close()
+    index = xindex.XIndex(os.path.join(self.tmpdir,"a.xidx"))
+    try:
+      self.assertEquals(index.update([bad],processes=1),1)
+      fn,lines,error = list(index.search(xgrep.Substring("x"),[bad]))[0]
+      self.assertEquals(lines,[])
+      self.assertEquals(error.startswith("Corrupt workbook (BadZipfile"),True)
+    finally:
+      index.close()
+
+if __name__ == "__main__":
+  unittest.main()